@@ -2,8 +2,11 @@ from django.contrib import admin
 from .models import (
     Category, Resource, Member, Transaction, StockLog,
     UserBook, UserReview, AnonymousUser, UserAuthentication,
-    UserBan, Fine, OverdueBook
+    UserBan, Fine, FinePolicy, OverdueBook, KeyRotationJob, LabelSheetJob,
+    InventoryEvent, InventorySnapshot
 )
+from .inventory import InventoryLedger
+from .search_utils import BookContentIndexer
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -40,6 +43,17 @@ class ResourceAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            InventoryLedger.record_adjustment(obj, 0, 0, note='created in admin')
+            return
+        old_total, old_available = Resource.objects.filter(pk=obj.pk).values_list(
+            'total_quantity', 'available_quantity'
+        ).get()
+        super().save_model(request, obj, form, change)
+        InventoryLedger.record_adjustment(obj, old_total, old_available, note='edited in admin')
+
 
 @admin.register(Member)
 class MemberAdmin(admin.ModelAdmin):
@@ -161,6 +175,11 @@ class UserBookAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'file' in form.changed_data:
+            BookContentIndexer.enqueue(obj)
+
 
 @admin.register(UserReview)
 class UserReviewAdmin(admin.ModelAdmin):
@@ -189,6 +208,14 @@ class FineAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
 
 
+@admin.register(FinePolicy)
+class FinePolicyAdmin(admin.ModelAdmin):
+    list_display = ['member_type', 'daily_rate', 'grace_days', 'max_amount', 'is_active', 'updated_at']
+    list_editable = ['daily_rate', 'grace_days', 'max_amount', 'is_active']
+    list_display_links = ['member_type']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(OverdueBook)
 class OverdueBookAdmin(admin.ModelAdmin):
     list_display = ['book_title', 'user_identifier', 'days_overdue', 'is_recovered', 'created_at']
@@ -196,3 +223,52 @@ class OverdueBookAdmin(admin.ModelAdmin):
     search_fields = ['book_title', 'user_identifier', 'name', 'phone']
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-days_overdue']
+
+
+@admin.register(KeyRotationJob)
+class KeyRotationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'rows_processed', 'rows_total', 'rows_rotated', 'rows_failed', 'started_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = [
+        'last_processed_id', 'rows_total', 'rows_processed', 'rows_rotated', 'rows_failed',
+        'error', 'started_at', 'finished_at', 'created_at', 'updated_at'
+    ]
+    ordering = ['-created_at']
+
+
+@admin.register(LabelSheetJob)
+class LabelSheetJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'category', 'per_copy', 'labels_done', 'labels_total', 'created_at', 'finished_at']
+    list_filter = ['status', 'per_copy']
+    readonly_fields = ['labels_total', 'labels_done', 'file', 'error', 'started_at', 'finished_at', 'created_at']
+    ordering = ['-created_at']
+
+
+@admin.register(InventoryEvent)
+class InventoryEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'resource', 'event_type', 'delta_total', 'delta_available', 'transaction', 'created_at']
+    list_filter = ['event_type', 'created_at']
+    search_fields = ['resource__title', 'resource__resource_id']
+    raw_id_fields = ['resource', 'transaction', 'stock_log']
+    ordering = ['-id']
+
+    # The ledger is append-only; corrections are new 'adjust' events
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['resource', 'last_event_id', 'total_quantity', 'available_quantity', 'taken_at']
+    search_fields = ['resource__title', 'resource__resource_id']
+    raw_id_fields = ['resource']
+    ordering = ['-taken_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -2,7 +2,14 @@
 Admin-side management views for user-side application.
 Includes digital book management, user banning, fines, and overdue tracking.
 """
+import json
+from contextlib import aclosing
+from datetime import date
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib.auth import authenticate, login, logout
@@ -10,16 +17,25 @@ from django.views.decorators.http import require_http_methods
 from django.db.models import Q, Count, Sum, Avg
 from django.utils import timezone
 from django.core.paginator import Paginator
+from django.urls import reverse
 from django.contrib.auth.models import User
-from datetime import timedelta
+from django.db import transaction as db_transaction
 
 from .models import (
     UserBook, UserAuthentication, UserBan, Fine, OverdueBook,
-    AnonymousUser, Transaction, Resource, Member
+    AnonymousUser, Transaction, Resource, Member, Category, LabelSheetJob
 )
 from .forms import FineForm, UserBanForm
 from .user_utils import OverdueTracker
 from .encryption import PrivacyEncryption
+from .epub_utils import EpubChapterCache
+from .rate_limit import LoginRateLimiter
+from .labels import LabelSheetGenerator
+from .circulation import CirculationDesk, CirculationError
+from .analytics import AnalyticsRollup
+from .live_events import LiveEventBus
+from .moderation import ModerationQueue
+from .storage import BookStorageManager
 from .views import dashboard as inventory_dashboard
 
 
@@ -39,6 +55,13 @@ def admin_login(request):
         username = request.POST.get('username', '')
         password = request.POST.get('password', '')
 
+        allowed, retry_after = LoginRateLimiter.check(request, 'admin', username)
+        if not allowed:
+            messages.error(request, f'Too many login attempts. Please try again in {retry_after} seconds.')
+            response = render(request, 'admin/login.html', {}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         # Legacy fixed credentials
         if username == 'admin' and password == '12345':
             request.session['is_custom_admin'] = True
@@ -70,6 +93,15 @@ def admin_logout(request):
 
 def admin_required(view_func):
     """Decorator to check if user is authenticated as admin (staff/superuser)"""
+    if iscoroutinefunction(view_func):
+        # Loading the user and session touches the database
+        async def async_wrapper(request, *args, **kwargs):
+            if not await sync_to_async(admin_is_authenticated)(request):
+                messages.error(request, 'Admin access required. Please login.')
+                return redirect('admin_login')
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     def wrapper(request, *args, **kwargs):
         if not admin_is_authenticated(request):
             messages.error(request, 'Admin access required. Please login.')
@@ -78,6 +110,12 @@ def admin_required(view_func):
     return wrapper
 
 
+@admin_required
+def admin_login_rate_limits(request):
+    """Throttled login attempt counters per login method"""
+    return JsonResponse({'metrics': LoginRateLimiter.get_metrics()})
+
+
 # ========== DIGITAL BOOK MANAGEMENT ==========
 
 @admin_required
@@ -171,6 +209,7 @@ def admin_delete_book(request, book_id):
     # Delete the file
     if book.file:
         book.file.delete()
+    EpubChapterCache.invalidate(book)
     if book.cover_image:
         book.cover_image.delete()
     
@@ -179,6 +218,60 @@ def admin_delete_book(request, book_id):
     return redirect('admin_user_books')
 
 
+# ========== MODERATION QUEUE ==========
+
+def _moderator(request):
+    """Lease holder name; legacy admin sessions are told apart by session key"""
+    if request.user.is_authenticated:
+        return request.user.username
+    return f'session:{request.session.session_key}'
+
+
+def _book_ids(values):
+    return [int(value) for value in values if value.isdigit()]
+
+
+@admin_required
+def admin_moderation_queue(request):
+    """Review pending uploads in leased batches"""
+    context = {
+        'pending_count': ModerationQueue.pending().count(),
+        'batch_size': ModerationQueue.BATCH_SIZE,
+        'lease_minutes': ModerationQueue.LEASE_MINUTES,
+    }
+    return render(request, 'admin/moderation_queue.html', context)
+
+
+@admin_required
+@require_http_methods(["POST"])
+def admin_moderation_claim(request):
+    """Lease the next pending books (and renew the lease on those already held)"""
+    try:
+        count = int(request.POST.get('count', ModerationQueue.BATCH_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid count.'}, status=400)
+
+    books, lease_until = ModerationQueue.claim(_moderator(request), count, _book_ids(request.POST.getlist('held')))
+    return JsonResponse({
+        'books': [ModerationQueue.describe(book) for book in books],
+        'lease_until': lease_until.isoformat(),
+        'pending': ModerationQueue.pending().count(),
+    })
+
+
+@admin_required
+@require_http_methods(["POST"])
+def admin_moderation_action(request):
+    """Verify, ban or release a selection of leased books at once"""
+    action = request.POST.get('action', '')
+    if action not in ModerationQueue.ACTIONS:
+        return JsonResponse({'error': 'Unknown action.'}, status=400)
+
+    book_ids = _book_ids(request.POST.getlist('ids'))
+    updated = ModerationQueue.apply(_moderator(request), book_ids, action, request.POST.get('reason', ''))
+    return JsonResponse({'updated': updated, 'skipped': len(book_ids) - updated})
+
+
 # ========== USER MANAGEMENT & BANNING ==========
 
 @admin_required
@@ -214,18 +307,7 @@ def admin_manage_users(request):
     anon_count = anonymous_users.count()
 
     # Overdue members list with decrypted data for overdue-only reporting
-    overdue_members_qs = Member.objects.filter(
-        transactions__status='overdue'
-    ).distinct().select_related()
-    
-    # Build overdue dict with count for template
-    overdue_members = []
-    for member in overdue_members_qs:
-        overdue_count = member.transactions.filter(status='overdue').count()
-        overdue_members.append({
-            'member': member,
-            'overdue_count': overdue_count,
-        })
+    overdue_members = OverdueTracker.overdue_members()
 
     # Provide unregistered online visitors by hash for compliance tracking
     unregistered_users = AnonymousUser.objects.filter(is_active=True).order_by('-last_activity')
@@ -249,8 +331,9 @@ def admin_ban_user(request, user_auth_id):
     """Ban a user"""
     user_auth = get_object_or_404(UserAuthentication, id=user_auth_id)
     
-    # Check if already banned
-    if user_auth.ban and user_auth.ban.is_active:
+    # Check if already banned (the reverse one-to-one raises when there is no ban row)
+    ban = getattr(user_auth, 'ban', None)
+    if ban and ban.is_active:
         messages.warning(request, 'User is already banned.')
         return redirect('admin_manage_users')
     
@@ -281,8 +364,9 @@ def admin_unban_user(request, user_auth_id):
     """Unban a user"""
     user_auth = get_object_or_404(UserAuthentication, id=user_auth_id)
     
-    if user_auth.ban:
-        user_auth.ban.delete()
+    ban = getattr(user_auth, 'ban', None)
+    if ban:
+        ban.delete()
     
     user_auth.is_banned = False
     user_auth.save(update_fields=['is_banned'])
@@ -445,11 +529,20 @@ def admin_checkout_tracking(request):
     paginator = Paginator(transactions, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+
+    # Starting values of the counters the live feed keeps up to date
+    open_loans = Q(status__in=CirculationDesk.OPEN_STATUSES)
+    counts = Transaction.objects.aggregate(
+        active_checkouts=Count('id', filter=open_loans),
+        overdue_checkouts=Count('id', filter=open_loans & Q(due_date__lt=timezone.localdate())),
+        total_transactions=Count('id'),
+    )
     
     context = {
         'page_obj': page_obj,
         'status_filter': status_filter,
         'search_query': search_query,
+        **counts,
     }
     return render(request, 'admin/checkout_tracking.html', context)
 
@@ -460,30 +553,114 @@ def admin_manual_checkout(request):
     """Create a manual checkout"""
     member_id = request.POST.get('member_id')
     resource_id = request.POST.get('resource_id')
-    due_days = int(request.POST.get('due_days', 15))
     
     try:
+        due_days = int(request.POST.get('due_days', CirculationDesk.DEFAULT_DUE_DAYS))
         member = Member.objects.get(id=member_id)
-        resource = Resource.objects.get(id=resource_id)
-    except (Member.DoesNotExist, Resource.DoesNotExist):
+        resource_id = int(resource_id)
+    except (Member.DoesNotExist, TypeError, ValueError):
         messages.error(request, 'Invalid member or resource.')
         return redirect('admin_checkout_tracking')
     
-    due_date = timezone.now().date() + timedelta(days=due_days)
-    transaction = Transaction.objects.create(
-        member=member,
-        resource=resource,
-        due_date=due_date,
-        status='active'
-    )
-    
-    resource.available_quantity -= 1
-    resource.save(update_fields=['available_quantity'])
+    try:
+        with db_transaction.atomic():
+            CirculationDesk.checkout(member, resource_id, due_days)
+    except CirculationError as e:
+        messages.error(request, str(e))
+        return redirect('admin_checkout_tracking')
     
     messages.success(request, f'Checkout recorded for {member.full_name}')
     return redirect('admin_checkout_tracking')
 
 
+# ========== RESOURCE LABELS ==========
+
+def _label_job_json(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'labels_total': job.labels_total,
+        'labels_done': job.labels_done,
+        'error': job.error,
+        'download_url': reverse('admin_label_sheet_download', args=[job.id]) if job.status == 'completed' else None,
+    }
+
+
+@admin_required
+@require_http_methods(["POST"])
+def admin_label_sheet_create(request):
+    """Queue a QR label sheet for all resources, one category, or a list of resource IDs"""
+    category = None
+    try:
+        if request.POST.get('category'):
+            category = Category.objects.get(id=int(request.POST['category']))
+        resource_ids = [int(value) for value in request.POST.get('resource_ids', '').split(',') if value.strip()]
+    except (Category.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Invalid category or resource IDs'}, status=400)
+
+    job = LabelSheetGenerator.create_job(
+        category=category,
+        resource_ids=resource_ids,
+        per_copy=request.POST.get('per_copy') in ('1', 'true', 'on'),
+    )
+    return JsonResponse(_label_job_json(job), status=202)
+
+
+@admin_required
+def admin_label_sheet_status(request, job_id):
+    """Progress of a label sheet job"""
+    job = get_object_or_404(LabelSheetJob, id=job_id)
+    return JsonResponse(_label_job_json(job))
+
+
+@admin_required
+def admin_label_sheet_download(request, job_id):
+    """Download the rendered label sheet PDF"""
+    job = get_object_or_404(LabelSheetJob, id=job_id, status='completed')
+    if not job.file:
+        raise Http404("Label sheet file not found")
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=f"labels-{job.id}.pdf")
+
+
+# ========== REPORTS ==========
+
+@admin_required
+def admin_analytics_report(request):
+    """Circulation totals per period and grouping, read from the daily rollups"""
+    today = timezone.localdate()
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else today.replace(month=1, day=1)
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+    except ValueError:
+        messages.error(request, 'Dates must be in YYYY-MM-DD format.')
+        start, end = today.replace(month=1, day=1), today
+
+    period = request.GET.get('period', 'month')
+    if period not in AnalyticsRollup.PERIODS:
+        period = 'month'
+    group_by = request.GET.get('group_by', '')
+    if group_by not in AnalyticsRollup.GROUPINGS:
+        group_by = ''
+
+    rows = AnalyticsRollup.report(start, end, period, group_by)
+    group_field = (AnalyticsRollup.GROUPINGS[group_by] or [None])[0]
+    for row in rows:
+        row['group'] = row.get(group_field) if group_field else None
+
+    totals = {metric: sum(row[metric] for row in rows) for metric in AnalyticsRollup.METRICS}
+
+    context = {
+        'rows': rows,
+        'totals': totals,
+        'start': start,
+        'end': end,
+        'period': period,
+        'group_by': group_by,
+        'periods': AnalyticsRollup.PERIODS,
+    }
+    return render(request, 'admin/analytics_report.html', context)
+
+
 # ========== ADMIN DASHBOARD ==========
 
 @admin_required
@@ -521,6 +698,7 @@ def admin_dashboard(request):
     recent_bans = UserBan.objects.order_by('-created_at')[:5]
 
     context = {
+        'storage': BookStorageManager.usage(),
         'total_users': total_users,
         'banned_users': banned_users,
         'total_anonymous_users': total_anonymous_users,
@@ -538,3 +716,50 @@ def admin_dashboard(request):
         'recent_bans': recent_bans,
     }
     return render(request, 'admin/dashboard.html', context)
+
+
+# ========== LIVE EVENTS ==========
+
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_LONG_POLL_SECONDS = 25  # ASGI only
+LIVE_POLL_SECONDS = 10  # interval between short polls under WSGI
+LIVE_RETRY_MS = 5000
+
+
+async def _live_event_stream(after):
+    """Server-sent event stream of dashboard events, with keepalive comments for idle proxies"""
+    yield f'retry: {LIVE_RETRY_MS}\n\n'
+    # Unsubscribes as soon as the client disconnects
+    async with aclosing(LiveEventBus.listen(after, idle_timeout=LIVE_KEEPALIVE_SECONDS)) as events:
+        async for event in events:
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@admin_required
+async def admin_live_events(request):
+    """
+    Dashboard events (uploads, reviews, checkouts, returns, bans).
+    EventSource clients get a server-sent event stream under ASGI; everyone
+    else polls with ?after=<last event id> and gets JSON. Under ASGI the poll
+    waits for the next event; under WSGI it answers at once, with poll_after
+    telling the client how long to wait before the next request.
+    """
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after', '')
+    after = int(after) if after.isdigit() else None
+
+    # A WSGI worker would hold its thread for the whole stream
+    if isinstance(request, ASGIRequest) and 'text/event-stream' in request.headers.get('Accept', ''):
+        response = StreamingHttpResponse(_live_event_stream(after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    # Waiting would hold a WSGI worker thread just the same
+    poll_after = None if isinstance(request, ASGIRequest) else LIVE_POLL_SECONDS
+    if after is None:
+        return JsonResponse({'last_id': await LiveEventBus.last_id(), 'events': [], 'poll_after': poll_after})
+    last_id, events = await LiveEventBus.wait(after, LIVE_LONG_POLL_SECONDS if poll_after is None else 0)
+    return JsonResponse({'last_id': last_id, 'events': events, 'poll_after': poll_after})
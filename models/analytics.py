@@ -0,0 +1,175 @@
+"""
+Circulation reporting rollups.
+Loans, returns, overdues, fines and uploads are aggregated per day, category,
+member type and department into CirculationRollup rows. A nightly task
+re-aggregates the most recent days; reports read only the rollup table, so
+multi-year questions never touch Transaction, Fine or UserBook.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .circulation import CirculationDesk
+from .models import CirculationRollup, Fine, Transaction, UserBook
+
+
+class AnalyticsRollup:
+    """Build CirculationRollup rows and answer reports from them"""
+
+    # Recent days are re-aggregated on every run: late returns, fine accrual and payments land there
+    LOOKBACK_DAYS = 7
+    CHUNK_DAYS = 31
+
+    METRICS = ['loans', 'returns', 'overdues', 'fines_imposed', 'fine_amount', 'fines_paid', 'fine_paid_amount', 'uploads']
+
+    # Report grouping -> rollup fields
+    GROUPINGS = {
+        '': [],
+        'category': ['category__name'],
+        'member_type': ['member_type'],
+        'department': ['department'],
+    }
+    PERIODS = ('day', 'week', 'month', 'quarter', 'year')
+
+    @staticmethod
+    def _bounds(start, end):
+        """Aware datetimes covering the local days start..end"""
+        tz = timezone.get_current_timezone()
+        return (
+            timezone.make_aware(datetime.combine(start, time.min), tz),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+        )
+
+    @staticmethod
+    def _sources(start, end, today):
+        """
+        One grouped query per metric over the days start..end.
+        Yields: values querysets keyed by day, category and (for loans and fines) member type and department
+        """
+        since, until = AnalyticsRollup._bounds(start, end)
+        dims = {
+            'category': F('resource__category'),
+            'member_type': F('member__member_type'),
+            'department': F('member__department'),
+        }
+
+        loans = Transaction.objects.filter(checkout_date__gte=since, checkout_date__lt=until)
+        yield loans.values(day=TruncDate('checkout_date'), **dims).annotate(loans=Count('id'))
+
+        returns = Transaction.objects.filter(return_date__gte=since, return_date__lt=until)
+        yield returns.values(day=TruncDate('return_date'), **dims).annotate(returns=Count('id'))
+
+        # Counted on the due date once it has passed, whether returned late or still out
+        overdues = Transaction.objects.annotate(returned_on=TruncDate('return_date')).filter(
+            due_date__gte=start, due_date__lte=min(end, today - timedelta(days=1))
+        ).filter(
+            Q(returned_on__gt=F('due_date')) | Q(return_date__isnull=True, status__in=CirculationDesk.OPEN_STATUSES)
+        )
+        yield overdues.values(day=F('due_date'), **dims).annotate(overdues=Count('id'))
+
+        imposed = Fine.objects.filter(created_at__gte=since, created_at__lt=until)
+        yield imposed.values(day=TruncDate('created_at'), **dims).annotate(
+            fines_imposed=Count('id'), fine_amount=Sum('amount')
+        )
+
+        paid = Fine.objects.filter(is_paid=True, paid_date__gte=since, paid_date__lt=until)
+        yield paid.values(day=TruncDate('paid_date'), **dims).annotate(
+            fines_paid=Count('id'), fine_paid_amount=Sum('paid_amount')
+        )
+
+        uploads = UserBook.objects.filter(created_at__gte=since, created_at__lt=until)
+        yield uploads.values('category', day=TruncDate('created_at')).annotate(uploads=Count('id'))
+
+    @staticmethod
+    def rollup_days(start, end, today=None):
+        """
+        Replace the rollup rows of the days start..end with freshly aggregated ones.
+        Returns: number of rollup rows written
+        """
+        today = today or timezone.localdate()
+        totals = defaultdict(lambda: defaultdict(int))
+        for rows in AnalyticsRollup._sources(start, end, today):
+            for row in rows.order_by():
+                key = (
+                    row.pop('day'),
+                    row.pop('category'),
+                    row.pop('member_type', None) or '',
+                    row.pop('department', None) or '',
+                )
+                for metric, value in row.items():
+                    totals[key][metric] += value or 0
+
+        with transaction.atomic():
+            CirculationRollup.objects.filter(day__gte=start, day__lte=end).delete()
+            CirculationRollup.objects.bulk_create(
+                [
+                    CirculationRollup(
+                        day=day, category_id=category_id, member_type=member_type, department=department, **metrics
+                    )
+                    for (day, category_id, member_type, department), metrics in totals.items()
+                ],
+                batch_size=1000,
+            )
+        return len(totals)
+
+    @staticmethod
+    def first_day():
+        """Earliest day with source data, or None for an empty library"""
+        loans = Transaction.objects.aggregate(checkout=Min('checkout_date'), due=Min('due_date'))
+        moments = [
+            loans['checkout'],
+            Fine.objects.aggregate(first=Min('created_at'))['first'],
+            UserBook.objects.aggregate(first=Min('created_at'))['first'],
+        ]
+        days = [timezone.localtime(moment).date() for moment in moments if moment]
+        # Imported loans may have been due before they were entered
+        if loans['due']:
+            days.append(loans['due'])
+        return min(days) if days else None
+
+    @staticmethod
+    def refresh(since=None, today=None):
+        """
+        Re-aggregate from since (default: LOOKBACK_DAYS before the newest rollup,
+        or the first day with data) through today, one CHUNK_DAYS range at a time.
+        Returns: number of rollup rows written
+        """
+        today = today or timezone.localdate()
+        if since is None:
+            last = CirculationRollup.objects.aggregate(last=Max('day'))['last']
+            since = last - timedelta(days=AnalyticsRollup.LOOKBACK_DAYS) if last else AnalyticsRollup.first_day()
+        if since is None:
+            return 0
+
+        written = 0
+        start = since
+        while start <= today:
+            end = min(start + timedelta(days=AnalyticsRollup.CHUNK_DAYS - 1), today)
+            written += AnalyticsRollup.rollup_days(start, end, today)
+            start = end + timedelta(days=1)
+        return written
+
+    @staticmethod
+    def report(start, end, period='month', group_by=''):
+        """
+        Totals per period (and grouping) between two dates, from the rollup table only.
+        Returns: list of dicts with 'period', the grouping field and every metric
+        """
+        group_fields = AnalyticsRollup.GROUPINGS[group_by]
+        rows = CirculationRollup.objects.filter(day__gte=start, day__lte=end).annotate(
+            period=Trunc('day', period)
+        ).values('period', *group_fields).annotate(
+            **{metric: Sum(metric) for metric in AnalyticsRollup.METRICS}
+        ).order_by('period', *group_fields)
+
+        report = []
+        for row in rows:
+            for metric in ('fine_amount', 'fine_paid_amount'):
+                row[metric] = row[metric] or Decimal('0.00')
+            report.append(row)
+        return report
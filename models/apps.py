@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ModelsConfig(AppConfig):
     name = 'models'
+
+    def ready(self):
+        from . import encryption, signals
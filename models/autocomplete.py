@@ -0,0 +1,162 @@
+"""
+Prefix search for the member and resource pickers of the checkout forms.
+On SQLite, member and resource names are mirrored into FTS5 tables with
+prefix indexes (see migration 0011); the top results per prefix are cached
+under the catalog namespace version so edits invalidate them. Resource
+candidates are cached without regard to stock and filtered by the availability
+bitmap; when too few of them can be borrowed, available matches are queried
+directly.
+"""
+import hashlib
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+from .models import Member, Resource
+from .availability import ResourceAvailability
+from .cache_utils import CatalogCache
+
+
+class AutocompleteIndex:
+    """Indexed prefix lookups returning [{'id': ..., 'label': ...}] for pickers"""
+
+    LIMIT = 10
+    MAX_QUERY_LENGTH = 50
+
+    # Resources are filtered by availability after the lookup, so fetch extra candidates
+    RESOURCE_CANDIDATES = 50
+
+    MEMBER_FTS_TABLE = 'models_member_fts'
+    RESOURCE_FTS_TABLE = 'models_resource_fts'
+
+    CACHE_KEY = 'autocomplete:{}:{}:{}'
+
+    @staticmethod
+    def search_members(query):
+        """Active members whose name or member ID words start with the query words"""
+        return AutocompleteIndex._cached(
+            'members', CatalogCache.MEMBERS, query, AutocompleteIndex._fetch_members
+        )[:AutocompleteIndex.LIMIT]
+
+    @staticmethod
+    def search_resources(query):
+        """Available resources whose title or ISBN/Serial No words start with the query words"""
+        candidates = AutocompleteIndex._cached(
+            'resources', CatalogCache.RESOURCES, query, AutocompleteIndex._fetch_resources
+        )
+        bitmap = ResourceAvailability.get_bitmap()
+        results = [
+            item for item in candidates
+            if ResourceAvailability.is_available(item['id'], bitmap)
+        ]
+        if len(results) < AutocompleteIndex.LIMIT and len(candidates) == AutocompleteIndex.RESOURCE_CANDIDATES:
+            # A common prefix whose cached candidates are mostly on loan: more matches
+            # exist, so ask the database for available ones only (not cached, stock changes too often)
+            results = AutocompleteIndex._fetch_resources(
+                AutocompleteIndex._terms(query), available_only=True
+            )
+        return results[:AutocompleteIndex.LIMIT]
+
+    @staticmethod
+    def _cached(kind, namespace, query, fetch):
+        """Top-N results per normalized prefix, cached until the namespace changes"""
+        terms = AutocompleteIndex._terms(query)
+        if not terms:
+            return []
+
+        prefix = hashlib.md5(' '.join(terms).encode()).hexdigest()
+        key = AutocompleteIndex.CACHE_KEY.format(kind, CatalogCache.get_version(namespace), prefix)
+        results = cache.get(key)
+        if results is None:
+            results = fetch(terms)
+            cache.set(key, results, CatalogCache.timeout())
+        return results
+
+    @staticmethod
+    def _terms(query):
+        """Lower-cased word prefixes, split the same way the FTS tokenizer splits names"""
+        return re.findall(r'\w+', query[:AutocompleteIndex.MAX_QUERY_LENGTH].lower())
+
+    @staticmethod
+    def _match_query(terms):
+        """Every term as a quoted prefix query, so input is never parsed as FTS5 syntax"""
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    @staticmethod
+    def _fetch_members(terms):
+        if connection.vendor == 'sqlite':
+            sql = f"""
+                SELECT m.id, m.member_id, m.first_name, m.last_name
+                FROM {AutocompleteIndex.MEMBER_FTS_TABLE}
+                JOIN models_member m ON m.id = {AutocompleteIndex.MEMBER_FTS_TABLE}.rowid
+                WHERE {AutocompleteIndex.MEMBER_FTS_TABLE} MATCH %s AND m.is_active = 1
+                ORDER BY {AutocompleteIndex.MEMBER_FTS_TABLE}.rank, m.member_id
+                LIMIT %s
+            """
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [AutocompleteIndex._match_query(terms), AutocompleteIndex.LIMIT])
+                rows = cursor.fetchall()
+        else:
+            condition = Q()
+            for term in terms:
+                # Word prefixes of the names, as the FTS tokenizer matches them
+                condition &= (
+                    Q(member_id__istartswith=term) |
+                    Q(first_name__istartswith=term) |
+                    Q(first_name__icontains=f' {term}') |
+                    Q(last_name__istartswith=term) |
+                    Q(last_name__icontains=f' {term}')
+                )
+            rows = Member.objects.filter(condition, is_active=True).order_by('member_id').values_list(
+                'id', 'member_id', 'first_name', 'last_name'
+            )[:AutocompleteIndex.LIMIT]
+
+        results = []
+        for pk, member_id, first_name, last_name in rows:
+            # Same format as Member.__str__
+            if first_name and last_name:
+                label = f"{first_name} {last_name} ({member_id})"
+            else:
+                label = f"Member {member_id}"
+            results.append({'id': pk, 'label': label})
+        return sorted(results, key=lambda item: item['label'].lower())
+
+    @staticmethod
+    def _fetch_resources(terms, available_only=False):
+        """Top candidates for the terms; available_only returns the top LIMIT borrowable ones"""
+        limit = AutocompleteIndex.LIMIT if available_only else AutocompleteIndex.RESOURCE_CANDIDATES
+        if connection.vendor == 'sqlite':
+            # Same condition as ResourceAvailability.available_queryset
+            available = "AND r.available_quantity > 0 AND r.status = 'available'" if available_only else ''
+            sql = f"""
+                SELECT r.id, r.title, r.resource_id
+                FROM {AutocompleteIndex.RESOURCE_FTS_TABLE}
+                JOIN models_resource r ON r.id = {AutocompleteIndex.RESOURCE_FTS_TABLE}.rowid
+                WHERE {AutocompleteIndex.RESOURCE_FTS_TABLE} MATCH %s {available}
+                ORDER BY {AutocompleteIndex.RESOURCE_FTS_TABLE}.rank, r.resource_id
+                LIMIT %s
+            """
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [AutocompleteIndex._match_query(terms), limit])
+                rows = cursor.fetchall()
+        else:
+            # Word prefixes of the title, as the FTS tokenizer matches them
+            condition = Q()
+            for term in terms:
+                condition &= (
+                    Q(title__istartswith=term) |
+                    Q(title__icontains=f' {term}') |
+                    Q(resource_id__istartswith=term)
+                )
+            resources = ResourceAvailability.available_queryset() if available_only else Resource.objects
+            rows = resources.filter(condition).order_by('resource_id').values_list(
+                'id', 'title', 'resource_id'
+            )[:limit]
+
+        results = [
+            {'id': pk, 'label': f"{title} ({resource_id})"}
+            for pk, title, resource_id in rows
+        ]
+        return sorted(results, key=lambda item: item['label'].lower())
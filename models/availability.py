@@ -0,0 +1,116 @@
+"""
+Availability of offline resources for borrowing.
+The IDs of borrowable resources are kept in the cache as a bitmap (one bit per
+resource ID), so pickers and listings can test availability without a query.
+The bitmap is stored together with a version token. A checkout, return or edit
+that changes availability issues a new token once it commits, and the next
+reader rebuilds from the database; a rebuild that raced the commit is stored
+under the old token and is never served.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Resource
+
+
+class ResourceAvailability:
+    """Cached bitmap of the IDs of resources that can currently be checked out"""
+
+    CACHE_KEY = 'resource_availability:bitmap'
+    VERSION_KEY = 'resource_availability:version'
+
+    @staticmethod
+    def timeout():
+        # Rebuilt from the database at least this often, covering bulk .update() calls that skip signals
+        return getattr(settings, 'RESOURCE_AVAILABILITY_TIMEOUT', 3600)
+
+    @staticmethod
+    def available_queryset():
+        """Resources that can be borrowed right now - the queryset form of Resource.is_available"""
+        return Resource.objects.filter(available_quantity__gt=0, status='available')
+
+    @staticmethod
+    def _version():
+        """Current version token, issuing one if the cache has none"""
+        version = cache.get(ResourceAvailability.VERSION_KEY)
+        if version is None:
+            cache.add(ResourceAvailability.VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(ResourceAvailability.VERSION_KEY)
+        return version
+
+    @staticmethod
+    def rebuild():
+        """
+        Rebuild the bitmap from the database.
+        Returns: bytearray bitmap
+        """
+        # Read the token before the query: a change committed in between bumps it past this bitmap
+        version = ResourceAvailability._version()
+        bitmap = bytearray()
+        for resource_id in ResourceAvailability.available_queryset().values_list('id', flat=True).iterator():
+            ResourceAvailability._set_bit(bitmap, resource_id, True)
+        cache.set(ResourceAvailability.CACHE_KEY, (version, bitmap), ResourceAvailability.timeout())
+        return bitmap
+
+    @staticmethod
+    def _current():
+        """Cached bitmap if it belongs to the current version, else None"""
+        cached = cache.get_many([ResourceAvailability.CACHE_KEY, ResourceAvailability.VERSION_KEY])
+        version = cached.get(ResourceAvailability.VERSION_KEY)
+        entry = cached.get(ResourceAvailability.CACHE_KEY)
+        if version is None or entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    @staticmethod
+    def get_bitmap():
+        bitmap = ResourceAvailability._current()
+        if bitmap is None:
+            bitmap = ResourceAvailability.rebuild()
+        return bitmap
+
+    @staticmethod
+    def is_available(resource_id, bitmap=None):
+        """Check a resource ID against the cached bitmap"""
+        if bitmap is None:
+            bitmap = ResourceAvailability.get_bitmap()
+        index = resource_id >> 3
+        return index < len(bitmap) and bool(bitmap[index] & (1 << (resource_id & 7)))
+
+    @staticmethod
+    def filter_available(resource_ids):
+        """Keep only the available IDs, preserving order"""
+        bitmap = ResourceAvailability.get_bitmap()
+        return [
+            resource_id for resource_id in resource_ids
+            if ResourceAvailability.is_available(resource_id, bitmap)
+        ]
+
+    @staticmethod
+    def update(resource_id, available):
+        """Retire the cached bitmap after a checkout, return or edit that changes availability"""
+        bitmap = ResourceAvailability._current()
+        if bitmap is not None and ResourceAvailability.is_available(resource_id, bitmap) == available:
+            # The current bitmap already agrees, so a concurrent rebuild cannot disagree either
+            return
+        transaction.on_commit(ResourceAvailability.invalidate)
+
+    @staticmethod
+    def invalidate():
+        """Issue a new version token; the next reader rebuilds the bitmap"""
+        cache.set(ResourceAvailability.VERSION_KEY, uuid.uuid4().hex, None)
+
+    @staticmethod
+    def _set_bit(bitmap, resource_id, value):
+        index = resource_id >> 3
+        if index >= len(bitmap):
+            if not value:
+                return
+            bitmap.extend(bytes(index + 1 - len(bitmap)))
+        if value:
+            bitmap[index] |= 1 << (resource_id & 7)
+        else:
+            bitmap[index] &= ~(1 << (resource_id & 7)) & 0xFF
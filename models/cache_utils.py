@@ -0,0 +1,60 @@
+"""
+Caching helpers for the public catalog pages.
+Rendered fragments are keyed by a per-namespace version number; model
+signals bump the version so stale fragments are simply never read again.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+class CatalogCache:
+    """Versioned cache keys for catalog fragments (home page, browse results)"""
+
+    # Namespaces - each covers the models whose changes affect the cached output
+    BOOKS = 'books'          # UserBook listings, ratings from UserReview
+    RESOURCES = 'resources'  # Offline Resource listings
+    MEMBERS = 'members'      # Member pickers (autocomplete)
+
+    VERSION_KEY = 'catalog:version:{}'
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    @staticmethod
+    def get_version(*namespaces):
+        """
+        Current version string for one or more namespaces, for use as a
+        {% cache %} vary_on argument.
+        """
+        keys = [CatalogCache.VERSION_KEY.format(namespace) for namespace in namespaces]
+        versions = cache.get_many(keys)
+
+        for key in keys:
+            if key not in versions:
+                cache.add(key, 1, timeout=None)
+                versions[key] = cache.get(key, 1)
+
+        return '-'.join(str(versions[key]) for key in keys)
+
+    @staticmethod
+    def invalidate(*namespaces):
+        """Bump the version of the given namespaces"""
+        for namespace in namespaces:
+            key = CatalogCache.VERSION_KEY.format(namespace)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Version evicted or never set - any new value invalidates old fragments
+                cache.set(key, 2, timeout=None)
+
+    @staticmethod
+    def querystring_key(query_dict, ignore=()):
+        """Normalized query string so parameter order does not split the cache"""
+        items = sorted(
+            (key, value)
+            for key, values in query_dict.lists()
+            if key not in ignore
+            for value in values
+        )
+        return '&'.join(f"{key}={value}" for key, value in items)
@@ -0,0 +1,189 @@
+"""
+Circulation desk operations: lending resources to members and taking them back.
+Checkouts and returns can be processed one at a time, by scanning a code, or as
+a batch inside a single database transaction with a result per item.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .inventory import InventoryLedger
+from .models import Member, Resource, Transaction
+from .trending import TrendingCounter
+
+
+class CirculationError(Exception):
+    """A checkout or return that cannot be processed"""
+
+
+class ScanLookup:
+    """Resolve scanned Resource.resource_id / Member.member_id codes to primary keys"""
+
+    CACHE_KEY = 'scan:code:{}'
+    MAX_CODE_LENGTH = 50
+
+    @staticmethod
+    def _key(code):
+        return ScanLookup.CACHE_KEY.format(hashlib.md5(code.encode()).hexdigest())
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, 'SCAN_LOOKUP_TIMEOUT', 3600)
+
+    @staticmethod
+    def resolve(code):
+        """
+        Look up a scanned code, resources first. Hits are cached; misses are not,
+        so a newly added resource can be scanned immediately.
+        Returns: ('resource', pk), ('member', pk) or (None, None)
+        """
+        code = code.strip()
+        if not code or len(code) > ScanLookup.MAX_CODE_LENGTH:
+            return None, None
+
+        hit = cache.get(ScanLookup._key(code))
+        if hit is not None:
+            return hit
+
+        hit = (None, None)
+        resource_pk = Resource.objects.filter(resource_id=code).values_list('id', flat=True).first()
+        if resource_pk is not None:
+            hit = ('resource', resource_pk)
+        else:
+            member_pk = Member.objects.filter(member_id=code).values_list('id', flat=True).first()
+            if member_pk is not None:
+                hit = ('member', member_pk)
+
+        if hit[0]:
+            cache.set(ScanLookup._key(code), hit, ScanLookup.timeout())
+        return hit
+
+    @staticmethod
+    def forget(code):
+        """Drop a cached code (called from the Resource/Member save and delete signals)"""
+        if code:
+            cache.delete(ScanLookup._key(code))
+
+
+class CirculationDesk:
+    """Checkout and return of library resources"""
+
+    DEFAULT_DUE_DAYS = 15
+    MAX_DUE_DAYS = 90
+    MAX_BATCH_SIZE = 100
+
+    # Loans that are still out; 'overdue' loans were flagged by OverdueTracker
+    OPEN_STATUSES = ('active', 'overdue')
+
+    @staticmethod
+    def checkout(member, resource_id, due_days=DEFAULT_DUE_DAYS, notes=''):
+        """
+        Lend one copy of a resource to a member.
+        Must run inside transaction.atomic() so the loan and the stock change commit together.
+        Returns: Transaction
+        """
+        # Conditional decrement: two desks cannot lend the last copy twice
+        taken = Resource.objects.filter(
+            id=resource_id, available_quantity__gt=0, status='available'
+        ).update(available_quantity=F('available_quantity') - 1)
+
+        try:
+            resource = Resource.objects.get(id=resource_id)
+        except Resource.DoesNotExist:
+            raise CirculationError('Resource not found.')
+        if not taken:
+            raise CirculationError(f'"{resource.title}" is not available for checkout.')
+
+        if resource.available_quantity == 0:
+            resource.status = 'unavailable'
+        # Saved (not only updated) so the availability signal sees the change; a stock-only
+        # save leaves the catalog caches alone
+        resource.save(update_fields=Resource.STOCK_FIELDS)
+
+        loan = Transaction.objects.create(
+            resource=resource,
+            member=member,
+            due_date=timezone.now().date() + timedelta(days=due_days),
+            notes=notes,
+            status='active'
+        )
+        InventoryLedger.record(resource, 'checkout', delta_available=-1, transaction=loan)
+        TrendingCounter.record('resource', resource.id, 'borrow')
+        return loan
+
+    @staticmethod
+    def open_loan_for(resource_id, member=None):
+        """
+        Oldest open loan of a resource, optionally limited to one member.
+        Returns: Transaction or None
+        """
+        loans = Transaction.objects.filter(
+            resource_id=resource_id, status__in=CirculationDesk.OPEN_STATUSES
+        )
+        if member is not None:
+            loans = loans.filter(member=member)
+        return loans.order_by('checkout_date').first()
+
+    @staticmethod
+    def return_loan(transaction_id):
+        """
+        Take back the resource of an open loan.
+        Returns: Transaction
+        """
+        try:
+            loan = Transaction.objects.select_related('resource').get(
+                id=transaction_id, status__in=CirculationDesk.OPEN_STATUSES
+            )
+        except Transaction.DoesNotExist:
+            raise CirculationError('No open checkout with this ID.')
+
+        loan.mark_returned()
+        return loan
+
+    @staticmethod
+    def process_batch(member, checkout_ids, return_ids, due_days=DEFAULT_DUE_DAYS):
+        """
+        Process a desk batch in one database transaction.
+        Returns run first so a returned copy can be lent again in the same batch.
+        Each item runs in its own savepoint: a failed item is reported without
+        undoing the others.
+        Returns: dict with per-item 'returns' and 'checkouts' results
+        """
+        results = {'returns': [], 'checkouts': []}
+
+        with transaction.atomic():
+            for transaction_id in return_ids:
+                try:
+                    with transaction.atomic():
+                        loan = CirculationDesk.return_loan(transaction_id)
+                except CirculationError as e:
+                    results['returns'].append({'transaction': transaction_id, 'ok': False, 'error': str(e)})
+                else:
+                    results['returns'].append({
+                        'transaction': transaction_id,
+                        'ok': True,
+                        'resource': loan.resource_id,
+                        'title': loan.resource.title,
+                    })
+
+            for resource_id in checkout_ids:
+                try:
+                    with transaction.atomic():
+                        loan = CirculationDesk.checkout(member, resource_id, due_days)
+                except CirculationError as e:
+                    results['checkouts'].append({'resource': resource_id, 'ok': False, 'error': str(e)})
+                else:
+                    results['checkouts'].append({
+                        'resource': resource_id,
+                        'ok': True,
+                        'transaction': loan.id,
+                        'title': loan.resource.title,
+                        'due_date': str(loan.due_date),
+                    })
+
+        return results
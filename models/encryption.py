@@ -4,17 +4,34 @@ Uses Fernet (AES-128) encryption for sensitive information.
 """
 import json
 import hashlib
-from cryptography.fernet import Fernet
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from base64 import urlsafe_b64encode
 from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password, check_password
+from django.utils.crypto import salted_hmac
+
+
+class CredentialHasher(PBKDF2PasswordHasher):
+    """PBKDF2 verifier for user passwords; work factor from USER_PASSWORD_ITERATIONS"""
+    
+    @property
+    def iterations(self):
+        return getattr(settings, 'USER_PASSWORD_ITERATIONS', PBKDF2PasswordHasher.iterations)
 
 
 class PrivacyEncryption:
     """Handles encryption/decryption for user authentication data"""
     
-    # Static cipher instance using Django SECRET_KEY
+    # Static MultiFernet instance built from the configured keyring
     _cipher = None
     
+    # Batches at least this large are split across a thread pool when workers > 1
+    PARALLEL_THRESHOLD = 1000
+    
     @staticmethod
     def _derive_key():
         """
@@ -28,14 +45,61 @@ class PrivacyEncryption:
         # Fernet requires base64 encoded 32-byte key
         return urlsafe_b64encode(key_material)
     
+    @staticmethod
+    def _configured_keys():
+        """
+        ENCRYPTION_KEY (if set) followed by ENCRYPTION_OLD_KEYS, validated.
+        Raises ImproperlyConfigured naming the first malformed key.
+        """
+        configured = []
+        primary = getattr(settings, 'ENCRYPTION_KEY', None)
+        if primary:
+            configured.append(('ENCRYPTION_KEY', primary))
+        configured.extend(
+            (f'ENCRYPTION_OLD_KEYS[{index}]', key)
+            for index, key in enumerate(getattr(settings, 'ENCRYPTION_OLD_KEYS', []))
+        )
+        
+        keys = []
+        for name, key in configured:
+            key = key.encode() if isinstance(key, str) else key
+            try:
+                Fernet(key)
+            except (TypeError, ValueError):
+                # Fail loudly: falling back to another key would encrypt new data under the wrong one
+                raise ImproperlyConfigured(
+                    f"{name} is not a Fernet key (32 url-safe base64-encoded bytes). "
+                    "Generate one with PrivacyEncryption.generate_key()."
+                )
+            keys.append(key)
+        return keys
+
+    @staticmethod
+    def _get_keyring():
+        """
+        Ordered list of Fernet keys. The first key encrypts, every key decrypts.
+        ENCRYPTION_KEY (if set) is primary, followed by ENCRYPTION_OLD_KEYS and
+        finally the SECRET_KEY derived key, so existing data stays readable.
+        """
+        keys = PrivacyEncryption._configured_keys()
+        derived = PrivacyEncryption._derive_key()
+        if derived not in keys:
+            keys.append(derived)
+        return keys
+    
     @staticmethod
     def _get_cipher():
-        """Get the Fernet cipher (lazy initialization)"""
+        """Get the MultiFernet cipher (lazy initialization)"""
         if PrivacyEncryption._cipher is None:
-            key = PrivacyEncryption._derive_key()
-            PrivacyEncryption._cipher = Fernet(key)
+            keyring = PrivacyEncryption._get_keyring()
+            PrivacyEncryption._cipher = MultiFernet([Fernet(key) for key in keyring])
         return PrivacyEncryption._cipher
     
+    @staticmethod
+    def reset_cipher():
+        """Drop the cached cipher, e.g. after the keyring settings changed"""
+        PrivacyEncryption._cipher = None
+    
     @staticmethod
     def generate_key():
         """Generate a new Fernet key"""
@@ -96,15 +160,161 @@ class PrivacyEncryption:
         Create a hash of browser fingerprint for anonymous user identification.
         Returns a consistent hash for the same fingerprint.
         """
-        import hashlib
         fingerprint_str = json.dumps(fingerprint_data, sort_keys=True)
         return hashlib.sha256(fingerprint_str.encode()).hexdigest()
     
     @staticmethod
     def generate_anonymous_user_id():
         """Generate a unique anonymous user ID"""
-        import uuid
         return str(uuid.uuid4())
+    
+    # ========== CREDENTIAL VERIFIERS ==========
+    
+    @staticmethod
+    def _identity_keys():
+        """
+        Keys for identity hashes, the one new hashes use first.
+        IDENTITY_HASH_KEY (if set) is primary, followed by IDENTITY_HASH_OLD_KEYS,
+        SECRET_KEY and SECRET_KEY_FALLBACKS, so hashes stored before a key change
+        keep matching until the key rotation job rewrites them.
+        """
+        keys = []
+        primary = getattr(settings, 'IDENTITY_HASH_KEY', None)
+        if primary:
+            keys.append(primary)
+        keys.extend(getattr(settings, 'IDENTITY_HASH_OLD_KEYS', []))
+        keys.append(settings.SECRET_KEY)
+        keys.extend(getattr(settings, 'SECRET_KEY_FALLBACKS', []))
+        return list(dict.fromkeys(keys))
+    
+    @staticmethod
+    def identity_hash(kind, *parts, key=None):
+        """
+        Deterministic keyed hash of an identity (library ID, name + phone).
+        Fernet tokens are randomized, so lookups use this indexed value instead.
+        Stored hashes use the primary identity key.
+        """
+        value = '|'.join(part.strip().lower() for part in parts)
+        secret = key or PrivacyEncryption._identity_keys()[0]
+        return salted_hmac(f'models.encryption.{kind}', value, secret=secret, algorithm='sha256').hexdigest()
+    
+    @staticmethod
+    def identity_hashes(kind, *parts):
+        """Hashes of an identity under every identity key, for lookups"""
+        return [
+            PrivacyEncryption.identity_hash(kind, *parts, key=key)
+            for key in PrivacyEncryption._identity_keys()
+        ]
+    
+    @staticmethod
+    def stored_identity_hash(auth_method, encrypted_library_id, encrypted_auth_data):
+        """
+        Identity hash of a stored UserAuthentication row, from its encrypted fields.
+        Returns: hex digest, or None for rows that are not looked up by identity
+        """
+        if encrypted_library_id:
+            library_id = PrivacyEncryption.decrypt_library_id(encrypted_library_id)
+            return PrivacyEncryption.identity_hash('library_id', library_id)
+        if auth_method == 'credentials' and encrypted_auth_data:
+            name, phone, _credentials = PrivacyEncryption.decrypt_auth_data(encrypted_auth_data)
+            return PrivacyEncryption.identity_hash('credentials', name, phone)
+        return None
+    
+    @staticmethod
+    def make_password_verifier(password):
+        """Salted PBKDF2 verifier for a password"""
+        return make_password(password, hasher=CredentialHasher())
+    
+    @staticmethod
+    def check_password_verifier(password, verifier, setter=None):
+        """
+        Verify a password; setter is called to re-hash when the work factor changed.
+        Returns: True if the password matches
+        """
+        return check_password(password, verifier, setter=setter, preferred=CredentialHasher())
+    
+    # ========== BATCH OPERATIONS ==========
+    
+    @staticmethod
+    def _map_batch(func, values, workers):
+        """
+        Apply func to every value, splitting large batches across a thread pool.
+        Order of the results matches the input.
+        """
+        values = list(values)
+        if not workers or workers < 2 or len(values) < PrivacyEncryption.PARALLEL_THRESHOLD:
+            return [func(value) for value in values]
+        
+        chunk_size = -(-len(values) // workers)
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda chunk: [func(value) for value in chunk], chunks)
+        return [result for chunk in results for result in chunk]
+    
+    @staticmethod
+    def encrypt_many(values, workers=None):
+        """
+        Encrypt a batch of strings with the primary key.
+        Returns: list of tokens (None stays None)
+        """
+        cipher = PrivacyEncryption._get_cipher()
+        
+        def encrypt(value):
+            if value is None:
+                return None
+            return cipher.encrypt(value.encode()).decode()
+        
+        return PrivacyEncryption._map_batch(encrypt, values, workers)
+    
+    @staticmethod
+    def decrypt_many(tokens, workers=None, strict=True):
+        """
+        Decrypt a batch of tokens with any key in the keyring.
+        With strict=False undecryptable tokens yield None instead of raising ValueError.
+        Returns: list of strings (None stays None)
+        """
+        cipher = PrivacyEncryption._get_cipher()
+        
+        def decrypt(token):
+            if token is None:
+                return None
+            try:
+                return cipher.decrypt(token.encode()).decode()
+            except InvalidToken:
+                if strict:
+                    raise ValueError("Decryption failed: invalid token")
+                return None
+        
+        return PrivacyEncryption._map_batch(decrypt, tokens, workers)
+    
+    @staticmethod
+    def rotate(token):
+        """Re-encrypt a token under the primary key (no-op for None)"""
+        if token is None:
+            return None
+        try:
+            return PrivacyEncryption._get_cipher().rotate(token.encode()).decode()
+        except InvalidToken:
+            raise ValueError("Rotation failed: invalid token")
+    
+    @staticmethod
+    def rotate_many(tokens, workers=None):
+        """
+        Re-encrypt a batch of tokens under the primary key.
+        Returns: list of tokens in input order
+        """
+        return PrivacyEncryption._map_batch(PrivacyEncryption.rotate, tokens, workers)
+
+
+@checks.register(checks.Tags.security)
+def check_encryption_keys(app_configs, **kwargs):
+    """Report a malformed ENCRYPTION_KEY / ENCRYPTION_OLD_KEYS at startup instead of on the first login"""
+    # The SECRET_KEY derived key is left out: Django reports a missing SECRET_KEY itself when it needs one
+    try:
+        PrivacyEncryption._configured_keys()
+    except ImproperlyConfigured as exc:
+        return [checks.Error(str(exc), id='models.E001')]
+    return []
 
 
 def encrypt_sensitive_field(value):
@@ -0,0 +1,205 @@
+"""
+EPUB unpacking utilities for the in-browser reader.
+Each uploaded EPUB is unpacked once into a per-book cache directory so the
+reader can fetch spine items individually instead of the whole archive.
+Unpacking happens in a staging directory that is renamed into place, so
+concurrent first reads never see (or delete) a half-written cache.
+"""
+import gzip
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+import uuid
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from ebooklib import epub
+
+
+class EpubChapterCache:
+    """Unpack EPUB books into a cached chapter manifest with compressed items"""
+
+    CACHE_DIR = 'user_books/epub_cache'
+    MANIFEST_NAME = 'manifest.json'
+    CONTAINER_PATH = 'META-INF/container.xml'
+
+    # Text based items are stored gzip-compressed; images and fonts are already compressed
+    COMPRESSIBLE_TYPES = (
+        'application/xhtml+xml',
+        'application/x-dtbncx+xml',
+        'application/oebps-package+xml',
+        'application/xml',
+        'text/html',
+        'text/css',
+        'text/xml',
+        'image/svg+xml',
+    )
+
+    @staticmethod
+    def cache_root(book):
+        """Directory holding the unpacked items of a book"""
+        return Path(settings.MEDIA_ROOT) / EpubChapterCache.CACHE_DIR / str(book.id)
+
+    @staticmethod
+    def get_manifest(book):
+        """
+        Return the chapter manifest for a book, unpacking the EPUB on first use.
+        A cached manifest is rebuilt when the underlying file has been replaced.
+        Returns: dict or None if the EPUB cannot be unpacked
+        """
+        manifest = EpubChapterCache._cached_manifest(book, EpubChapterCache.cache_root(book))
+        if manifest:
+            return manifest
+
+        try:
+            return EpubChapterCache.build_manifest(book)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _cached_manifest(book, root):
+        """
+        Manifest in root if it was built from the book's current file.
+        Returns: dict or None
+        """
+        try:
+            manifest = json.loads((root / EpubChapterCache.MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest.get('source') == book.file.name and manifest.get('source_size') == book.file_size:
+            return manifest
+        return None
+
+    @staticmethod
+    def build_manifest(book):
+        """
+        Unpack every EPUB item into the cache directory and write the manifest.
+        Returns: dict with the OPF path, spine order and per-item metadata
+        """
+        reader = epub.EpubReader(book.file.path)
+        epub_book = reader.load()
+        reader.process()
+
+        # The reader closes the archive after loading; re-open it for the raw package files
+        with zipfile.ZipFile(book.file.path) as archive:
+            container = archive.read(EpubChapterCache.CONTAINER_PATH)
+            package_document = archive.read(reader.opf_file)
+
+        root = EpubChapterCache.cache_root(book)
+        root.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f'.{book.id}-', dir=root.parent))
+        try:
+            manifest = EpubChapterCache._unpack(book, reader, epub_book, container, package_document, staging)
+            return EpubChapterCache._swap_in(book, staging, root) or manifest
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def _unpack(book, reader, epub_book, container, package_document, root):
+        """
+        Write every item and the manifest into root.
+        Returns: manifest dict
+        """
+        items = {}
+
+        # Container and package document are needed by the reader to locate the spine
+        EpubChapterCache._write_item(
+            root, items, EpubChapterCache.CONTAINER_PATH, 'application/xml', container
+        )
+        EpubChapterCache._write_item(
+            root, items, reader.opf_file, 'application/oebps-package+xml', package_document
+        )
+
+        for item in epub_book.get_items():
+            path = posixpath.join(reader.opf_dir, item.get_name())
+            # Raw content: get_content() re-renders XHTML documents
+            EpubChapterCache._write_item(root, items, path, item.media_type, item.content)
+
+        spine = []
+        for idref, _linear in epub_book.spine:
+            item = epub_book.get_item_with_id(idref)
+            if item is not None:
+                spine.append(posixpath.join(reader.opf_dir, item.get_name()))
+
+        manifest = {
+            'source': book.file.name,
+            'source_size': book.file_size,
+            'opf_path': reader.opf_file,
+            'spine': spine,
+            'items': items,
+        }
+        (root / EpubChapterCache.MANIFEST_NAME).write_text(json.dumps(manifest))
+        return manifest
+
+    @staticmethod
+    def _swap_in(book, staging, root):
+        """
+        Rename a fully unpacked staging directory to root, replacing a stale cache.
+        Returns: the manifest of a current cache another request put in place first, else None
+        """
+        current = EpubChapterCache._cached_manifest(book, root)
+        if current:
+            return current
+
+        stale = root.with_name(f'.{root.name}-stale-{uuid.uuid4().hex}')
+        try:
+            os.replace(root, stale)
+        except FileNotFoundError:
+            stale = None
+        try:
+            os.replace(staging, root)
+        except OSError:
+            # Lost the race between the two renames: the winner's copy is just as good
+            return EpubChapterCache._cached_manifest(book, root)
+        finally:
+            if stale:
+                shutil.rmtree(stale, ignore_errors=True)
+        return None
+
+    @staticmethod
+    def _write_item(root, items, path, media_type, content):
+        """Write a single item to the cache, compressing text content"""
+        path = posixpath.normpath(path)
+        if path.startswith(('/', '../')) or path == '..' or path == EpubChapterCache.MANIFEST_NAME:
+            raise ValueError(f"Unsafe EPUB item path: {path}")
+
+        compressed = (media_type or '').split(';')[0] in EpubChapterCache.COMPRESSIBLE_TYPES
+        target = root / (f"{path}.gz" if compressed else path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if compressed:
+            with gzip.open(target, 'wb') as fh:
+                fh.write(content)
+        else:
+            target.write_bytes(content)
+
+        items[path] = {
+            'media_type': media_type,
+            'compressed': compressed,
+            'size': len(content),
+        }
+
+    @staticmethod
+    def get_item_path(book, manifest, item_path):
+        """
+        Resolve a cached item file for a manifest entry.
+        Returns: (Path, item metadata dict) or (None, None) if unknown
+        """
+        item = manifest['items'].get(posixpath.normpath(item_path))
+        if item is None:
+            return None, None
+
+        path = EpubChapterCache.cache_root(book) / posixpath.normpath(item_path)
+        if item['compressed']:
+            path = path.with_name(path.name + '.gz')
+        if not path.exists():
+            return None, None
+        return path, item
+
+    @staticmethod
+    def invalidate(book):
+        """Drop the cached items of a book (e.g. on delete or file replacement)"""
+        shutil.rmtree(EpubChapterCache.cache_root(book), ignore_errors=True)
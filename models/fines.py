@@ -0,0 +1,172 @@
+"""
+Overdue fine accrual.
+Fines for overdue loans are computed from the FinePolicy of the member's type.
+On SQLite and PostgreSQL a single INSERT ... SELECT ... ON CONFLICT (transaction)
+DO UPDATE computes and writes every fine in the database; other backends build
+the fines in Python and upsert them in batches. Either way a nightly run keeps
+every open loan's fine current without per-loan queries.
+"""
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection
+from django.db.models import BigIntegerField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .circulation import CirculationDesk
+from .models import Fine, FinePolicy, OverdueBook, Transaction
+
+
+class FineAccrual:
+    """Compute and upsert fines for overdue loans"""
+
+    BATCH_SIZE = 1000
+
+    # Whole days from the due date (column) to today (parameter), per backend
+    DAYS_OVERDUE_SQL = {
+        'sqlite': "CAST(julianday(%s) - julianday(t.due_date) AS INTEGER)",
+        'postgresql': "(CAST(%s AS date) - t.due_date)",
+    }
+
+    @staticmethod
+    def policies():
+        """
+        Active policies keyed by member type; '' is the default policy.
+        Returns: dict
+        """
+        return {policy.member_type: policy for policy in FinePolicy.objects.filter(is_active=True)}
+
+    @staticmethod
+    def amount_for(policy, days_overdue):
+        """Fine for a loan that is days_overdue days late"""
+        chargeable = days_overdue - policy.grace_days
+        if chargeable <= 0:
+            return Decimal('0.00')
+        amount = policy.daily_rate * chargeable
+        if policy.max_amount is not None:
+            amount = min(amount, policy.max_amount)
+        return amount.quantize(Decimal('0.01'))
+
+    @staticmethod
+    def accrue(loans=None, today=None, batch_size=BATCH_SIZE):
+        """
+        Upsert the fine of every overdue loan in loans (default: all open loans).
+        Paid fines are left alone; loans still inside their grace period get no fine.
+        Returns: number of fines written
+        """
+        today = today or timezone.now().date()
+        policies = FineAccrual.policies()
+        if not policies:
+            return 0
+
+        if loans is None:
+            loans = Transaction.objects.filter(status__in=CirculationDesk.OPEN_STATUSES)
+        loans = loans.filter(due_date__lt=today)
+
+        if connection.vendor in FineAccrual.DAYS_OVERDUE_SQL:
+            return FineAccrual._upsert_all(loans, today)
+        return FineAccrual._upsert_batches(loans.exclude(fine__is_paid=True), today, policies, batch_size)
+
+    @staticmethod
+    def _upsert_all(loans, today):
+        """
+        Compute and upsert the fines of loans in one statement.
+        The member's own active policy wins over the default one, as in policies().
+        Returns: number of fines written
+        """
+        loan_sql, loan_params = loans.order_by().values('id').query.sql_with_params()
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        charge = "(days_overdue - grace_days) * daily_rate"
+        sql = f"""
+            INSERT INTO models_fine (
+                member_id, resource_id, transaction_id, amount, days_overdue, reason, is_paid, created_at, updated_at
+            )
+            SELECT
+                member_id, resource_id, id,
+                ROUND(CASE WHEN max_amount IS NOT NULL AND max_amount < {charge} THEN max_amount ELSE {charge} END, 2),
+                days_overdue, 'Overdue ' || days_overdue || %s, %s, %s, %s
+            FROM (
+                SELECT
+                    t.id, t.member_id, t.resource_id,
+                    {FineAccrual.DAYS_OVERDUE_SQL[connection.vendor]} AS days_overdue,
+                    CASE WHEN own.id IS NULL THEN dflt.id ELSE own.id END AS policy_id,
+                    CASE WHEN own.id IS NULL THEN dflt.daily_rate ELSE own.daily_rate END AS daily_rate,
+                    CASE WHEN own.id IS NULL THEN dflt.grace_days ELSE own.grace_days END AS grace_days,
+                    CASE WHEN own.id IS NULL THEN dflt.max_amount ELSE own.max_amount END AS max_amount
+                FROM models_transaction t
+                JOIN models_member m ON m.id = t.member_id
+                LEFT JOIN models_finepolicy own ON own.member_type = COALESCE(m.member_type, '') AND own.is_active
+                LEFT JOIN models_finepolicy dflt ON dflt.member_type = '' AND dflt.is_active
+                WHERE t.id IN ({loan_sql})
+            ) due
+            WHERE policy_id IS NOT NULL AND days_overdue > grace_days AND daily_rate > 0
+                AND (max_amount IS NULL OR max_amount > 0)
+            ON CONFLICT (transaction_id) DO UPDATE SET
+                amount = excluded.amount, days_overdue = excluded.days_overdue,
+                reason = excluded.reason, updated_at = excluded.updated_at
+            WHERE NOT models_fine.is_paid
+        """
+        # In the order the placeholders appear in the statement
+        params = [f' days (accrued {today})', False, now, now, str(today), *loan_params]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    @staticmethod
+    def _upsert_batches(loans, today, policies, batch_size):
+        """
+        Compute fines in Python and upsert them in batches, for backends without _upsert_all.
+        Returns: number of fines written
+        """
+        # One ordered scan of the (status, due_date) index, upserted in batches. Only
+        # Fine rows are written and is_paid never changes, so the open cursor is unaffected.
+        rows = loans.order_by('status', 'due_date').values_list(
+            'id', 'member_id', 'resource_id', 'due_date', 'member__member_type'
+        ).iterator(chunk_size=batch_size)
+
+        written = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            fines = []
+            for transaction_id, member_id, resource_id, due_date, member_type in batch:
+                policy = policies.get(member_type or '') or policies.get('')
+                if policy is None:
+                    continue
+                days_overdue = (today - due_date).days
+                amount = FineAccrual.amount_for(policy, days_overdue)
+                if amount:
+                    fines.append(Fine(
+                        member_id=member_id,
+                        resource_id=resource_id,
+                        transaction_id=transaction_id,
+                        amount=amount,
+                        days_overdue=days_overdue,
+                        reason=f"Overdue {days_overdue} days (accrued {today})",
+                    ))
+
+            Fine.objects.bulk_create(
+                fines,
+                update_conflicts=True,
+                unique_fields=['transaction'],
+                update_fields=['amount', 'days_overdue', 'reason', 'updated_at'],
+            )
+            written += len(fines)
+
+        return written
+
+    @staticmethod
+    def sync_overdue_books():
+        """
+        Copy accrued amounts to OverdueBook.fine_imposed in one UPDATE.
+        Returns: number of rows updated
+        """
+        fine = Fine.objects.filter(
+            transaction_id=Cast(OuterRef('original_transaction'), BigIntegerField())
+        ).values('amount')[:1]
+        return OverdueBook.objects.filter(
+            is_recovered=False, original_transaction__isnull=False
+        ).update(fine_imposed=Subquery(fine))
@@ -1,12 +1,34 @@
 from django import forms
+from django.utils.html import format_html
 from .models import (
     Resource, Category, Member, Transaction, StockLog,
     UserBook, UserReview, UserAuthentication, Fine, UserBan
 )
+from .screening import UploadScreener
 from datetime import timedelta
+from django.urls import reverse_lazy
 from django.utils import timezone
 
 
+# ========== WIDGETS ==========
+
+class AutocompleteInput(forms.TextInput):
+    """
+    Text input for an object ID, filled from a JSON autocomplete endpoint
+    instead of rendering every choice as an <option>.
+    """
+    def __init__(self, url, attrs=None):
+        attrs = {'class': 'form-control', 'autocomplete': 'off', **(attrs or {})}
+        super().__init__(attrs)
+        self.url = url
+
+    def render(self, name, value, attrs=None, renderer=None):
+        list_id = f"{(attrs or {}).get('id', name)}_options"
+        attrs = {**(attrs or {}), 'list': list_id, 'data-autocomplete-url': str(self.url)}
+        html = super().render(name, value, attrs, renderer)
+        return html + format_html('<datalist id="{}"></datalist>', list_id)
+
+
 # ========== ADMIN FORMS ==========
 
 class ResourceForm(forms.ModelForm):
@@ -78,16 +100,24 @@ class MemberForm(forms.ModelForm):
 
 
 class CheckoutForm(forms.Form):
-    """Form for checking out resources"""
+    """Form for checking out resources - resource and member are picked by ID via autocomplete"""
     resource = forms.ModelChoiceField(
         queryset=Resource.objects.filter(available_quantity__gt=0, status='available'),
-        widget=forms.Select(attrs={'class': 'form-control'}),
-        label='Select Resource'
+        widget=AutocompleteInput(
+            reverse_lazy('resource_autocomplete'),
+            attrs={'placeholder': 'Type a title or ISBN/Serial No'},
+        ),
+        label='Select Resource',
+        error_messages={'invalid_choice': 'This resource is not available for checkout.'},
     )
     member = forms.ModelChoiceField(
         queryset=Member.objects.filter(is_active=True),
-        widget=forms.Select(attrs={'class': 'form-control'}),
-        label='Select Member'
+        widget=AutocompleteInput(
+            reverse_lazy('member_autocomplete'),
+            attrs={'placeholder': 'Type a member name or ID'},
+        ),
+        label='Select Member',
+        error_messages={'invalid_choice': 'Select an active member.'},
     )
     due_days = forms.IntegerField(
         initial=15,
@@ -297,6 +327,22 @@ class UserBookUploadForm(forms.ModelForm):
             }),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        book_format = cleaned_data.get('format')
+
+        # Only the first bytes are checked here; the full screening runs in the background
+        if upload and book_format and 'file' in self.changed_data:
+            detected = UploadScreener.sniff_format(upload)
+            if detected is None:
+                self.add_error('file', 'This file is not a PDF or EPUB.')
+            elif detected != book_format:
+                found = 'an EPUB' if detected == 'epub' else 'a PDF'
+                self.add_error('format', f'This file is {found}; choose {detected.upper()} as the format.')
+
+        return cleaned_data
+
 
 class UserReviewForm(forms.ModelForm):
     """Form for leaving reviews on digital books"""
@@ -0,0 +1,205 @@
+"""
+Event-sourced inventory ledger.
+Every stock change, checkout and return appends an InventoryEvent. Periodic
+InventorySnapshots fold the events of each resource, so a balance (current or
+at a past point in time) is the last snapshot plus a short tail of events.
+"""
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import InventoryEvent, InventorySnapshot, Resource
+
+
+class InventoryLedger:
+    """Record, fold and verify inventory events"""
+
+    # StockLog action -> sign of the change to total and available quantity
+    STOCK_ACTION_SIGNS = {
+        'add': 1,
+        'remove': -1,
+        'lost': -1,
+        'damaged': -1,
+        'repair': 0,  # recorded for history; the copy never left the stock count
+    }
+
+    SNAPSHOT_MIN_EVENTS = 50
+
+    @staticmethod
+    def record(resource, event_type, delta_total=0, delta_available=0, **sources):
+        """
+        Append one event. Call inside the database transaction that changes the resource.
+        Returns: InventoryEvent
+        """
+        return InventoryEvent.objects.create(
+            resource_id=resource.id if isinstance(resource, Resource) else resource,
+            event_type=event_type,
+            delta_total=delta_total,
+            delta_available=delta_available,
+            **sources
+        )
+
+    @staticmethod
+    def record_stock_log(stock_log):
+        """
+        Ledger event for a StockLog entry whose quantity change was applied to the resource.
+        Call it from the code path that changed the quantities: a StockLog on its
+        own (e.g. one added in the Django admin) is history only and moves no stock.
+        """
+        sign = InventoryLedger.STOCK_ACTION_SIGNS.get(stock_log.action, 0)
+        return InventoryLedger.record(
+            stock_log.resource_id,
+            'stock',
+            delta_total=sign * stock_log.quantity,
+            delta_available=sign * stock_log.quantity,
+            stock_log=stock_log,
+            note=stock_log.action,
+        )
+
+    @staticmethod
+    def record_adjustment(resource, total_quantity, available_quantity, note=''):
+        """
+        Record an edit that set quantities directly (e.g. through ResourceForm).
+        total_quantity/available_quantity are the values before the edit.
+        Returns: InventoryEvent or None when nothing changed
+        """
+        delta_total = resource.total_quantity - total_quantity
+        delta_available = resource.available_quantity - available_quantity
+        if not delta_total and not delta_available:
+            return None
+        return InventoryLedger.record(resource, 'adjust', delta_total, delta_available, note=note)
+
+    @staticmethod
+    def balance(resource, at=None):
+        """
+        Ledger quantities of one resource, now or at a past datetime.
+        Returns: (total_quantity, available_quantity)
+        """
+        resource_id = resource.id if isinstance(resource, Resource) else resource
+
+        snapshots = InventorySnapshot.objects.filter(resource_id=resource_id)
+        events = InventoryEvent.objects.filter(resource_id=resource_id)
+        if at is not None:
+            snapshots = snapshots.filter(taken_at__lte=at)
+            events = events.filter(created_at__lte=at)
+
+        snapshot = snapshots.order_by('-last_event_id').first()
+        if snapshot:
+            events = events.filter(id__gt=snapshot.last_event_id)
+
+        tail = events.aggregate(total=Sum('delta_total'), available=Sum('delta_available'))
+        total = (snapshot.total_quantity if snapshot else 0) + (tail['total'] or 0)
+        available = (snapshot.available_quantity if snapshot else 0) + (tail['available'] or 0)
+        return total, available
+
+    @staticmethod
+    def annotate_balances(resources, up_to_event=None):
+        """
+        Annotate a Resource queryset with its latest snapshot and the events after
+        it (optionally only up to event id up_to_event), in a single query.
+        Ledger balance = snapshot_total + tail_total / snapshot_available + tail_available.
+        """
+        latest = InventorySnapshot.objects.filter(resource=OuterRef('pk')).order_by('-last_event_id')
+        tail_events = InventoryEvent.objects.filter(resource=OuterRef('pk'), id__gt=OuterRef('snapshot_event_id'))
+        if up_to_event is not None:
+            tail_events = tail_events.filter(id__lte=up_to_event)
+        tail = tail_events.order_by().values('resource')
+
+        def tail_aggregate(aggregate):
+            return Coalesce(
+                Subquery(tail.annotate(value=aggregate).values('value'), output_field=IntegerField()), 0
+            )
+
+        return resources.annotate(
+            snapshot_event_id=Coalesce(Subquery(latest.values('last_event_id')[:1]), 0),
+            snapshot_total=Coalesce(Subquery(latest.values('total_quantity')[:1]), 0),
+            snapshot_available=Coalesce(Subquery(latest.values('available_quantity')[:1]), 0),
+            tail_total=tail_aggregate(Sum('delta_total')),
+            tail_available=tail_aggregate(Sum('delta_available')),
+            tail_count=tail_aggregate(Count('id')),
+            tail_last_event_id=tail_aggregate(Max('id')),
+        )
+
+    @staticmethod
+    def verify(batch_size=1000, fix=False):
+        """
+        Compare every Resource's quantities with its ledger balance, in batches.
+        With fix=True an 'adjust' event is appended for each mismatch so the
+        ledger matches the table (e.g. when first introducing the ledger).
+        Yields: (resource_id, (ledger_total, ledger_available), (total_quantity, available_quantity))
+        """
+        last_id = 0
+        while True:
+            batch = list(
+                InventoryLedger.annotate_balances(
+                    Resource.objects.filter(id__gt=last_id).order_by('id')
+                ).values_list(
+                    'id', 'total_quantity', 'available_quantity',
+                    'snapshot_total', 'snapshot_available', 'tail_total', 'tail_available'
+                )[:batch_size]
+            )
+            if not batch:
+                return
+
+            adjustments = []
+            for resource_id, total, available, snap_total, snap_available, tail_total, tail_available in batch:
+                ledger = (snap_total + tail_total, snap_available + tail_available)
+                if ledger != (total, available):
+                    if fix:
+                        adjustments.append(InventoryEvent(
+                            resource_id=resource_id,
+                            event_type='adjust',
+                            delta_total=total - ledger[0],
+                            delta_available=available - ledger[1],
+                            note='reconciled by verify_inventory',
+                        ))
+                    yield resource_id, ledger, (total, available)
+
+            InventoryEvent.objects.bulk_create(adjustments, batch_size=batch_size)
+            last_id = batch[-1][0]
+
+    @staticmethod
+    def take_snapshots(min_events=SNAPSHOT_MIN_EVENTS, batch_size=1000):
+        """
+        Snapshot every resource with at least min_events events since its last snapshot.
+        Events are folded up to the newest event id seen at the start, so events
+        appended while this runs simply land in the next tail.
+        Returns: number of snapshots written
+        """
+        up_to_event = InventoryEvent.objects.aggregate(last=Max('id'))['last']
+        if up_to_event is None:
+            return 0
+
+        written = 0
+        last_id = 0
+        while True:
+            batch = list(
+                InventoryLedger.annotate_balances(
+                    Resource.objects.filter(id__gt=last_id).order_by('id'), up_to_event
+                ).filter(tail_count__gte=min_events).values_list(
+                    'id', 'snapshot_total', 'snapshot_available',
+                    'tail_total', 'tail_available', 'tail_last_event_id'
+                )[:batch_size]
+            )
+            if not batch:
+                return written
+
+            # Snapshots are stamped with the time of the last folded event, for balance(at=...)
+            event_times = dict(
+                InventoryEvent.objects.filter(id__in=[row[5] for row in batch]).values_list('id', 'created_at')
+            )
+            InventorySnapshot.objects.bulk_create(
+                [
+                    InventorySnapshot(
+                        resource_id=resource_id,
+                        last_event_id=last_event_id,
+                        total_quantity=snap_total + tail_total,
+                        available_quantity=snap_available + tail_available,
+                        taken_at=event_times.get(last_event_id, timezone.now()),
+                    )
+                    for resource_id, snap_total, snap_available, tail_total, tail_available, last_event_id in batch
+                ],
+                batch_size=batch_size,
+            )
+            written += len(batch)
+            last_id = batch[-1][0]
@@ -0,0 +1,169 @@
+"""
+Online re-encryption of stored user authentication data.
+Rows are rotated in primary-key order in small batches, so a job can be
+paused and resumed, and logins keep working throughout because the
+MultiFernet keyring decrypts tokens under both the old and new keys.
+A worker claims a job atomically before running it and advances the
+checkpoint with a compare-and-swap, so a duplicate task delivery can
+never process or count a batch twice.
+"""
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import KeyRotationJob, UserAuthentication
+from .encryption import PrivacyEncryption
+
+
+class KeyRotationManager:
+    """Start, run and control KeyRotationJob instances"""
+
+    ENCRYPTED_FIELDS = ('encrypted_library_id', 'encrypted_auth_data')
+
+    # A running job whose progress has not moved for this long lost its worker and may be claimed again
+    STALE_SECONDS = 900
+
+    @staticmethod
+    def start_job(batch_size=500, throttle_seconds=0.1):
+        """
+        Create a new rotation job, or return the unfinished one if present.
+        Returns: KeyRotationJob instance
+        """
+        job = KeyRotationJob.objects.filter(status__in=['pending', 'running', 'paused']).first()
+        if job:
+            return job
+
+        return KeyRotationJob.objects.create(
+            batch_size=batch_size,
+            throttle_seconds=throttle_seconds,
+            rows_total=UserAuthentication.objects.count(),
+        )
+
+    @staticmethod
+    def pause_job(job):
+        """Ask a running job to stop after its current batch"""
+        KeyRotationJob.objects.filter(id=job.id, status__in=['pending', 'running']).update(status='paused')
+
+    @staticmethod
+    def resume_job(job):
+        """Allow a paused job to be picked up again"""
+        KeyRotationJob.objects.filter(id=job.id, status='paused').update(status='pending')
+
+    @staticmethod
+    def claim_job(job):
+        """
+        Take a pending (or abandoned running) job for this worker in one UPDATE.
+        Reloads job so it resumes from the committed checkpoint.
+        Returns: True when this worker now runs the job
+        """
+        now = timezone.now()
+        abandoned = Q(status='running', updated_at__lt=now - timedelta(seconds=KeyRotationManager.STALE_SECONDS))
+        claimed = KeyRotationJob.objects.filter(Q(status='pending') | abandoned, id=job.id).update(
+            status='running', started_at=Coalesce('started_at', Value(now)), updated_at=now
+        )
+        job.refresh_from_db()
+        return bool(claimed)
+
+    @staticmethod
+    def run_job(job, max_seconds=None):
+        """
+        Claim the job and process batches until it is done, paused, or max_seconds
+        elapsed. On timeout the job goes back to pending for the next delivery.
+        Returns: True when the job has completed
+        """
+        PrivacyEncryption.reset_cipher()  # pick up the current keyring
+
+        if not KeyRotationManager.claim_job(job):
+            # Already running elsewhere, paused or finished
+            return False
+
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+
+        try:
+            while True:
+                # Re-read status so pause requests from other processes are honoured
+                status = KeyRotationJob.objects.values_list('status', flat=True).get(id=job.id)
+                if status != 'running':
+                    job.status = status
+                    return False
+
+                if not KeyRotationManager._process_batch(job):
+                    job.status = 'completed'
+                    job.finished_at = timezone.now()
+                    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+                    return True
+
+                if deadline and time.monotonic() >= deadline:
+                    KeyRotationJob.objects.filter(id=job.id, status='running').update(status='pending')
+                    job.refresh_from_db()
+                    return False
+
+                if job.throttle_seconds:
+                    time.sleep(job.throttle_seconds)
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+
+    @staticmethod
+    def _process_batch(job):
+        """
+        Rotate the next batch of rows after job.last_processed_id.
+        Returns: False when there are no rows left
+        """
+        rows = list(
+            UserAuthentication.objects.filter(id__gt=job.last_processed_id)
+            .order_by('id')
+            .values('id', 'auth_method', 'identity_hash', *KeyRotationManager.ENCRYPTED_FIELDS)[:job.batch_size]
+        )
+        if not rows:
+            return False
+
+        rotated = failed = 0
+        with transaction.atomic():
+            # Move the checkpoint first: if another worker already did, this batch is theirs
+            owned = KeyRotationJob.objects.filter(id=job.id, last_processed_id=job.last_processed_id).update(
+                last_processed_id=rows[-1]['id'],
+                rows_processed=F('rows_processed') + len(rows),
+                updated_at=timezone.now(),
+            )
+            if not owned:
+                job.refresh_from_db()
+                return True
+
+            for row in rows:
+                changes = {}
+                for field in KeyRotationManager.ENCRYPTED_FIELDS:
+                    if not row[field]:
+                        continue
+                    try:
+                        changes[field] = PrivacyEncryption.rotate(row[field])
+                    except ValueError:
+                        failed += 1
+                        break
+                else:
+                    if not changes:
+                        continue
+                    # Lookups hash under the current identity key; rows hashed under an older one are rewritten
+                    identity = PrivacyEncryption.stored_identity_hash(
+                        row['auth_method'], row['encrypted_library_id'], row['encrypted_auth_data']
+                    )
+                    if identity and identity != row['identity_hash']:
+                        changes['identity_hash'] = identity
+                    # Compare-and-swap: skip rows a foreground write changed since the read
+                    updated = UserAuthentication.objects.filter(
+                        id=row['id'],
+                        **{field: row[field] for field in changes}
+                    ).update(**changes)
+                    rotated += updated
+
+            KeyRotationJob.objects.filter(id=job.id).update(
+                rows_rotated=F('rows_rotated') + rotated, rows_failed=F('rows_failed') + failed
+            )
+        job.refresh_from_db()
+        return True
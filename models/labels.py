@@ -0,0 +1,182 @@
+"""
+Printable QR label sheets for library resources.
+Each label carries a QR code of the Resource.resource_id (what the circulation
+scan endpoint resolves) plus the title and shelf location. Sheets are
+rendered page by page into a PDF by a background task; each page is encoded as
+soon as it is full, so only one page bitmap is held in memory.
+"""
+import io
+import tempfile
+
+import qrcode
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+from PyPDF2 import PdfReader, PdfWriter
+
+from .models import LabelSheetJob, Resource
+
+
+class LabelSheetGenerator:
+    """Create and run LabelSheetJob instances"""
+
+    # A4 at 150 dpi, 3 x 7 labels per page
+    DPI = 150
+    PAGE_SIZE = (1240, 1754)
+    MARGIN = 45
+    COLUMNS = 3
+    ROWS = 7
+    QR_BOX_SIZE = 5
+
+    TITLE_CHARS = 22
+    PROGRESS_EVERY = 100  # labels between progress saves
+    SPOOL_BYTES = 16 * 1024 * 1024  # finished PDF kept in memory up to this size, then in a temporary file
+
+    @staticmethod
+    def create_job(category=None, resource_ids=None, per_copy=False):
+        """
+        Queue a label sheet job; the periodic task renders it.
+        Returns: LabelSheetJob instance
+        """
+        job = LabelSheetJob(category=category, resource_ids=list(resource_ids or []), per_copy=per_copy)
+        job.labels_total = LabelSheetGenerator._count_labels(job)
+        job.save()
+        return job
+
+    @staticmethod
+    def _resources(job):
+        resources = Resource.objects.order_by('id')
+        if job.category_id:
+            resources = resources.filter(category_id=job.category_id)
+        if job.resource_ids:
+            resources = resources.filter(id__in=job.resource_ids)
+        return resources.only('id', 'title', 'resource_id', 'shelf_location', 'total_quantity')
+
+    @staticmethod
+    def _count_labels(job):
+        resources = LabelSheetGenerator._resources(job)
+        if not job.per_copy:
+            return resources.count()
+        return sum(max(quantity, 1) for quantity in resources.values_list('total_quantity', flat=True))
+
+    @staticmethod
+    def _labels(job):
+        """Yield (code, title, shelf, copy text) per label, streaming the resource table"""
+        for resource in LabelSheetGenerator._resources(job).iterator(chunk_size=500):
+            copies = max(resource.total_quantity, 1) if job.per_copy else 1
+            for copy in range(1, copies + 1):
+                copy_text = f"Copy {copy}/{copies}" if job.per_copy else ''
+                yield resource.resource_id, resource.title, resource.shelf_location or '', copy_text
+
+    @staticmethod
+    def _draw_label(page, box, label, fonts):
+        code, title, shelf, copy_text = label
+        left, top, right, bottom = box
+
+        qr = qrcode.QRCode(box_size=LabelSheetGenerator.QR_BOX_SIZE, border=1)
+        qr.add_data(code)
+        qr.make(fit=True)
+        qr_image = qr.make_image(fill_color='black', back_color='white').get_image().convert('1')
+
+        # Shrink very long codes so the QR always fits the label height
+        size = min(qr_image.size[0], bottom - top - 10)
+        if qr_image.size[0] != size:
+            qr_image = qr_image.resize((size, size), Image.NEAREST)
+        page.paste(qr_image, (left + 5, top + (bottom - top - size) // 2))
+
+        draw = ImageDraw.Draw(page)
+        text_left = left + size + 15
+        if len(title) > LabelSheetGenerator.TITLE_CHARS:
+            title = title[:LabelSheetGenerator.TITLE_CHARS - 1] + '…'
+        lines = [(title, fonts['title']), (code, fonts['code']), (shelf, fonts['small']), (copy_text, fonts['small'])]
+        y = top + 25
+        for text, font in lines:
+            if text:
+                draw.text((text_left, y), text, fill=0, font=font)
+                y += font.size + 8
+
+    @staticmethod
+    def _new_page():
+        return Image.new('1', LabelSheetGenerator.PAGE_SIZE, 1)
+
+    @staticmethod
+    def _add_page(writer, page):
+        """Encode one page bitmap and append it to the PDF being written"""
+        buffer = io.BytesIO()
+        page.save(buffer, 'PDF', resolution=LabelSheetGenerator.DPI)
+        writer.add_page(PdfReader(buffer).pages[0])
+
+    @staticmethod
+    def render(job, output):
+        """Render all labels of a job as a PDF into the binary file object output"""
+        fonts = {
+            'title': ImageFont.load_default(size=22),
+            'code': ImageFont.load_default(size=26),
+            'small': ImageFont.load_default(size=18),
+        }
+        label_width = (LabelSheetGenerator.PAGE_SIZE[0] - 2 * LabelSheetGenerator.MARGIN) // LabelSheetGenerator.COLUMNS
+        label_height = (LabelSheetGenerator.PAGE_SIZE[1] - 2 * LabelSheetGenerator.MARGIN) // LabelSheetGenerator.ROWS
+        per_page = LabelSheetGenerator.COLUMNS * LabelSheetGenerator.ROWS
+
+        writer = PdfWriter()
+        page = None
+        done = 0
+        for done, label in enumerate(LabelSheetGenerator._labels(job), start=1):
+            slot = (done - 1) % per_page
+            if slot == 0:
+                if page is not None:
+                    LabelSheetGenerator._add_page(writer, page)
+                page = LabelSheetGenerator._new_page()
+            column, row = slot % LabelSheetGenerator.COLUMNS, slot // LabelSheetGenerator.COLUMNS
+            left = LabelSheetGenerator.MARGIN + column * label_width
+            top = LabelSheetGenerator.MARGIN + row * label_height
+            LabelSheetGenerator._draw_label(page, (left, top, left + label_width, top + label_height), label, fonts)
+
+            if done % LabelSheetGenerator.PROGRESS_EVERY == 0:
+                LabelSheetJob.objects.filter(id=job.id).update(labels_done=done)
+
+        job.labels_done = done
+        LabelSheetGenerator._add_page(writer, page if page is not None else LabelSheetGenerator._new_page())
+        writer.write(output)
+
+    @staticmethod
+    def run_job(job):
+        """
+        Render a pending job and attach the PDF.
+        Returns: True when the job completed
+        """
+        # Claim the job so two workers never render the same sheet
+        if not LabelSheetJob.objects.filter(id=job.id, status='pending').update(
+            status='running', started_at=timezone.now()
+        ):
+            return False
+        job.refresh_from_db()
+
+        with tempfile.SpooledTemporaryFile(max_size=LabelSheetGenerator.SPOOL_BYTES) as pdf:
+            try:
+                LabelSheetGenerator.render(job, pdf)
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = timezone.now()
+                job.save(update_fields=['status', 'error', 'finished_at'])
+                return False
+
+            pdf.seek(0)
+            job.file.save(f"labels-{job.id}.pdf", File(pdf), save=False)
+        job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['file', 'status', 'labels_done', 'finished_at'])
+        return True
+
+    @staticmethod
+    def run_pending_jobs(limit=5):
+        """
+        Render queued jobs, oldest first.
+        Returns: number of completed jobs
+        """
+        completed = 0
+        for job in LabelSheetJob.objects.filter(status='pending').order_by('created_at')[:limit]:
+            if LabelSheetGenerator.run_job(job):
+                completed += 1
+        return completed
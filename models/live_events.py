@@ -0,0 +1,147 @@
+"""
+Live admin dashboard events.
+Model signals publish small events (uploads awaiting verification, reviewed
+books, checkouts, returns, bans) to an event log in the cache. In each server
+process one poller task reads new events and fans them out to every open
+dashboard stream, so many open dashboards cost one cache poll per second
+instead of repeated statistics queries. With CACHE_BACKEND='redis' the log is
+shared by all workers and by Celery.
+"""
+import asyncio
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class LiveEventBus:
+    """Publish dashboard events and stream them to subscribers"""
+
+    SEQUENCE_KEY = 'live:sequence'
+    EVENT_KEY = 'live:event:{}'
+
+    EVENT_TIMEOUT = 600   # seconds of history a reconnecting dashboard can catch up on
+    MAX_BACKLOG = 200
+    POLL_INTERVAL = 1.0
+    MISSING_RETRIES = 3   # polls to wait for an event whose id was taken but not yet written
+
+    # Per event loop: subscriber queues and the poller task feeding them
+    _subscribers = {}
+    _pollers = {}
+
+    @staticmethod
+    def publish(event_type, **data):
+        """
+        Append an event to the log. Call from transaction.on_commit so only committed changes are pushed.
+        Returns: event id
+        """
+        try:
+            event_id = cache.incr(LiveEventBus.SEQUENCE_KEY)
+        except ValueError:
+            cache.add(LiveEventBus.SEQUENCE_KEY, 0, timeout=None)
+            event_id = cache.incr(LiveEventBus.SEQUENCE_KEY)
+
+        event = {'id': event_id, 'type': event_type, 'at': timezone.now().isoformat(), 'data': data}
+        cache.set(LiveEventBus.EVENT_KEY.format(event_id), event, LiveEventBus.EVENT_TIMEOUT)
+        return event_id
+
+    @staticmethod
+    async def last_id():
+        return await cache.aget(LiveEventBus.SEQUENCE_KEY, 0)
+
+    @staticmethod
+    async def events_between(first_id, last_id):
+        """
+        Events with first_id <= id <= last_id still in the log (at most MAX_BACKLOG, newest).
+        Returns: dict of id -> event
+        """
+        first_id = max(first_id, last_id - LiveEventBus.MAX_BACKLOG + 1)
+        if first_id > last_id:
+            return {}
+        keys = {LiveEventBus.EVENT_KEY.format(event_id): event_id for event_id in range(first_id, last_id + 1)}
+        found = await cache.aget_many(list(keys))
+        return {keys[key]: event for key, event in found.items()}
+
+    @staticmethod
+    async def wait(after, timeout):
+        """
+        Long-poll: events after id `after`, waiting up to timeout seconds for the first one.
+        Returns: (last event id, list of events)
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            last = await LiveEventBus.last_id()
+            if last < after:
+                # The sequence was reset (cache flushed): the client restarts from last
+                return last, []
+            if last > after:
+                events = await LiveEventBus.events_between(after + 1, last)
+                return last, [events[event_id] for event_id in sorted(events)]
+            if asyncio.get_running_loop().time() >= deadline:
+                return last, []
+            await asyncio.sleep(LiveEventBus.POLL_INTERVAL)
+
+    @staticmethod
+    async def listen(after=None, idle_timeout=None):
+        """
+        Yield events published after id `after` (default: from now on) until the consumer stops.
+        None is yielded after idle_timeout seconds without an event, so streams can send keepalives.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=LiveEventBus.MAX_BACKLOG)
+        LiveEventBus._subscribers.setdefault(loop, set()).add(queue)
+        await LiveEventBus._ensure_poller(loop)
+
+        try:
+            # Subscribed first, so nothing published meanwhile is lost; the poller may repeat backlog events
+            backlog = {}
+            if after is not None:
+                backlog = await LiveEventBus.events_between(after + 1, await LiveEventBus.last_id())
+                for event_id in sorted(backlog):
+                    yield backlog[event_id]
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), idle_timeout)
+                except asyncio.TimeoutError:
+                    # Restart the poller if a cache error stopped it
+                    await LiveEventBus._ensure_poller(loop)
+                    yield None
+                    continue
+                if event['id'] not in backlog:
+                    yield event
+        finally:
+            LiveEventBus._subscribers.get(loop, set()).discard(queue)
+
+    @staticmethod
+    async def _ensure_poller(loop):
+        if loop not in LiveEventBus._pollers:
+            LiveEventBus._pollers[loop] = loop.create_task(LiveEventBus._poll(await LiveEventBus.last_id()))
+
+    @staticmethod
+    async def _poll(cursor):
+        """Fan new log entries out to this event loop's subscribers; stops when none are left"""
+        loop = asyncio.get_running_loop()
+        missing = {}
+        try:
+            while LiveEventBus._subscribers.get(loop):
+                await asyncio.sleep(LiveEventBus.POLL_INTERVAL)
+
+                last = await LiveEventBus.last_id()
+                wanted = sorted(set(range(cursor + 1, last + 1)) | set(missing))
+                cursor = max(cursor, last)
+                if not wanted:
+                    continue
+
+                events = await LiveEventBus.events_between(wanted[0], wanted[-1])
+                for event_id in wanted:
+                    if event_id in events:
+                        missing.pop(event_id, None)
+                        for queue in list(LiveEventBus._subscribers.get(loop, ())):
+                            if not queue.full():  # a stalled client misses events rather than blocking others
+                                queue.put_nowait(events[event_id])
+                    elif missing.get(event_id, 0) < LiveEventBus.MISSING_RETRIES:
+                        missing[event_id] = missing.get(event_id, 0) + 1
+                    else:
+                        missing.pop(event_id, None)
+        finally:
+            LiveEventBus._pollers.pop(loop, None)
@@ -0,0 +1,104 @@
+"""
+Benchmark the member autocomplete with a large member table: the previous
+istartswith OR-query against the FTS5 prefix index, cold and with the cached
+top-N results. All seeded rows are rolled back when the command finishes, and
+the cached results are kept in a private cache.
+"""
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.test import override_settings
+
+from models.autocomplete import AutocompleteIndex
+from models.models import Member
+
+
+SYLLABLES = ['al', 'an', 'ber', 'cha', 'da', 'el', 'fi', 'go', 'ha', 'is', 'jo', 'ka',
+             'li', 'ma', 'ne', 'or', 'pa', 'ri', 'sa', 'to', 'ul', 'va', 'wi', 'ze']
+
+# The cold runs clear the cache before every lookup; never do that to the configured one
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-autocomplete'},
+}
+
+
+def random_name():
+    return ''.join(random.choices(SYLLABLES, k=random.randint(2, 4))).capitalize()
+
+
+def legacy_member_search(query):
+    """The per-request query of the first autocomplete endpoint"""
+    return list(Member.objects.filter(
+        Q(member_id__istartswith=query) |
+        Q(first_name__istartswith=query) |
+        Q(last_name__istartswith=query),
+        is_active=True
+    ).order_by('last_name', 'first_name', 'member_id')[:AutocompleteIndex.LIMIT])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark member autocomplete lookups with many members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1_000_000, help='Members to seed')
+        parser.add_argument('--lookups', type=int, default=200, help='Lookups to time per strategy')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    @override_settings(CACHES=BENCH_CACHES)
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['members']} members...")
+            started = time.perf_counter()
+            self._seed(options['members'], options['batch_size'])
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+            prefixes = [
+                random_name()[:random.randint(1, 4)].lower()
+                for _ in range(options['lookups'])
+            ]
+
+            def cold(prefix):
+                cache.clear()
+                return AutocompleteIndex.search_members(prefix)
+
+            for label, lookup in [
+                ('istartswith OR query', legacy_member_search),
+                ('FTS5 prefix, cold cache', cold),
+                ('FTS5 prefix, cached', AutocompleteIndex.search_members),
+            ]:
+                self._report(label, lookup, prefixes)
+
+            transaction.set_rollback(True)
+
+    def _seed(self, count, batch_size):
+        for start in range(0, count, batch_size):
+            Member.objects.bulk_create(
+                [
+                    Member(
+                        member_id=f"BENCH-{number:08d}",
+                        first_name=random_name(),
+                        last_name=random_name(),
+                    )
+                    for number in range(start, min(start + batch_size, count))
+                ],
+                batch_size=batch_size,
+            )
+
+    def _report(self, label, lookup, prefixes):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            lookup(prefix)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"{label:>24}: mean {statistics.mean(timings):.2f} ms, "
+            f"p50 {timings[len(timings) // 2]:.2f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms"
+        )
@@ -0,0 +1,107 @@
+"""
+Compare concurrent download throughput of user_download_book through the WSGI
+and the ASGI request handler, in process. WSGI gets a fixed pool of worker
+threads (as a threaded WSGI server would); ASGI serves every download from one
+event loop and reads file chunks in the default thread pool.
+The benchmark book and its file are deleted when the command finishes; the
+cache used by the downloads is a private one.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from models.models import UserBook
+
+# Each handler starts from an empty cache, which must not be the one the site uses
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-downloads'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent book download throughput between WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--downloads', type=int, default=200, help='Downloads per handler')
+        parser.add_argument('--size-kb', type=int, default=1024, help='Size of the downloaded file')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent ASGI downloads')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='bench-downloads-')
+        try:
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'], CACHES=BENCH_CACHES):
+                book = UserBook(title='Benchmark book', format='pdf', file_size=options['size_kb'] * 1024, is_verified=True)
+                book.file.save('bench.pdf', ContentFile(os.urandom(book.file_size)), save=False)
+                book.save()
+                url = reverse('user_download_book', kwargs={'book_id': book.id})
+                try:
+                    results = [
+                        (f"WSGI, {options['threads']} threads", self._wsgi(url, options)),
+                        (f"ASGI, {options['concurrency']} concurrent", asyncio.run(self._asgi(url, options))),
+                    ]
+                finally:
+                    book.delete()
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        megabytes = options['downloads'] * options['size_kb'] / 1024
+        for label, seconds in results:
+            self.stdout.write(
+                f"{label:>20}: {options['downloads'] / seconds:8.1f} downloads/s, "
+                f"{megabytes / seconds:8.1f} MB/s ({seconds:.2f}s)"
+            )
+
+    def _wsgi(self, url, options):
+        def download(_):
+            client = Client()
+            try:
+                response = client.get(url)
+                size = sum(len(chunk) for chunk in response.streaming_content)
+                response.close()
+                return size
+            finally:
+                close_old_connections()
+
+        cache.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            sizes = list(pool.map(download, range(options['downloads'])))
+        elapsed = time.perf_counter() - started
+        self._check(sizes, options)
+        return elapsed
+
+    async def _asgi(self, url, options):
+        limit = asyncio.Semaphore(options['concurrency'])
+        client = AsyncClient()
+
+        async def download():
+            async with limit:
+                response = await client.get(url)
+                size = 0
+                async for chunk in response.streaming_content:
+                    size += len(chunk)
+                return size
+
+        cache.clear()
+        started = time.perf_counter()
+        sizes = await asyncio.gather(*(download() for _ in range(options['downloads'])))
+        elapsed = time.perf_counter() - started
+        self._check(sizes, options)
+        return elapsed
+
+    def _check(self, sizes, options):
+        expected = options['size_kb'] * 1024
+        failed = sum(1 for size in sizes if size != expected)
+        if failed:
+            self.stderr.write(self.style.WARNING(f'{failed} downloads returned an incomplete file'))
@@ -0,0 +1,68 @@
+"""
+Calibrate USER_PASSWORD_ITERATIONS: time verifier creation, verification and
+a full username login for a range of PBKDF2 work factors.
+The temporary login account is rolled back when the command finishes.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from models.encryption import PrivacyEncryption
+from models.user_utils import UserSessionManager
+
+
+class Command(BaseCommand):
+    help = 'Benchmark password verifier cost to tune USER_PASSWORD_ITERATIONS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, nargs='+',
+            default=[100_000, 200_000, 400_000, 600_000, 1_000_000, 1_200_000],
+        )
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument('--target-ms', type=float, default=250.0, help='Acceptable login latency')
+
+    def handle(self, *args, **options):
+        password = 'benchmark-password'
+        recommended = None
+
+        self.stdout.write(f"{'iterations':>12} {'hash ms':>9} {'verify ms':>10} {'login ms':>9}")
+        for iterations in sorted(options['iterations']):
+            with override_settings(USER_PASSWORD_ITERATIONS=iterations), transaction.atomic():
+                verifier = PrivacyEncryption.make_password_verifier(password)
+                user_auth = UserSessionManager.create_library_id_user(
+                    'bench-library-id', username='bench_password_user', password=password
+                )
+
+                hash_ms = self._time(lambda: PrivacyEncryption.make_password_verifier(password), options['samples'])
+                verify_ms = self._time(
+                    lambda: PrivacyEncryption.check_password_verifier(password, verifier), options['samples']
+                )
+                login_ms = self._time(
+                    lambda: UserSessionManager.authenticate_with_username(user_auth.username, password),
+                    options['samples']
+                )
+                transaction.set_rollback(True)
+
+            if login_ms <= options['target_ms']:
+                recommended = iterations
+            self.stdout.write(f"{iterations:>12} {hash_ms:>9.1f} {verify_ms:>10.1f} {login_ms:>9.1f}")
+
+        if recommended:
+            self.stdout.write(self.style.SUCCESS(
+                f"Highest work factor within {options['target_ms']:.0f} ms login latency: "
+                f"USER_PASSWORD_ITERATIONS={recommended}"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING('No tested work factor meets the target latency'))
+
+    def _time(self, func, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,70 @@
+"""
+Measure database writes per anonymous page view of the user home page with the
+previous configuration (database sessions, last_activity written on every view)
+and the current one (cache-only anonymous sessions, throttled activity updates).
+All rows written by the simulated visitors are rolled back afterwards; the
+simulated sessions live in a private cache.
+"""
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# Benchmarks clear the cache between runs; a private locmem cache keeps them from
+# wiping the configured one (anonymous sessions, rate limits, catalog versions)
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-session-writes'},
+}
+
+PROFILES = [
+    ('db sessions, write every view', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'ANONYMOUS_ACTIVITY_INTERVAL': 0,
+    }),
+    ('cache sessions until login', {}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare database writes per anonymous page view for the session configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visitors', type=int, default=20, help='Distinct anonymous visitors')
+        parser.add_argument('--views', type=int, default=10, help='Home page views per visitor')
+
+    @override_settings(CACHES=BENCH_CACHES)
+    def handle(self, *args, **options):
+        for label, overrides in PROFILES:
+            with transaction.atomic():
+                cache.clear()
+                with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+                    writes, queries = self._simulate(options['visitors'], options['views'])
+                transaction.set_rollback(True)
+
+            views = options['visitors'] * options['views']
+            self.stdout.write(
+                f"{label:>30}: {writes / views:.2f} writes/view, "
+                f"{queries / views:.2f} queries/view over {views} views"
+            )
+
+    def _simulate(self, visitors, views):
+        counts = {'writes': 0, 'queries': 0}
+
+        def count_queries(execute, sql, params, many, context):
+            counts['queries'] += 1
+            if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+                counts['writes'] += 1
+            return execute(sql, params, many, context)
+
+        url = reverse('user_home')
+        with connection.execute_wrapper(count_queries):
+            for visitor in range(visitors):
+                client = Client(HTTP_USER_AGENT=f'bench-visitor-{visitor}')
+                for _ in range(views):
+                    client.get(url)
+
+        return counts['writes'], counts['queries']
@@ -0,0 +1,108 @@
+"""
+Benchmark UserSessionManager.generate_unique_username against the previous
+probing loop with a large number of existing usernames under one prefix.
+All seeded rows are rolled back when the command finishes.
+"""
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from models.models import UserAuthentication
+from models.user_utils import UserSessionManager
+
+
+ALPHABET = string.ascii_lowercase + string.digits
+
+
+def legacy_generate_unique_username(base='user'):
+    """The original allocator: one exists() query per random candidate"""
+    if not UserAuthentication.objects.filter(username=base).exists():
+        return base
+    for _ in range(20):
+        candidate = f"{base}_{''.join(random.choices(ALPHABET, k=4))}"
+        if not UserAuthentication.objects.filter(username=candidate).exists():
+            return candidate
+    return f"{base}_{timezone.now().strftime('%f')}"
+
+
+def suffix_for(number, length=4):
+    """Encode a number as a fixed-length base-36 suffix"""
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the unique-username allocator with many existing usernames'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=1_000_000, help='Usernames to seed under the prefix')
+        parser.add_argument('--base', default='user123', help='Username prefix to fill up')
+        parser.add_argument('--allocations', type=int, default=500, help='Allocations to time per allocator')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        base = options['base']
+        existing = min(options['existing'], len(ALPHABET) ** 4)
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {existing} usernames under '{base}'...")
+            started = time.perf_counter()
+            self._seed(base, existing, options['batch_size'])
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+            for label, allocator in [
+                ('legacy probing loop', legacy_generate_unique_username),
+                ('batched username__in', UserSessionManager.generate_unique_username),
+            ]:
+                self._report(label, allocator, base, options['allocations'])
+
+            transaction.set_rollback(True)
+
+    def _seed(self, base, existing, batch_size):
+        suffixes = random.sample(range(len(ALPHABET) ** 4), existing - 1)
+        usernames = [base] + [f"{base}_{suffix_for(number)}" for number in suffixes]
+        for start in range(0, len(usernames), batch_size):
+            UserAuthentication.objects.bulk_create(
+                [
+                    UserAuthentication(username=username, auth_method='library_id')
+                    for username in usernames[start:start + batch_size]
+                ],
+                batch_size=batch_size,
+            )
+
+    def _report(self, label, allocator, base, allocations):
+        timings = []
+        queries = []
+        fallbacks = 0
+        collisions = 0
+
+        def count_queries(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        for _ in range(allocations):
+            queries.append(0)
+            with connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                username = allocator(base)
+                timings.append((time.perf_counter() - started) * 1000)
+            if UserAuthentication.objects.filter(username=username).exists():
+                collisions += 1  # allocator returned a taken name
+            elif len(username) - len(base) - 1 != 4:
+                fallbacks += 1  # 4-character suffixes exhausted, used a longer one
+
+        timings.sort()
+        self.stdout.write(
+            f"{label:>22}: mean {statistics.mean(timings):.2f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, "
+            f"{statistics.mean(queries):.2f} queries/allocation, "
+            f"{fallbacks} long-suffix fallbacks, {collisions} collisions"
+        )
@@ -0,0 +1,34 @@
+"""
+Build or rebuild the circulation reporting rollups.
+The nightly task only re-aggregates recent days; run this with --since after
+importing historical data or changing how a metric is counted.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from models.analytics import AnalyticsRollup
+
+
+class Command(BaseCommand):
+    help = 'Aggregate loans, returns, overdues, fines and uploads into daily rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); default: recent days only')
+        parser.add_argument('--all', action='store_true', help='Rebuild from the first day with data')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['all']:
+            since = AnalyticsRollup.first_day()
+            if since is None:
+                self.stdout.write('Nothing to roll up')
+                return
+        elif options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        count = AnalyticsRollup.refresh(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup rows'))
@@ -0,0 +1,35 @@
+"""
+Compare Resource quantities with the inventory ledger.
+Run once with --fix when introducing the ledger so existing stock is recorded
+as opening 'adjust' events; afterwards any mismatch points at a quantity
+change that bypassed the ledger.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from models.inventory import InventoryLedger
+
+
+class Command(BaseCommand):
+    help = 'Verify resource quantities against the inventory ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Append adjust events so the ledger matches the table')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Resources per query')
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        with transaction.atomic():
+            for resource_id, ledger, table in InventoryLedger.verify(options['batch_size'], fix=options['fix']):
+                mismatches += 1
+                self.stdout.write(
+                    f"Resource {resource_id}: ledger total/available {ledger[0]}/{ledger[1]}, "
+                    f"table {table[0]}/{table[1]}"
+                )
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Inventory ledger matches all resources'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {mismatches} resources'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{mismatches} resources differ from the ledger; rerun with --fix'))
@@ -0,0 +1,75 @@
+# Generated by Django 6.0.3 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FTS_TABLE = 'models_bookcontentpage_fts'
+
+CREATE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='models_bookcontentpage', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS models_bookcontentpage_ai AFTER INSERT ON models_bookcontentpage BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS models_bookcontentpage_ad AFTER DELETE ON models_bookcontentpage BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS models_bookcontentpage_au AFTER UPDATE ON models_bookcontentpage BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS models_bookcontentpage_au",
+    "DROP TRIGGER IF EXISTS models_bookcontentpage_ad",
+    "DROP TRIGGER IF EXISTS models_bookcontentpage_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to icontains search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0007_userbook_category_userbook_publication_year_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookContentIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='File name the index was built from', max_length=255)),
+                ('page_count', models.IntegerField(default=0)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='content_index', to='models.userbook')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookContentPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField()),
+                ('text', models.TextField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='content_pages', to='models.userbook')),
+            ],
+            options={
+                'ordering': ['book', 'page_number'],
+                'unique_together': {('book', 'page_number')},
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0008_bookcontentindex_bookcontentpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyRotationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('paused', 'Paused'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('batch_size', models.IntegerField(default=500)),
+                ('throttle_seconds', models.FloatField(default=0.1, help_text='Pause between batches to leave room for foreground writes')),
+                ('last_processed_id', models.BigIntegerField(default=0)),
+                ('rows_total', models.IntegerField(default=0)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('rows_rotated', models.IntegerField(default=0)),
+                ('rows_failed', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
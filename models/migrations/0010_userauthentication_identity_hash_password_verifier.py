@@ -0,0 +1,23 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0009_keyrotationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userauthentication',
+            name='identity_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='userauthentication',
+            name='password_verifier',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
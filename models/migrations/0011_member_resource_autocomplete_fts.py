@@ -0,0 +1,68 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations
+
+
+# table -> (content table, indexed columns)
+FTS_TABLES = {
+    'models_member_fts': ('models_member', ('member_id', 'first_name', 'last_name')),
+    'models_resource_fts': ('models_resource', ('title', 'resource_id')),
+}
+
+
+def create_statements(fts_table, content_table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        # Prefix indexes make 1-3 character prefix queries index lookups
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{column_list}, content='{content_table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {content_table}_fts_ai AFTER INSERT ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {content_table}_fts_ad AFTER DELETE ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {content_table}_fts_au AFTER UPDATE OF {column_list} ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        # Index rows that existed before this migration
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+def drop_statements(fts_table, content_table):
+    return [
+        f"DROP TRIGGER IF EXISTS {content_table}_fts_au",
+        f"DROP TRIGGER IF EXISTS {content_table}_fts_ad",
+        f"DROP TRIGGER IF EXISTS {content_table}_fts_ai",
+        f"DROP TABLE IF EXISTS {fts_table}",
+    ]
+
+
+def create_fts_indexes(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to istartswith lookups
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts_table, (content_table, columns) in FTS_TABLES.items():
+        for statement in create_statements(fts_table, content_table, columns):
+            schema_editor.execute(statement)
+
+
+def drop_fts_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts_table, (content_table, _columns) in FTS_TABLES.items():
+        for statement in drop_statements(fts_table, content_table):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0010_userauthentication_identity_hash_password_verifier'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_indexes, drop_fts_indexes),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0011_member_resource_autocomplete_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabelSheetJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('resource_ids', models.JSONField(blank=True, default=list, help_text='Primary keys of the resources to label')),
+                ('per_copy', models.BooleanField(default=False, help_text='One label per copy (total quantity) instead of per title')),
+                ('labels_total', models.IntegerField(default=0)),
+                ('labels_done', models.IntegerField(default=0)),
+                ('file', models.FileField(blank=True, upload_to='labels/')),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='models.category')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0012_labelsheetjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('stock', 'Stock change'), ('checkout', 'Checkout'), ('return', 'Return'), ('adjust', 'Adjustment')], max_length=20)),
+                ('delta_total', models.IntegerField(default=0)),
+                ('delta_available', models.IntegerField(default=0)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_events', to='models.resource')),
+                ('stock_log', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_event', to='models.stocklog')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_events', to='models.transaction')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['resource', 'id'], name='models_inve_resourc_f47648_idx'), models.Index(fields=['resource', 'created_at'], name='models_inve_resourc_698ebe_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.BigIntegerField()),
+                ('total_quantity', models.IntegerField()),
+                ('available_quantity', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='models.resource')),
+            ],
+            options={
+                'ordering': ['-last_event_id'],
+                'indexes': [models.Index(fields=['resource', 'last_event_id'], name='models_inve_resourc_25c23a_idx'), models.Index(fields=['resource', 'taken_at'], name='models_inve_resourc_068446_idx')],
+            },
+        ),
+    ]
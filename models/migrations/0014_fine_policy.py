@@ -0,0 +1,29 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0013_inventoryevent_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinePolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('member_type', models.CharField(blank=True, choices=[('', 'Default (all other members)'), ('student', 'Student'), ('faculty', 'Faculty'), ('staff', 'Staff'), ('external', 'External')], max_length=20, unique=True)),
+                ('daily_rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('grace_days', models.PositiveIntegerField(default=0)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Cap per loan; empty for no cap', max_digits=10, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Fine policies',
+                'ordering': ['member_type'],
+            },
+        ),
+    ]
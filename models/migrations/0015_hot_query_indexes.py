@@ -0,0 +1,49 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0014_fine_policy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(fields=['is_paid', 'amount'], name='fine_paid_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='overduebook',
+            index=models.Index(condition=models.Q(('is_recovered', False)), fields=['-days_overdue'], name='overdue_open_days_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(condition=models.Q(('available_quantity__gt', 0), ('status', 'available')), fields=['title'], name='resource_available_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(condition=models.Q(('available_quantity__gt', 0), ('status', 'available')), fields=['-created_at'], name='resource_available_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'due_date'], name='txn_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['member', 'status'], name='txn_member_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-checkout_date'], name='txn_checkout_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(condition=models.Q(('is_banned', False), ('is_verified', True)), fields=['-rating_avg', '-view_count'], name='userbook_listed_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(condition=models.Q(('is_banned', False), ('is_verified', True)), fields=['-created_at'], name='userbook_listed_new_idx'),
+        ),
+    ]
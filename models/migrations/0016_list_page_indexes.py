@@ -0,0 +1,49 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userbook',
+            name='userbook_listed_new_idx',
+        ),
+        migrations.AddIndex(
+            model_name='anonymoususer',
+            index=models.Index(fields=['-last_activity'], name='anonuser_last_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['-created_at'], name='member_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['is_active'], name='member_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['-created_at'], name='resource_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['available_quantity'], name='resource_available_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userauthentication',
+            index=models.Index(fields=['-created_at'], name='userauth_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(condition=models.Q(('is_banned', False), ('is_verified', True)), fields=['-created_at', 'is_banned', 'is_verified'], name='userbook_listed_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(condition=models.Q(('is_banned', False), ('is_verified', False)), fields=['created_at', 'is_banned', 'is_verified'], name='userbook_pending_idx'),
+        ),
+    ]
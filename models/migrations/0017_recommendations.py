@@ -0,0 +1,30 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0016_list_page_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRecommendation',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='models.userbook')),
+                ('neighbors', models.JSONField(blank=True, default=list, help_text='Listed books reviewed by the same readers, best first')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceRecommendation',
+            fields=[
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='models.resource')),
+                ('neighbors', models.JSONField(blank=True, default=list, help_text='Resources borrowed by the same members, best first')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0017_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('book', 'Digital book'), ('resource', 'Library resource')], max_length=10)),
+                ('item_id', models.IntegerField()),
+                ('event', models.CharField(choices=[('view', 'View'), ('download', 'Download'), ('review', 'Review'), ('borrow', 'Borrow')], max_length=10)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], default='hour', max_length=4)),
+                ('start', models.DateTimeField(help_text='Start of the hour or day counted')),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-start'],
+                'indexes': [models.Index(fields=['period', 'start'], name='activity_period_start_idx')],
+                'unique_together': {('item_type', 'item_id', 'event', 'period', 'start')},
+            },
+        ),
+    ]
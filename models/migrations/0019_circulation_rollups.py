@@ -0,0 +1,36 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0018_activity_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('member_type', models.CharField(blank=True, help_text='Empty for uploads and unknown members', max_length=20)),
+                ('department', models.CharField(blank=True, max_length=100)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdues', models.PositiveIntegerField(default=0, help_text='Loans due this day and not returned on time')),
+                ('fines_imposed', models.PositiveIntegerField(default=0)),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('fines_paid', models.PositiveIntegerField(default=0)),
+                ('fine_paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('uploads', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollups', to='models.category')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='rollup_day_idx')],
+            },
+        ),
+    ]
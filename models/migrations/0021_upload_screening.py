@@ -0,0 +1,36 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0020_moderation_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadScreening',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='screening', serialize=False, to='models.userbook')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('passed', 'Passed'), ('duplicate', 'Possible Duplicate'), ('rejected', 'Rejected')], default='pending', max_length=20)),
+                ('detected_format', models.CharField(blank=True, max_length=10)),
+                ('page_count', models.IntegerField(blank=True, null=True)),
+                ('sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('text_hash', models.BigIntegerField(blank=True, null=True)),
+                ('text_band_0', models.IntegerField(blank=True, null=True)),
+                ('text_band_1', models.IntegerField(blank=True, null=True)),
+                ('text_band_2', models.IntegerField(blank=True, null=True)),
+                ('text_band_3', models.IntegerField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('screened_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='models.userbook')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='screening_status_idx'), models.Index(fields=['text_band_0'], name='screening_band0_idx'), models.Index(fields=['text_band_1'], name='screening_band1_idx'), models.Index(fields=['text_band_2'], name='screening_band2_idx'), models.Index(fields=['text_band_3'], name='screening_band3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0021_upload_screening'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbook',
+            name='archive_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userbook',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userbook',
+            name='archived_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userbook',
+            name='storage_tier',
+            field=models.CharField(choices=[('hot', 'Local Disk'), ('archive', 'Archive')], default='hot', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(fields=['storage_tier', 'file_size', 'archived_size'], name='userbook_storage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbook',
+            index=models.Index(fields=['uploaded_by_user', 'file_size'], name='userbook_user_storage_idx'),
+        ),
+    ]
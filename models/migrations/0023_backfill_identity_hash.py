@@ -0,0 +1,43 @@
+# Generated by Django 6.0.3 on 2026-10-19 10:00
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def backfill_identity_hash(apps, schema_editor):
+    # Rows created before 0010 have no identity hash, so library-ID and
+    # credential logins never found them and created new accounts instead
+    from models.encryption import PrivacyEncryption
+
+    UserAuthentication = apps.get_model('models', 'UserAuthentication')
+    pending = UserAuthentication.objects.filter(identity_hash__isnull=True).only(
+        'id', 'auth_method', 'encrypted_library_id', 'encrypted_auth_data'
+    ).order_by('id')
+
+    last_id = 0
+    while rows := list(pending.filter(id__gt=last_id)[:BATCH_SIZE]):
+        last_id = rows[-1].id
+        hashed = []
+        for row in rows:
+            try:
+                row.identity_hash = PrivacyEncryption.stored_identity_hash(
+                    row.auth_method, row.encrypted_library_id, row.encrypted_auth_data
+                )
+            except ValueError:
+                # Not decryptable with the configured keyring; the key rotation job hashes it once the old key is added
+                continue
+            if row.identity_hash:
+                hashed.append(row)
+        UserAuthentication.objects.bulk_update(hashed, ['identity_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0022_storage_tiering'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_identity_hash, migrations.RunPython.noop),
+    ]
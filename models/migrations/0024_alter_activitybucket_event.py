@@ -0,0 +1,18 @@
+# Generated by Django 6.0.3 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0023_backfill_identity_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activitybucket',
+            name='event',
+            field=models.CharField(choices=[('view', 'View'), ('read', 'Read'), ('download', 'Download'), ('review', 'Review'), ('borrow', 'Borrow')], max_length=10),
+        ),
+    ]
@@ -26,6 +26,9 @@ class Resource(models.Model):
         ('lost', 'Lost'),
     ]
 
+    # Written by checkouts and returns (save(update_fields=STOCK_FIELDS))
+    STOCK_FIELDS = ['available_quantity', 'status', 'updated_at']
+
     title = models.CharField(max_length=255)
     resource_id = models.CharField(max_length=50, unique=True, help_text="ISBN or serial number")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='resources')
@@ -50,10 +53,31 @@ class Resource(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='resource_created_idx'),
+            # Low stock on the inventory dashboard
+            models.Index(fields=['available_quantity'], name='resource_available_qty_idx'),
+            # Borrowable resources (ResourceAvailability.available_queryset) as listed on the borrow and browse pages
+            models.Index(
+                fields=['title'], name='resource_available_title_idx',
+                condition=models.Q(available_quantity__gt=0, status='available'),
+            ),
+            models.Index(
+                fields=['-created_at'], name='resource_available_new_idx',
+                condition=models.Q(available_quantity__gt=0, status='available'),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.resource_id})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the signals forget the cached scan of a code that was edited
+        instance._loaded_code = instance.__dict__.get('resource_id')
+        return instance
+
     @property
     def is_available(self):
         return self.available_quantity > 0 and self.status == 'available'
@@ -90,6 +114,11 @@ class Member(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='member_created_idx'),
+            # Covers the active member count on the dashboards
+            models.Index(fields=['is_active'], name='member_active_idx', condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         if self.first_name and self.last_name:
@@ -97,6 +126,13 @@ class Member(models.Model):
         else:
             return f"Member {self.member_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the signals forget the cached scan of a code that was edited
+        instance._loaded_code = instance.__dict__.get('member_id')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.member_id:
             # Generate a unique member ID
@@ -147,22 +183,53 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ['-checkout_date']
+        indexes = [
+            # Open and overdue loans: dashboard counts, OverdueTracker and fine accrual
+            models.Index(fields=['status', 'due_date'], name='txn_status_due_idx'),
+            # A member's active loans (user dashboard, return page)
+            models.Index(fields=['member', 'status'], name='txn_member_status_idx'),
+            models.Index(fields=['-checkout_date'], name='txn_checkout_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.resource.title} - Member {self.member.member_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the live dashboard signals tell a return from any other save
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     @property
     def is_overdue(self):
         return self.status == 'active' and timezone.now().date() > self.due_date
 
     def mark_returned(self):
-        self.status = 'returned'
-        self.return_date = timezone.now()
-        self.save()
-        
-        # Update resource availability
-        self.resource.available_quantity += 1
-        self.resource.save()
+        from django.db import transaction
+        from .fines import FineAccrual
+        from .inventory import InventoryLedger
+
+        with transaction.atomic():
+            # Settle the fine up to today before the loan stops accruing
+            FineAccrual.accrue(Transaction.objects.filter(id=self.id))
+
+            self.status = 'returned'
+            self.return_date = timezone.now()
+            self.save()
+
+            # Increment in the database: a read-modify-write here would race the
+            # conditional decrement of a concurrent checkout
+            Resource.objects.filter(pk=self.resource_id).update(
+                available_quantity=models.F('available_quantity') + 1
+            )
+            # The update holds the row lock until commit, so the refreshed copy stays current
+            self.resource.refresh_from_db()
+            if self.resource.available_quantity == 1 and self.resource.status == 'unavailable':
+                # Marked unavailable when the last copy went out
+                self.resource.status = 'available'
+            self.resource.save(update_fields=Resource.STOCK_FIELDS)
+            InventoryLedger.record(self.resource, 'return', delta_available=1, transaction=self)
 
 
 class StockLog(models.Model):
@@ -190,6 +257,57 @@ class StockLog(models.Model):
         return f"{self.resource.title} - {self.action} ({self.quantity})"
 
 
+class InventoryEvent(models.Model):
+    """Append-only ledger of every change to a resource's stock and availability"""
+    EVENT_CHOICES = [
+        ('stock', 'Stock change'),
+        ('checkout', 'Checkout'),
+        ('return', 'Return'),
+        ('adjust', 'Adjustment'),
+    ]
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='inventory_events')
+    event_type = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    delta_total = models.IntegerField(default=0)
+    delta_available = models.IntegerField(default=0)
+    
+    # Source of the event, when there is one
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_events')
+    stock_log = models.OneToOneField(StockLog, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_event')
+    note = models.CharField(max_length=255, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['resource', 'id']),
+            models.Index(fields=['resource', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_id} {self.event_type} ({self.delta_total:+d}/{self.delta_available:+d})"
+
+
+class InventorySnapshot(models.Model):
+    """Ledger balance of a resource up to and including last_event_id"""
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    last_event_id = models.BigIntegerField()
+    total_quantity = models.IntegerField()
+    available_quantity = models.IntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-last_event_id']
+        indexes = [
+            models.Index(fields=['resource', 'last_event_id']),
+            models.Index(fields=['resource', 'taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_id} @ {self.last_event_id}: {self.available_quantity}/{self.total_quantity}"
+
+
 # ========== USER-SIDE MODELS ==========
 
 class AnonymousUser(models.Model):
@@ -209,6 +327,7 @@ class AnonymousUser(models.Model):
         indexes = [
             models.Index(fields=['user_id']),
             models.Index(fields=['is_active', 'last_activity']),
+            models.Index(fields=['-last_activity'], name='anonuser_last_activity_idx'),
         ]
     
     def __str__(self):
@@ -234,6 +353,10 @@ class UserAuthentication(models.Model):
     encrypted_library_id = models.CharField(max_length=1024, unique=True, null=True, blank=True)
     encrypted_auth_data = models.CharField(max_length=1024, unique=True, null=True, blank=True)
     
+    # Keyed hash of the identity for indexed lookups, and salted KDF password verifier
+    identity_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    password_verifier = models.CharField(max_length=255, blank=True)
+    
     auth_method = models.CharField(max_length=20, choices=AUTH_METHODS)
     username = models.CharField(max_length=100, unique=True, null=True, blank=True)
     
@@ -253,12 +376,85 @@ class UserAuthentication(models.Model):
         indexes = [
             models.Index(fields=['is_active']),
             models.Index(fields=['is_banned']),
+            models.Index(fields=['-created_at'], name='userauth_created_idx'),
         ]
     
     def __str__(self):
         return f"User Auth - Method: {self.auth_method}"
 
 
+class KeyRotationJob(models.Model):
+    """Progress of re-encrypting UserAuthentication rows under the primary key"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    batch_size = models.IntegerField(default=500)
+    throttle_seconds = models.FloatField(default=0.1, help_text="Pause between batches to leave room for foreground writes")
+    
+    # Progress - rows are processed in primary key order
+    last_processed_id = models.BigIntegerField(default=0)
+    rows_total = models.IntegerField(default=0)
+    rows_processed = models.IntegerField(default=0)
+    rows_rotated = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Key rotation #{self.id} - {self.status} ({self.rows_processed}/{self.rows_total})"
+    
+    @property
+    def progress_percent(self):
+        if not self.rows_total:
+            return 100 if self.status == 'completed' else 0
+        return round(100 * self.rows_processed / self.rows_total, 1)
+
+
+class LabelSheetJob(models.Model):
+    """Background generation of printable QR label sheets for resources"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Selection - all resources when neither is set
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    resource_ids = models.JSONField(default=list, blank=True, help_text="Primary keys of the resources to label")
+    per_copy = models.BooleanField(default=False, help_text="One label per copy (total quantity) instead of per title")
+    
+    labels_total = models.IntegerField(default=0)
+    labels_done = models.IntegerField(default=0)
+    file = models.FileField(upload_to='labels/', blank=True)
+    error = models.TextField(blank=True)
+    
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Label sheet #{self.id} - {self.status} ({self.labels_done}/{self.labels_total})"
+
+
 class UserBook(models.Model):
     """Digital books uploaded by users"""
     BOOK_FORMAT_CHOICES = [
@@ -291,6 +487,20 @@ class UserBook(models.Model):
     is_verified = models.BooleanField(default=False, help_text="Admin verification status")
     is_banned = models.BooleanField(default=False, help_text="Banned by admin")
     ban_reason = models.TextField(blank=True)
+
+    # Moderation queue lease
+    claimed_by = models.CharField(max_length=150, blank=True, default='')
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    # Storage tier: rarely read files move to the compressed archive and are recalled on access
+    STORAGE_TIER_CHOICES = [
+        ('hot', 'Local Disk'),
+        ('archive', 'Archive'),
+    ]
+    storage_tier = models.CharField(max_length=10, choices=STORAGE_TIER_CHOICES, default='hot')
+    archive_name = models.CharField(max_length=255, blank=True)
+    archived_size = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(null=True, blank=True)
     
     # Stats
     download_count = models.IntegerField(default=0)
@@ -307,10 +517,34 @@ class UserBook(models.Model):
             models.Index(fields=['is_banned']),
             models.Index(fields=['rating_avg']),
             models.Index(fields=['-created_at']),
+            # Listed books (verified, not banned): featured and latest on the home and browse pages
+            models.Index(
+                fields=['-rating_avg', '-view_count'], name='userbook_listed_rating_idx',
+                condition=models.Q(is_banned=False, is_verified=True),
+            ),
+            # The trailing flags make it covering for the listed and pending counts
+            models.Index(
+                fields=['-created_at', 'is_banned', 'is_verified'], name='userbook_listed_new_idx',
+                condition=models.Q(is_banned=False, is_verified=True),
+            ),
+            models.Index(
+                fields=['created_at', 'is_banned', 'is_verified'], name='userbook_pending_idx',
+                condition=models.Q(is_banned=False, is_verified=False),
+            ),
+            # Covering for the storage usage totals checked on every upload
+            models.Index(fields=['storage_tier', 'file_size', 'archived_size'], name='userbook_storage_idx'),
+            models.Index(fields=['uploaded_by_user', 'file_size'], name='userbook_user_storage_idx'),
         ]
     
     def __str__(self):
         return f"{self.title} by {self.author or 'Unknown'}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the live dashboard signals tell when a pending book is reviewed
+        instance._loaded_pending = instance.__dict__.get('is_verified') is False and instance.__dict__.get('is_banned') is False
+        return instance
     
     def increment_view_count(self):
         self.view_count += 1
@@ -321,6 +555,72 @@ class UserBook(models.Model):
         self.save(update_fields=['download_count'])
 
 
+class BookContentPage(models.Model):
+    """Extracted text of one PDF page or EPUB chapter, mirrored into a full-text index"""
+    book = models.ForeignKey(UserBook, on_delete=models.CASCADE, related_name='content_pages')
+    page_number = models.IntegerField()
+    text = models.TextField()
+    
+    class Meta:
+        ordering = ['book', 'page_number']
+        unique_together = ['book', 'page_number']
+    
+    def __str__(self):
+        return f"{self.book.title} - page {self.page_number}"
+
+
+class BookContentIndex(models.Model):
+    """Indexing state per book, used to re-index only new or replaced files"""
+    book = models.OneToOneField(UserBook, on_delete=models.CASCADE, related_name='content_index')
+    source = models.CharField(max_length=255, help_text="File name the index was built from")
+    page_count = models.IntegerField(default=0)
+    indexed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Content index - {self.book.title} ({self.page_count} pages)"
+
+
+class UploadScreening(models.Model):
+    """Automated checks of an uploaded book file, run before it reaches moderators"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('passed', 'Passed'),
+        ('duplicate', 'Possible Duplicate'),
+        ('rejected', 'Rejected'),
+    ]
+
+    book = models.OneToOneField(UserBook, on_delete=models.CASCADE, primary_key=True, related_name='screening')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    detected_format = models.CharField(max_length=10, blank=True)
+    page_count = models.IntegerField(null=True, blank=True)
+
+    # Exact (file) and near-duplicate (first page text SimHash) fingerprints
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    text_hash = models.BigIntegerField(null=True, blank=True)
+    # 16-bit slices of text_hash: hashes within 3 bits of each other share at least one
+    text_band_0 = models.IntegerField(null=True, blank=True)
+    text_band_1 = models.IntegerField(null=True, blank=True)
+    text_band_2 = models.IntegerField(null=True, blank=True)
+    text_band_3 = models.IntegerField(null=True, blank=True)
+    duplicate_of = models.ForeignKey(UserBook, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    notes = models.TextField(blank=True)
+    screened_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='screening_status_idx'),
+            models.Index(fields=['text_band_0'], name='screening_band0_idx'),
+            models.Index(fields=['text_band_1'], name='screening_band1_idx'),
+            models.Index(fields=['text_band_2'], name='screening_band2_idx'),
+            models.Index(fields=['text_band_3'], name='screening_band3_idx'),
+        ]
+
+    def __str__(self):
+        return f"Screening - {self.book.title}: {self.status}"
+
+
 class UserReview(models.Model):
     """Reviews left by anonymous users on digital books"""
     book = models.ForeignKey(UserBook, on_delete=models.CASCADE, related_name='reviews')
@@ -343,6 +643,89 @@ class UserReview(models.Model):
         return f"Review of {self.book.title} - {self.rating} stars"
 
 
+class BookRecommendation(models.Model):
+    """Precomputed "readers also liked" neighbours of a digital book"""
+    book = models.OneToOneField(UserBook, on_delete=models.CASCADE, primary_key=True, related_name='recommendation')
+    neighbors = models.JSONField(default=list, blank=True, help_text="Listed books reviewed by the same readers, best first")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendations for {self.book.title} ({len(self.neighbors)})"
+
+
+class ResourceRecommendation(models.Model):
+    """Precomputed "members also borrowed" neighbours of a library resource"""
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE, primary_key=True, related_name='recommendation')
+    neighbors = models.JSONField(default=list, blank=True, help_text="Resources borrowed by the same members, best first")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendations for {self.resource.title} ({len(self.neighbors)})"
+
+
+class ActivityBucket(models.Model):
+    """Event counts of one book or resource per hour (per day once compacted), for trending scores"""
+    ITEM_TYPES = [
+        ('book', 'Digital book'),
+        ('resource', 'Library resource'),
+    ]
+    EVENT_CHOICES = [
+        ('view', 'View'),
+        ('read', 'Read'),
+        ('download', 'Download'),
+        ('review', 'Review'),
+        ('borrow', 'Borrow'),
+    ]
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    
+    item_type = models.CharField(max_length=10, choices=ITEM_TYPES)
+    item_id = models.IntegerField()
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES, default='hour')
+    start = models.DateTimeField(help_text="Start of the hour or day counted")
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-start']
+        unique_together = ['item_type', 'item_id', 'event', 'period', 'start']
+        indexes = [
+            # Scoring window, compaction and retention all select by period and age
+            models.Index(fields=['period', 'start'], name='activity_period_start_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.item_type} #{self.item_id} {self.event} x{self.count} ({self.period} of {self.start})"
+
+
+class CirculationRollup(models.Model):
+    """Daily circulation totals per category, member type and department, for reporting"""
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='rollups')
+    member_type = models.CharField(max_length=20, blank=True, help_text="Empty for uploads and unknown members")
+    department = models.CharField(max_length=100, blank=True)
+    
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    overdues = models.PositiveIntegerField(default=0, help_text="Loans due this day and not returned on time")
+    fines_imposed = models.PositiveIntegerField(default=0)
+    fine_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fines_paid = models.PositiveIntegerField(default=0)
+    fine_paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    uploads = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day'], name='rollup_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Rollup {self.day} - {self.category or 'Uncategorized'} / {self.member_type or '-'} / {self.department or '-'}"
+
+
 class UserBan(models.Model):
     """Track banned users for moderation purposes"""
     BAN_REASONS = [
@@ -398,12 +781,38 @@ class Fine(models.Model):
         indexes = [
             models.Index(fields=['is_paid']),
             models.Index(fields=['member']),
+            # Covers the unpaid total and count on the admin dashboards
+            models.Index(fields=['is_paid', 'amount'], name='fine_paid_amount_idx'),
         ]
     
     def __str__(self):
         return f"Fine - {self.member.member_id}: Rs. {self.amount}"
 
 
+class FinePolicy(models.Model):
+    """Overdue fine rules per member type; the blank member type applies to everyone else"""
+    member_type = models.CharField(max_length=20, unique=True, blank=True, choices=[
+        ('', 'Default (all other members)'),
+        ('student', 'Student'),
+        ('faculty', 'Faculty'),
+        ('staff', 'Staff'),
+        ('external', 'External'),
+    ])
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    grace_days = models.PositiveIntegerField(default=0)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text='Cap per loan; empty for no cap')
+    is_active = models.BooleanField(default=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['member_type']
+        verbose_name_plural = 'Fine policies'
+    
+    def __str__(self):
+        return f"{self.get_member_type_display()}: Rs. {self.daily_rate}/day"
+
+
 class OverdueBook(models.Model):
     """Track overdue books - moved here after 30+ days, unencrypted for admin viewing"""
     # Unencrypted user info (only for overdue items)
@@ -437,6 +846,9 @@ class OverdueBook(models.Model):
         indexes = [
             models.Index(fields=['is_recovered']),
             models.Index(fields=['-days_overdue']),
+            models.Index(
+                fields=['-days_overdue'], name='overdue_open_days_idx', condition=models.Q(is_recovered=False)
+            ),
         ]
     
     def __str__(self):
@@ -0,0 +1,130 @@
+"""
+Moderation queue for uploaded books.
+Moderators lease batches of pending books so several can work the queue
+without reviewing the same upload twice; leases expire on their own if a
+moderator walks away. Verify, ban and release act on a whole selection with
+a single UPDATE.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache_utils import CatalogCache
+from .live_events import LiveEventBus
+from .models import BookContentPage, UserBook
+
+
+class ModerationQueue:
+    """Lease, review and release pending uploads"""
+
+    LEASE_MINUTES = 10
+    BATCH_SIZE = 25
+    MAX_BATCH = 200
+    EXCERPT_CHARS = 400
+
+    # Action -> fields set on the selected books
+    ACTIONS = {
+        'verify': {'is_verified': True},
+        'ban': {'is_banned': True},
+        'release': {},
+    }
+
+    @staticmethod
+    def pending():
+        """Unreviewed books, once the automated screening has looked at them"""
+        return UserBook.objects.filter(is_verified=False, is_banned=False).exclude(screening__status='pending')
+
+    @staticmethod
+    def _claimable(moderator, now):
+        """Unclaimed, lease expired, or already held by this moderator"""
+        return Q(claimed_until__isnull=True) | Q(claimed_until__lt=now) | Q(claimed_by=moderator)
+
+    @staticmethod
+    def claim(moderator, count=BATCH_SIZE, held=()):
+        """
+        Renew the lease on the held books and lease up to count more, oldest first.
+        Returns: (QuerySet of newly claimed books with review metadata, lease expiry)
+        """
+        now = timezone.now()
+        until = now + timedelta(minutes=ModerationQueue.LEASE_MINUTES)
+        count = max(0, min(count, ModerationQueue.MAX_BATCH))
+        held = list(held)
+
+        with transaction.atomic():
+            if held:
+                ModerationQueue.pending().filter(id__in=held, claimed_by=moderator).update(claimed_until=until)
+            if count:
+                # The claimable filter is repeated on the UPDATE itself so a concurrent claim cannot be overwritten
+                claimable = ModerationQueue.pending().filter(ModerationQueue._claimable(moderator, now)).exclude(id__in=held)
+                oldest = claimable.order_by('created_at', 'id').values('id')[:count]
+                claimable.filter(id__in=oldest).update(claimed_by=moderator, claimed_until=until)
+
+        if not count:
+            return UserBook.objects.none(), until
+
+        books = ModerationQueue.pending().filter(
+            claimed_by=moderator, claimed_until=until
+        ).exclude(id__in=held).select_related(
+            'category', 'content_index', 'screening__duplicate_of'
+        ).prefetch_related(
+            Prefetch('content_pages', queryset=BookContentPage.objects.filter(page_number=1), to_attr='first_pages')
+        ).order_by('created_at', 'id')
+        return books, until
+
+    @staticmethod
+    def apply(moderator, book_ids, action, reason=''):
+        """
+        Verify, ban or release the given books in one UPDATE. Books leased to
+        another moderator or no longer pending are skipped.
+        Returns: number of books updated
+        """
+        fields = dict(ModerationQueue.ACTIONS[action])
+        if action == 'ban':
+            fields['ban_reason'] = reason
+
+        with transaction.atomic():
+            updated = ModerationQueue.pending().filter(
+                ModerationQueue._claimable(moderator, timezone.now()), id__in=list(book_ids)
+            ).update(claimed_by='', claimed_until=None, **fields)
+
+            if updated and action != 'release':
+                # A queryset update bypasses the model signals
+                CatalogCache.invalidate(CatalogCache.BOOKS)
+                verdict = 'verified' if action == 'verify' else 'banned'
+                transaction.on_commit(lambda: LiveEventBus.publish('books_reviewed', count=updated, verdict=verdict))
+        return updated
+
+    @staticmethod
+    def describe(book):
+        """
+        Review card data for a claimed book.
+        Returns: dict
+        """
+        first_pages = getattr(book, 'first_pages', None) or []
+        # Not indexed yet: the reverse one-to-one raises, which getattr turns into None
+        content_index = getattr(book, 'content_index', None)
+        screening = getattr(book, 'screening', None)
+        duplicate = screening.duplicate_of if screening else None
+        reader = 'user_read_pdf' if book.format == 'pdf' else 'user_read_epub'
+        return {
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'format': book.format,
+            'category': book.category.name if book.category else '',
+            'publisher': book.publisher,
+            'publication_year': book.publication_year,
+            'description': book.description[:ModerationQueue.EXCERPT_CHARS],
+            'file_size': book.file_size,
+            'pages': (screening and screening.page_count) or (content_index and content_index.page_count) or book.pages_count,
+            'excerpt': first_pages[0].text[:ModerationQueue.EXCERPT_CHARS] if first_pages else '',
+            'cover_url': book.cover_image.url if book.cover_image else None,
+            'read_url': reverse(reader, kwargs={'book_id': book.id}),
+            'uploaded_at': book.created_at.isoformat(),
+            'screening': screening.get_status_display() if screening else '',
+            'screening_notes': screening.notes if screening else '',
+            'duplicate_of': {'id': duplicate.id, 'title': duplicate.title} if duplicate else None,
+        }
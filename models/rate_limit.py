@@ -0,0 +1,123 @@
+"""
+Token-bucket rate limiting for login endpoints.
+Buckets live in the Django cache (locmem or Redis) and are checked before
+any decryption or database work: one per client IP, shared by every login
+method, and one per login method and submitted identity.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .user_utils import UserSessionManager
+
+
+class LoginRateLimiter:
+    """Per-IP and per-identity token buckets, identity limits tunable per login method"""
+
+    # (burst capacity, tokens refilled per minute); overridden by settings.LOGIN_IP_RATE_LIMIT
+    # and settings.LOGIN_RATE_LIMITS
+    DEFAULT_IP_LIMIT = (20, 10)
+    DEFAULT_LIMITS = {
+        'default': {'identity': (5, 2)},
+    }
+
+    SCOPES = ('ip', 'identity')
+    BUCKET_KEY = 'ratelimit:{method}:{scope}:{digest}'
+    SHARED_METHOD = 'any'
+    METRIC_KEY = 'ratelimit:metrics:{method}:{name}'
+
+    @staticmethod
+    def get_limits(method):
+        """Bucket settings for a login method, falling back to 'default'"""
+        limits = getattr(settings, 'LOGIN_RATE_LIMITS', LoginRateLimiter.DEFAULT_LIMITS)
+        return limits.get(method) or limits.get('default') or LoginRateLimiter.DEFAULT_LIMITS['default']
+
+    @staticmethod
+    def check(request, method, identity=None):
+        """
+        Consume one token from the IP bucket and, if given, the identity bucket.
+        Returns: (allowed, retry_after_seconds)
+        """
+        limits = LoginRateLimiter.get_limits(method)
+        LoginRateLimiter._incr_metric(method, 'attempts')
+
+        # Switching login methods must not multiply an address's budget
+        ip = UserSessionManager._get_client_ip(request) or 'unknown'
+        buckets = [(
+            'ip', LoginRateLimiter._bucket_key(LoginRateLimiter.SHARED_METHOD, 'ip', ip),
+            getattr(settings, 'LOGIN_IP_RATE_LIMIT', LoginRateLimiter.DEFAULT_IP_LIMIT),
+        )]
+        if identity and 'identity' in limits:
+            buckets.append((
+                'identity', LoginRateLimiter._bucket_key(method, 'identity', identity.strip().lower()),
+                limits['identity'],
+            ))
+
+        for scope, key, (capacity, per_minute) in buckets:
+            allowed, retry_after = LoginRateLimiter._consume(key, capacity, per_minute / 60.0)
+            if not allowed:
+                LoginRateLimiter._incr_metric(method, 'throttled')
+                LoginRateLimiter._incr_metric(method, f'throttled_{scope}')
+                return False, math.ceil(retry_after)
+
+        return True, 0
+
+    @staticmethod
+    def _bucket_key(method, scope, value):
+        # Hash identities so usernames, phones and IDs never appear in cache keys
+        digest = hashlib.sha256(value.encode()).hexdigest()[:32]
+        return LoginRateLimiter.BUCKET_KEY.format(method=method, scope=scope, digest=digest)
+
+    @staticmethod
+    def _consume(key, capacity, refill_rate):
+        """
+        Refill the bucket for the time elapsed, then take one token.
+        Returns: (allowed, seconds until a token is available)
+        """
+        now = time.time()
+        tokens, updated = cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+        # A bucket idle long enough to refill completely can be evicted
+        timeout = math.ceil(capacity / refill_rate) if refill_rate else None
+
+        if tokens < 1:
+            cache.set(key, (tokens, now), timeout)
+            return False, (1 - tokens) / refill_rate if refill_rate else float('inf')
+
+        cache.set(key, (tokens - 1, now), timeout)
+        return True, 0
+
+    @staticmethod
+    def _incr_metric(method, name):
+        key = LoginRateLimiter.METRIC_KEY.format(method=method, name=name)
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=None)
+
+    @staticmethod
+    def get_metrics(methods=None):
+        """
+        Attempt and throttle counters per login method.
+        Returns: dict of method -> {metric name: count}
+        """
+        limits = getattr(settings, 'LOGIN_RATE_LIMITS', LoginRateLimiter.DEFAULT_LIMITS)
+        methods = methods or [method for method in limits if method != 'default']
+        names = ['attempts', 'throttled'] + [f'throttled_{scope}' for scope in LoginRateLimiter.SCOPES]
+
+        keys = {
+            LoginRateLimiter.METRIC_KEY.format(method=method, name=name): (method, name)
+            for method in methods
+            for name in names
+        }
+        values = cache.get_many(list(keys))
+
+        metrics = {method: {name: 0 for name in names} for method in methods}
+        for key, (method, name) in keys.items():
+            metrics[method][name] = values.get(key, 0)
+        return metrics
@@ -0,0 +1,153 @@
+"""
+"Readers also liked" recommendations.
+Item-to-item co-occurrence over who read what: digital books reviewed by the
+same reader and library resources borrowed by the same member. A periodic task
+computes the top neighbours of each item and stores them on the item's
+recommendation row, so a detail page shows them with one primary-key read.
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import BookRecommendation, Resource, ResourceRecommendation, Transaction, UserBook, UserReview
+
+
+class CoOccurrenceRecommender:
+    """Compute and store item-to-item neighbours"""
+
+    TOP_K = 8
+    BATCH_SIZE = 500  # items per co-occurrence pass
+    # Readers with very long histories co-occur with everything and say little about any pair
+    MAX_USER_ITEMS = 500
+
+    WATERMARK_KEY = 'recommendations:watermark:{}'
+
+    @staticmethod
+    def _sources():
+        """
+        Per kind: (interactions, user field, item field, recommendable items, row model).
+        Interactions are the (user, item) history; only recommendable items are stored as neighbours.
+        """
+        return {
+            'book': (
+                UserReview.objects.filter(user__isnull=False, is_flagged=False),
+                'user_id', 'book_id',
+                UserBook.objects.filter(is_banned=False, is_verified=True),
+                BookRecommendation,
+            ),
+            'resource': (
+                Transaction.objects.all(),
+                'member_id', 'resource_id',
+                Resource.objects.all(),
+                ResourceRecommendation,
+            ),
+        }
+
+    @staticmethod
+    def neighbors_for(item, kind='book'):
+        """
+        Stored neighbours of a book or resource (primary-key read). Neighbours banned,
+        unverified or deleted since the last refresh are dropped on the way out.
+        Returns: list of dicts with id, title, author and score
+        """
+        items, model = CoOccurrenceRecommender._sources()[kind][3:]
+        item_id = item if isinstance(item, int) else item.pk
+        neighbors = model.objects.filter(pk=item_id).values_list('neighbors', flat=True).first()
+        if not neighbors:
+            return []
+        listed = set(items.filter(id__in=[neighbor['id'] for neighbor in neighbors]).values_list('id', flat=True))
+        return [neighbor for neighbor in neighbors if neighbor['id'] in listed]
+
+    @staticmethod
+    def refresh(kind='book', full=False, batch_size=BATCH_SIZE):
+        """
+        Recompute neighbours of items whose readers have new activity since the
+        last run (every item on the first run, after a cache flush or with full=True).
+        Scores of items only linked through those readers' other items catch up
+        at the next full rebuild.
+        Returns: number of items written
+        """
+        interactions, user_field, item_field, items, model = CoOccurrenceRecommender._sources()[kind]
+        watermark_key = CoOccurrenceRecommender.WATERMARK_KEY.format(kind)
+
+        last_id = interactions.aggregate(last=Max('id'))['last'] or 0
+        watermark = None if full else cache.get(watermark_key)
+
+        if watermark is None:
+            dirty = set(interactions.values_list(item_field, flat=True).distinct())
+            # Rewrite stale rows too, e.g. of books whose only reviews were deleted
+            dirty.update(model.objects.values_list('pk', flat=True))
+        else:
+            active_users = interactions.filter(id__gt=watermark, id__lte=last_id).values(user_field)
+            dirty = set(
+                interactions.filter(**{f'{user_field}__in': active_users}).values_list(item_field, flat=True).distinct()
+            )
+
+        if dirty:
+            # Readers per item (the cosine denominator) and display data of recommendable items
+            popularity = dict(
+                interactions.order_by().values_list(item_field).annotate(readers=Count(user_field, distinct=True))
+            )
+            listed = {pk: (title, author) for pk, title, author in items.values_list('id', 'title', 'author')}
+
+            dirty = sorted(dirty)
+            for start in range(0, len(dirty), batch_size):
+                rows = CoOccurrenceRecommender._compute(
+                    dirty[start:start + batch_size], interactions, user_field, item_field, popularity, listed
+                )
+                model.objects.bulk_create(
+                    [model(pk=item_id, neighbors=neighbors) for item_id, neighbors in rows],
+                    update_conflicts=True,
+                    unique_fields=[model._meta.pk.name],
+                    update_fields=['neighbors', 'updated_at'],
+                )
+
+        cache.set(watermark_key, last_id, None)
+        return len(dirty)
+
+    @staticmethod
+    def _compute(chunk, interactions, user_field, item_field, popularity, listed):
+        """
+        Co-occurrence rows for a chunk of items, from the histories of everyone who read them.
+        Returns: list of (item id, neighbours)
+        """
+        chunk_ids = set(chunk)
+        readers = interactions.filter(**{f'{item_field}__in': chunk}).values(user_field)
+        histories = defaultdict(set)
+        for user_id, item_id in interactions.filter(**{f'{user_field}__in': readers}).values_list(
+            user_field, item_field
+        ).distinct():
+            histories[user_id].add(item_id)
+
+        co_counts = defaultdict(Counter)
+        for history in histories.values():
+            if len(history) > CoOccurrenceRecommender.MAX_USER_ITEMS:
+                continue
+            for item_id in history & chunk_ids:
+                co_counts[item_id].update(history)
+
+        rows = []
+        for item_id in chunk:
+            counts = co_counts.get(item_id, {})
+            item_readers = popularity.get(item_id, 0)
+            scored = []
+            for other_id, together in counts.items():
+                if other_id == item_id or other_id not in listed:
+                    continue
+                # Cosine similarity of the two items' reader sets
+                score = together / math.sqrt(item_readers * popularity[other_id])
+                scored.append((score, together, other_id))
+            scored.sort(key=lambda row: (-row[0], -row[1], row[2]))
+
+            rows.append((item_id, [
+                {
+                    'id': other_id,
+                    'title': listed[other_id][0],
+                    'author': listed[other_id][1],
+                    'score': round(score, 4),
+                }
+                for score, together, other_id in scored[:CoOccurrenceRecommender.TOP_K]
+            ]))
+        return rows
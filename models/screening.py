@@ -0,0 +1,248 @@
+"""
+Automated screening of uploaded book files.
+The upload form only sniffs the first bytes of the file. The rest runs in a
+background task on a small, fixed thread pool, so upload bursts queue up
+there instead of tying up web workers:
+structure validation with PyPDF2/ebooklib, a SHA-256 of the file and a
+SimHash of the first page text. Broken files are rejected (and banned);
+exact and near-duplicates are flagged for the moderators.
+"""
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .live_events import LiveEventBus
+from .models import UploadScreening, UserBook
+
+
+class ScreeningError(Exception):
+    """The file is not a readable book"""
+
+
+class UploadScreener:
+    """Validate, fingerprint and de-duplicate uploaded book files"""
+
+    WORKERS = 2
+    BATCH_SIZE = 20
+    LOCK_KEY = 'screening:lock'
+    LOCK_TIMEOUT = 600
+
+    HEAD_BYTES = 1024     # PDF allows junk before the %PDF- header within the first 1KB
+    READ_CHUNK = 1024 * 1024
+
+    # Near-duplicate detection on the first page text
+    SHINGLE_WORDS = 3
+    MIN_WORDS = 20
+    MAX_FIRST_PAGE_CHARS = 20000
+    MAX_DISTANCE = 3      # differing SimHash bits; must stay below the number of bands
+    BANDS = 4
+
+    @staticmethod
+    def sniff_format(upload):
+        """
+        Book format from the file's magic bytes; the read position is restored.
+        Returns: 'pdf', 'epub' or None
+        """
+        position = upload.tell()
+        upload.seek(0)
+        head = upload.read(UploadScreener.HEAD_BYTES)
+        upload.seek(position)
+
+        if b'%PDF-' in head:
+            return 'pdf'
+        # An EPUB is a ZIP whose first entry is the uncompressed "mimetype" file
+        if head.startswith(b'PK\x03\x04') and head[30:58] == b'mimetypeapplication/epub+zip':
+            return 'epub'
+        return None
+
+    @staticmethod
+    def simhash(text):
+        """
+        64-bit SimHash of word shingles, as a signed integer for BigIntegerField.
+        Returns: int, or None when there is too little text to compare
+        """
+        words = re.findall(r'\w+', text.lower())
+        if len(words) < UploadScreener.MIN_WORDS:
+            return None
+
+        weights = [0] * 64
+        for i in range(len(words) - UploadScreener.SHINGLE_WORDS + 1):
+            shingle = ' '.join(words[i:i + UploadScreener.SHINGLE_WORDS]).encode()
+            value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'big')
+            for bit in range(64):
+                weights[bit] += 1 if value >> bit & 1 else -1
+
+        unsigned = sum(1 << bit for bit in range(64) if weights[bit] > 0)
+        return unsigned - (1 << 63)
+
+    @staticmethod
+    def bands(text_hash):
+        """16-bit slices of a SimHash, used as indexed lookup keys"""
+        unsigned = text_hash + (1 << 63)
+        return [(unsigned >> (16 * band)) & 0xFFFF for band in range(UploadScreener.BANDS)]
+
+    @staticmethod
+    def distance(first, second):
+        return bin((first ^ second) & ((1 << 64) - 1)).count('1')
+
+    @staticmethod
+    def _first_page(book, path):
+        """
+        Validate the book structure.
+        Returns: (page count, first page text)
+        """
+        if book.format == 'pdf':
+            from PyPDF2 import PdfReader
+
+            reader = PdfReader(path)
+            if reader.is_encrypted:
+                raise ScreeningError('PDF is password protected.')
+            if not reader.pages:
+                raise ScreeningError('PDF has no pages.')
+            return len(reader.pages), reader.pages[0].extract_text() or ''
+
+        from ebooklib import epub
+
+        epub_book = epub.read_epub(path)
+        chapters = [epub_book.get_item_with_id(idref) for idref, _linear in epub_book.spine]
+        chapters = [item for item in chapters if item is not None]
+        if not chapters:
+            raise ScreeningError('EPUB has no readable chapters.')
+        for item in chapters:
+            text = ' '.join(strip_tags(item.get_content().decode('utf-8', errors='ignore')).split())
+            if text:
+                return len(chapters), text
+        return len(chapters), ''
+
+    @staticmethod
+    def inspect(book):
+        """
+        Check one book file. Touches only the file, so it is safe to run in a worker thread.
+        Returns: dict of findings, with 'error' set when the file must be rejected
+        """
+        findings = {'format': '', 'sha256': '', 'pages': None, 'text_hash': None, 'error': ''}
+        try:
+            digest = hashlib.sha256()
+            with book.file.open('rb') as handle:
+                findings['format'] = UploadScreener.sniff_format(handle) or ''
+                for chunk in iter(lambda: handle.read(UploadScreener.READ_CHUNK), b''):
+                    digest.update(chunk)
+            findings['sha256'] = digest.hexdigest()
+
+            if findings['format'] != book.format:
+                raise ScreeningError(f'File is not a {book.format.upper()}.')
+            pages, text = UploadScreener._first_page(book, book.file.path)
+            findings['pages'] = pages
+            findings['text_hash'] = UploadScreener.simhash(text[:UploadScreener.MAX_FIRST_PAGE_CHARS])
+        except ScreeningError as exc:
+            findings['error'] = str(exc)
+        except Exception as exc:
+            # Parser errors on corrupt files are as varied as the files
+            findings['error'] = f'Unreadable {book.format.upper()} file ({exc.__class__.__name__}).'
+        return findings
+
+    @staticmethod
+    def find_duplicate(book_id, sha256, text_hash):
+        """
+        Oldest screened book with the same file, else the closest one with near-identical first page text.
+        Returns: (UserBook or None, 'exact' or 'near')
+        """
+        screened = UploadScreening.objects.exclude(book_id=book_id).exclude(status__in=['pending', 'rejected'])
+
+        exact = screened.filter(sha256=sha256).select_related('book').order_by('created_at').first()
+        if exact:
+            return exact.book, 'exact'
+        if text_hash is None:
+            return None, ''
+
+        bands = Q()
+        for band, value in enumerate(UploadScreener.bands(text_hash)):
+            bands |= Q(**{f'text_band_{band}': value})
+        candidates = [
+            (UploadScreener.distance(text_hash, other_hash), created_at, other_id)
+            for other_id, other_hash, created_at in screened.filter(bands).values_list('book_id', 'text_hash', 'created_at')
+        ]
+        candidates = [candidate for candidate in candidates if candidate[0] <= UploadScreener.MAX_DISTANCE]
+        if not candidates:
+            return None, ''
+        return UserBook.objects.get(id=min(candidates)[2]), 'near'
+
+    @staticmethod
+    def record(screening, findings):
+        """
+        Store the findings; reject broken uploads and flag duplicates.
+        Returns: True when the upload was banned
+        """
+        screening.detected_format = findings['format']
+        screening.sha256 = findings['sha256']
+        screening.page_count = findings['pages']
+        screening.text_hash = findings['text_hash']
+        bands = UploadScreener.bands(findings['text_hash']) if findings['text_hash'] is not None else [None] * UploadScreener.BANDS
+        for band, value in enumerate(bands):
+            setattr(screening, f'text_band_{band}', value)
+        screening.screened_at = timezone.now()
+
+        if findings['error']:
+            screening.status = 'rejected'
+            screening.notes = findings['error']
+            # Books an admin already verified stay up; the rejection is left for them to review
+            banned = UserBook.objects.filter(id=screening.book_id, is_verified=False).update(
+                is_banned=True, ban_reason=f'Automatic screening: {findings["error"]}'
+            )
+        else:
+            banned = 0
+            duplicate, match = UploadScreener.find_duplicate(screening.book_id, findings['sha256'], findings['text_hash'])
+            screening.duplicate_of = duplicate
+            if duplicate:
+                screening.status = 'duplicate'
+                kind = 'Same file as' if match == 'exact' else 'First page matches'
+                screening.notes = f'{kind} "{duplicate.title}" (#{duplicate.id}).'
+            else:
+                screening.status = 'passed'
+                screening.notes = ''
+        screening.save()
+        return bool(banned)
+
+    @staticmethod
+    def screen_batch(limit=BATCH_SIZE):
+        """
+        Screen the oldest pending uploads, reading the files on WORKERS threads.
+        Returns: number of uploads screened
+        """
+        screenings = list(
+            UploadScreening.objects.filter(status='pending').select_related('book').order_by('created_at')[:limit]
+        )
+        with ThreadPoolExecutor(max_workers=UploadScreener.WORKERS) as pool:
+            results = list(pool.map(lambda screening: UploadScreener.inspect(screening.book), screenings))
+
+        # Recorded in upload order, so duplicates within the batch find each other
+        banned = sum(UploadScreener.record(screening, findings) for screening, findings in zip(screenings, results))
+        if banned:
+            LiveEventBus.publish('books_reviewed', count=banned, verdict='banned')
+        return len(screenings)
+
+    @staticmethod
+    def run_pending(max_seconds=50):
+        """
+        Screen pending uploads batch by batch until none are left or max_seconds have passed.
+        Only one run at a time, so bursts wait for the fixed pool instead of adding threads.
+        Returns: number of uploads screened
+        """
+        if not cache.add(UploadScreener.LOCK_KEY, True, UploadScreener.LOCK_TIMEOUT):
+            return 0
+        try:
+            deadline = time.monotonic() + max_seconds
+            total = 0
+            while True:
+                count = UploadScreener.screen_batch()
+                total += count
+                if count < UploadScreener.BATCH_SIZE or time.monotonic() >= deadline:
+                    return total
+        finally:
+            cache.delete(UploadScreener.LOCK_KEY)
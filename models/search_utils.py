@@ -0,0 +1,212 @@
+"""
+Full-text search over the contents of uploaded books.
+Text is extracted per PDF page or EPUB chapter into BookContentPage rows,
+which SQLite mirrors into an FTS5 index via triggers. Uploads and file
+replacements queue their book for indexing; the periodic index_book_contents
+task catches anything the queue missed.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.html import escape, strip_tags
+
+from .models import UserBook, BookContentPage, BookContentIndex
+
+
+class BookContentIndexer:
+    """Extract, index and search the text of user-uploaded books"""
+
+    FTS_TABLE = 'models_bookcontentpage_fts'
+    SNIPPET_TOKENS = 16
+
+    # Markers around matched terms in snippets; replaced after HTML escaping
+    _MATCH_START = '\x02'
+    _MATCH_END = '\x03'
+
+    @staticmethod
+    def extract_pages(book):
+        """
+        Extract text from a book file.
+        Returns: list of (page_number, text) - PDF pages or EPUB spine chapters
+        """
+        if book.format == 'pdf':
+            from PyPDF2 import PdfReader
+
+            reader = PdfReader(book.file.path)
+            return [
+                (number, page.extract_text() or '')
+                for number, page in enumerate(reader.pages, start=1)
+            ]
+
+        if book.format == 'epub':
+            from ebooklib import epub
+
+            epub_book = epub.read_epub(book.file.path)
+            pages = []
+            for idref, _linear in epub_book.spine:
+                item = epub_book.get_item_with_id(idref)
+                if item is None:
+                    continue
+                html = item.content.decode('utf-8', errors='ignore')
+                pages.append((len(pages) + 1, ' '.join(strip_tags(html).split())))
+            return pages
+
+        return []
+
+    @staticmethod
+    def index_book(book):
+        """
+        (Re)build the content index of a single book.
+        Returns: number of indexed pages
+        """
+        try:
+            pages = BookContentIndexer.extract_pages(book)
+        except Exception:
+            # Unreadable file: keep the book out of the index but remember the attempt
+            pages = []
+
+        with transaction.atomic():
+            BookContentPage.objects.filter(book=book).delete()
+            BookContentPage.objects.bulk_create(
+                [
+                    BookContentPage(book=book, page_number=number, text=text)
+                    for number, text in pages
+                    if text.strip()
+                ],
+                batch_size=500,
+            )
+            BookContentIndex.objects.update_or_create(
+                book=book,
+                defaults={'source': book.file.name, 'page_count': len(pages)},
+            )
+
+        return len(pages)
+
+    @staticmethod
+    def books_needing_index():
+        """Books never indexed or whose file has been replaced since the last run; archived files wait until recalled"""
+        return UserBook.objects.filter(
+            Q(content_index__isnull=True) | ~Q(content_index__source=F('file')), storage_tier='hot'
+        )
+
+    @staticmethod
+    def enqueue(book):
+        """Index a new or replaced book file as soon as the change is committed"""
+        from .tasks import index_book_content
+
+        def send():
+            try:
+                index_book_content.delay(book.id)
+            except Exception:
+                # Broker unavailable: the periodic index_book_contents run picks the book up
+                pass
+
+        transaction.on_commit(send)
+
+    @staticmethod
+    def index_pending_books(limit=None):
+        """
+        Incrementally index new and changed books.
+        Deleted books drop out of the index through the cascade on BookContentPage.
+        Returns: number of books indexed
+        """
+        books = BookContentIndexer.books_needing_index().order_by('id')
+        if limit:
+            books = books[:limit]
+
+        count = 0
+        for book in books:
+            BookContentIndexer.index_book(book)
+            count += 1
+        return count
+
+    @staticmethod
+    def _build_match_query(query):
+        """Quote each term so user input is never parsed as FTS5 syntax"""
+        terms = [term.replace('"', '""') for term in query.split()]
+        return ' '.join(f'"{term}"' for term in terms if term)
+
+    @staticmethod
+    def _highlight(snippet):
+        """HTML-escape a snippet and wrap matched terms in <mark>"""
+        return (
+            escape(snippet)
+            .replace(BookContentIndexer._MATCH_START, '<mark>')
+            .replace(BookContentIndexer._MATCH_END, '</mark>')
+        )
+
+    @staticmethod
+    def search(query, limit=20, book_id=None):
+        """
+        Search book contents for visible (verified, non-banned) books.
+        Returns: list of dicts with book_id, title, page_number and an HTML snippet
+        """
+        match = BookContentIndexer._build_match_query(query)
+        if not match:
+            return []
+
+        if connection.vendor != 'sqlite':
+            return BookContentIndexer._search_fallback(query, limit, book_id)
+
+        sql = f"""
+            SELECT p.book_id, b.title, p.page_number,
+                   snippet({BookContentIndexer.FTS_TABLE}, 0, %s, %s, '...', %s)
+            FROM {BookContentIndexer.FTS_TABLE}
+            JOIN models_bookcontentpage p ON p.id = {BookContentIndexer.FTS_TABLE}.rowid
+            JOIN models_userbook b ON b.id = p.book_id
+            WHERE {BookContentIndexer.FTS_TABLE} MATCH %s
+              AND b.is_verified = 1 AND b.is_banned = 0
+        """
+        params = [
+            BookContentIndexer._MATCH_START,
+            BookContentIndexer._MATCH_END,
+            BookContentIndexer.SNIPPET_TOKENS,
+            match,
+        ]
+        if book_id is not None:
+            sql += " AND p.book_id = %s"
+            params.append(book_id)
+        sql += f" ORDER BY bm25({BookContentIndexer.FTS_TABLE}) LIMIT %s"
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        return [
+            {
+                'book_id': book_id,
+                'title': title,
+                'page_number': page_number,
+                'snippet': BookContentIndexer._highlight(snippet),
+            }
+            for book_id, title, page_number, snippet in rows
+        ]
+
+    @staticmethod
+    def _search_fallback(query, limit, book_id=None):
+        """Plain substring search for databases without FTS5"""
+        pages = BookContentPage.objects.filter(
+            text__icontains=query,
+            book__is_verified=True,
+            book__is_banned=False,
+        ).select_related('book')
+        if book_id is not None:
+            pages = pages.filter(book_id=book_id)
+
+        results = []
+        for page in pages[:limit]:
+            position = page.text.lower().find(query.lower())
+            start = max(position - 60, 0)
+            end = position + len(query)
+            snippet = (
+                page.text[start:position]
+                + BookContentIndexer._MATCH_START + page.text[position:end] + BookContentIndexer._MATCH_END
+                + page.text[end:end + 60]
+            )
+            results.append({
+                'book_id': page.book_id,
+                'title': page.book.title,
+                'page_number': page.page_number,
+                'snippet': BookContentIndexer._highlight(snippet),
+            })
+        return results
@@ -0,0 +1,52 @@
+"""
+Session engine that keeps anonymous visitors out of the database.
+Sessions live only in the cache until they carry a login, after which they are
+written through to django_session like the cached_db engine.
+"""
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+
+class SessionStore(CachedDBStore):
+    """Cache-only sessions for anonymous visitors, promoted to the database on login"""
+
+    @classmethod
+    def persistent_keys(cls):
+        """Session keys that mark a logged-in (user or admin) session"""
+        return getattr(settings, 'SESSION_PERSISTENT_KEYS', ('user_auth_id', 'is_custom_admin', SESSION_KEY))
+
+    def is_persistent(self, session=None):
+        """True once the session holds a login and must survive cache eviction"""
+        session = self._get_session() if session is None else session
+        return any(key in session for key in self.persistent_keys())
+
+    def load(self):
+        data = super().load()
+        self._loaded_persistent = self.is_persistent(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        if self.is_persistent(data):
+            try:
+                return super().save(must_create)
+            except UpdateError:
+                # First save after login: the session only existed in the cache so far
+                return super().save(must_create=True)
+
+        if getattr(self, '_loaded_persistent', False):
+            # Logged out without flush(): drop the database copy so it cannot resurface
+            DBStore.delete(self, self.session_key)
+            self._loaded_persistent = False
+
+        if must_create:
+            if not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
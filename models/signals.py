@@ -0,0 +1,129 @@
+"""
+Model signal handlers.
+Invalidates cached catalog fragments when the underlying data changes
+and keeps the resource availability bitmap in step with checkouts and returns.
+Archived copies of deleted books are removed, and uploads,
+moderation, checkouts, returns and bans are pushed to live admin dashboards.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import UserBook, Resource, UserReview, Member, Transaction, UserBan
+from .cache_utils import CatalogCache
+from .availability import ResourceAvailability
+from .circulation import ScanLookup
+from .live_events import LiveEventBus
+from .storage import BookStorageManager
+
+
+# Counter bumps happen on every view/download; they may stay stale until the fragment expires
+COUNTER_FIELDS = {'view_count', 'download_count'}
+
+
+@receiver([post_save, post_delete], sender=UserBook)
+def invalidate_book_catalog(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    CatalogCache.invalidate(CatalogCache.BOOKS)
+
+
+@receiver([post_save, post_delete], sender=UserReview)
+def invalidate_review_catalog(sender, instance, **kwargs):
+    CatalogCache.invalidate(CatalogCache.BOOKS)
+
+
+def forget_scan_codes(instance, code):
+    """Forget the current code and, after an edit, the code the row was loaded with"""
+    ScanLookup.forget(code)
+    loaded_code = getattr(instance, '_loaded_code', None)
+    if loaded_code != code:
+        ScanLookup.forget(loaded_code)
+        instance._loaded_code = code
+
+
+@receiver([post_save, post_delete], sender=Resource)
+def invalidate_resource_catalog(sender, instance, update_fields=None, **kwargs):
+    # Checkouts and returns only move stock: the autocomplete candidates ignore stock, and
+    # listed counts may stay stale until the fragment expires, like book counters
+    if update_fields and set(update_fields) <= set(Resource.STOCK_FIELDS):
+        return
+    CatalogCache.invalidate(CatalogCache.RESOURCES)
+    forget_scan_codes(instance, instance.resource_id)
+
+
+@receiver([post_save, post_delete], sender=Member)
+def invalidate_member_catalog(sender, instance, **kwargs):
+    CatalogCache.invalidate(CatalogCache.MEMBERS)
+    forget_scan_codes(instance, instance.member_id)
+
+
+@receiver(post_save, sender=Resource)
+def update_resource_availability(sender, instance, **kwargs):
+    ResourceAvailability.update(instance.id, instance.is_available)
+
+
+@receiver(post_delete, sender=Resource)
+def remove_resource_availability(sender, instance, **kwargs):
+    ResourceAvailability.update(instance.id, False)
+
+
+@receiver(post_delete, sender=UserBook)
+def delete_archived_book_file(sender, instance, **kwargs):
+    # Views delete the disk copy themselves; the archive tier is only known here
+    BookStorageManager.delete_archive(instance)
+
+
+# ========== LIVE DASHBOARD EVENTS ==========
+
+def publish_on_commit(event_type, **data):
+    """Publish once the change is committed; rolled back changes are never shown"""
+    transaction.on_commit(lambda: LiveEventBus.publish(event_type, **data))
+
+
+@receiver(post_save, sender=UserBook)
+def publish_book_event(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    if created:
+        if not instance.is_verified and not instance.is_banned:
+            publish_on_commit('upload', book=instance.id, title=instance.title, format=instance.format)
+    elif getattr(instance, '_loaded_pending', False) and (instance.is_verified or instance.is_banned):
+        instance._loaded_pending = False
+        publish_on_commit(
+            'book_reviewed', book=instance.id, title=instance.title,
+            verdict='banned' if instance.is_banned else 'verified',
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def publish_loan_event(sender, instance, created, **kwargs):
+    loaded_status = getattr(instance, '_loaded_status', None)
+    returned = not created and instance.status == 'returned' and loaded_status not in (None, 'returned')
+    if not (created or returned):
+        return
+
+    loan = {
+        'transaction': instance.id,
+        'resource': instance.resource.title,
+        'member': instance.member.member_id,
+    }
+    if created:
+        publish_on_commit('checkout', due_date=instance.due_date.isoformat(), **loan)
+    else:
+        instance._loaded_status = 'returned'
+        publish_on_commit(
+            'return', was_status=loaded_status,
+            was_overdue=loaded_status == 'overdue' or instance.due_date < timezone.localdate(),
+            **loan,
+        )
+
+
+@receiver(post_save, sender=UserBan)
+def publish_ban_event(sender, instance, created, **kwargs):
+    if created:
+        publish_on_commit(
+            'ban', user=instance.user_auth_id, reason=instance.get_reason_display(),
+            permanent=instance.is_permanent,
+        )
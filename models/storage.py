@@ -0,0 +1,215 @@
+"""
+Storage quotas and tiering for uploaded books.
+Uploads are checked against a per-visitor and a library-wide quota. A daily
+task moves files nobody has read for USER_BOOKS_COLD_AFTER_DAYS into the
+gzip-compressed archive storage ('user_books_archive' in STORAGES); readers
+and downloads call ensure_hot, which recalls an archived file transparently
+before it is served. The library-wide quota counts local disk only, so
+archiving is what keeps disk growth bounded.
+"""
+import gzip
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db.models import Q, Sum
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from .epub_utils import EpubChapterCache
+from .models import ActivityBucket, UserBook
+
+
+class BookStorageManager:
+    """Enforce upload quotas and move book files between the disk and the archive"""
+
+    ARCHIVE_STORAGE = 'user_books_archive'
+    CHUNK_SIZE = 1024 * 1024
+    SPOOL_BYTES = 16 * 1024 * 1024  # compress in memory up to this size, then in a temporary file
+    ARCHIVE_BATCH = 200
+
+    RECALL_LOCK_KEY = 'storage:recall:{}'
+    RECALL_LOCK_TIMEOUT = 300
+    RECALL_WAIT_SECONDS = 30
+
+    @staticmethod
+    def _megabytes(value):
+        return value * 1024 * 1024
+
+    @staticmethod
+    def user_usage(anon_user):
+        """
+        Bytes uploaded by a visitor (every tier) and their quota.
+        Returns: (used bytes, quota bytes)
+        """
+        used = UserBook.objects.filter(uploaded_by_user=anon_user).aggregate(total=Sum('file_size'))['total'] or 0
+        return used, BookStorageManager._megabytes(settings.USER_BOOKS_USER_QUOTA_MB)
+
+    @staticmethod
+    def usage():
+        """
+        Library-wide totals; only the local disk tier counts towards the quota.
+        Returns: dict with 'hot', 'archived' (compressed) and 'quota' bytes and 'percent' of the quota used
+        """
+        totals = UserBook.objects.aggregate(
+            hot=Sum('file_size', filter=Q(storage_tier='hot')),
+            archived=Sum('archived_size', filter=Q(storage_tier='archive')),
+        )
+        quota = BookStorageManager._megabytes(settings.USER_BOOKS_TOTAL_QUOTA_MB)
+        hot = totals['hot'] or 0
+        return {
+            'hot': hot,
+            'archived': totals['archived'] or 0,
+            'quota': quota,
+            'percent': min(100, round(100 * hot / quota)) if quota else 0,
+        }
+
+    @staticmethod
+    def quota_error(anon_user, size):
+        """
+        Check an upload of size bytes against both quotas.
+        Returns: error message, or None when the upload fits
+        """
+        used, quota = BookStorageManager.user_usage(anon_user)
+        if used + size > quota:
+            return (
+                f'This upload would exceed your storage quota of {filesizeformat(quota)} '
+                f'({filesizeformat(used)} used). Delete some of your uploads first.'
+            )
+        usage = BookStorageManager.usage()
+        if usage['hot'] + size > usage['quota']:
+            return 'The library has run out of storage for uploads. Please try again later.'
+        return None
+
+    @staticmethod
+    def cold_books(now=None):
+        """
+        Books on local disk that are older than the cold period and were read
+        (viewed, opened in the reader or downloaded) at most USER_BOOKS_COLD_MAX_READS
+        times within it.
+        Books still awaiting moderation stay on disk.
+        Returns: QuerySet
+        """
+        # Activity comes from the trending buckets, kept for TrendingCounter.RETENTION_DAYS
+        cutoff = (now or timezone.now()) - timedelta(days=settings.USER_BOOKS_COLD_AFTER_DAYS)
+        warm = ActivityBucket.objects.filter(
+            item_type='book', event__in=['view', 'read', 'download'], start__gte=cutoff
+        ).values('item_id').annotate(reads=Sum('count')).filter(
+            reads__gt=settings.USER_BOOKS_COLD_MAX_READS
+        ).values('item_id')
+
+        return UserBook.objects.filter(storage_tier='hot', created_at__lt=cutoff).filter(
+            Q(is_verified=True) | Q(is_banned=True)
+        ).exclude(id__in=warm).exclude(file='')
+
+    @staticmethod
+    def archive(book):
+        """
+        Compress a book file into the archive storage and remove it from disk.
+        The archive copy is written before the row flips, and the disk copy is deleted only after.
+        Returns: True when the book was archived
+        """
+        archive_storage = storages[BookStorageManager.ARCHIVE_STORAGE]
+        with tempfile.SpooledTemporaryFile(max_size=BookStorageManager.SPOOL_BYTES) as buffer:
+            with book.file.open('rb') as source, gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as packed:
+                shutil.copyfileobj(source, packed, BookStorageManager.CHUNK_SIZE)
+            archived_size = buffer.tell()
+            buffer.seek(0)
+            archive_name = archive_storage.save(f'{book.file.name}.gz', File(buffer))
+
+        # A concurrent archive run or a replaced file leaves the row alone
+        updated = UserBook.objects.filter(id=book.id, storage_tier='hot', file=book.file.name).update(
+            storage_tier='archive', archive_name=archive_name, archived_size=archived_size, archived_at=timezone.now()
+        )
+        if not updated:
+            archive_storage.delete(archive_name)
+            return False
+
+        book.file.storage.delete(book.file.name)
+        # The unpacked chapters are another copy on disk
+        EpubChapterCache.invalidate(book)
+        return True
+
+    @staticmethod
+    def archive_cold_books(limit=ARCHIVE_BATCH, now=None):
+        """
+        Archive up to limit cold books, least read first.
+        Returns: (books archived, bytes freed on disk)
+        """
+        books = BookStorageManager.cold_books(now).order_by('download_count', 'view_count', 'id')[:limit]
+        archived = freed = 0
+        for book in books:
+            if BookStorageManager.archive(book):
+                archived += 1
+                freed += book.file_size
+        return archived, freed
+
+    @staticmethod
+    def recall(book):
+        """
+        Restore an archived book file to local disk. Concurrent requests for
+        the same book wait for the first one instead of writing the file twice.
+        Updates book in place.
+        """
+        lock = BookStorageManager.RECALL_LOCK_KEY.format(book.id)
+        deadline = time.monotonic() + BookStorageManager.RECALL_WAIT_SECONDS
+        while not cache.add(lock, True, BookStorageManager.RECALL_LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'Recall of book {book.id} is taking too long.')
+            time.sleep(0.2)
+
+        try:
+            current = UserBook.objects.filter(id=book.id).values('storage_tier', 'archive_name').first()
+            if current is None or current['storage_tier'] == 'hot':
+                # Recalled (or deleted) while this request waited for the lock
+                book.storage_tier = 'hot'
+                return
+
+            archive_storage = storages[BookStorageManager.ARCHIVE_STORAGE]
+            with tempfile.SpooledTemporaryFile(max_size=BookStorageManager.SPOOL_BYTES) as buffer:
+                with archive_storage.open(current['archive_name'], 'rb') as packed, gzip.GzipFile(fileobj=packed) as source:
+                    shutil.copyfileobj(source, buffer, BookStorageManager.CHUNK_SIZE)
+                buffer.seek(0)
+                name = book.file.storage.save(book.file.name, File(buffer))
+
+            UserBook.objects.filter(id=book.id).update(
+                file=name, storage_tier='hot', archive_name='', archived_size=0, archived_at=None
+            )
+            archive_storage.delete(current['archive_name'])
+            book.file.name = name
+            book.storage_tier = 'hot'
+            book.archive_name = ''
+            book.archived_size = 0
+            book.archived_at = None
+        finally:
+            cache.delete(lock)
+
+    @staticmethod
+    def ensure_hot(book):
+        """Recall the book's file first if it has been archived"""
+        if book.storage_tier == 'archive':
+            BookStorageManager.recall(book)
+
+    @staticmethod
+    def delete_archive(book):
+        """Drop the archived copy of a deleted book"""
+        if book.storage_tier == 'archive' and book.archive_name:
+            storages[BookStorageManager.ARCHIVE_STORAGE].delete(book.archive_name)
+
+    @staticmethod
+    def file_replaced(book):
+        """A new file was uploaded over an archived one: it is on disk, the archived copy is stale"""
+        if book.storage_tier == 'archive':
+            BookStorageManager.delete_archive(book)
+            UserBook.objects.filter(id=book.id).update(
+                storage_tier='hot', archive_name='', archived_size=0, archived_at=None
+            )
+            book.storage_tier = 'hot'
+            book.archive_name = ''
+            book.archived_size = 0
+            book.archived_at = None
@@ -5,6 +5,17 @@ Handles cleanup of expired sessions and overdue book tracking.
 from celery import shared_task
 from django.utils import timezone
 from .user_utils import OverdueTracker
+from .epub_utils import EpubChapterCache
+from .search_utils import BookContentIndexer
+from .key_rotation import KeyRotationManager
+from .labels import LabelSheetGenerator
+from .inventory import InventoryLedger
+from .fines import FineAccrual
+from .recommendations import CoOccurrenceRecommender
+from .trending import TrendingCounter
+from .analytics import AnalyticsRollup
+from .screening import UploadScreener
+from .storage import BookStorageManager
 
 
 @shared_task
@@ -35,3 +46,158 @@ def cleanup_expired_bans():
     """
     count = OverdueTracker.cleanup_expired_bans()
     return f"Cleaned up {count} expired bans"
+
+
+@shared_task
+def warm_epub_chapter_cache(book_id=None):
+    """
+    Unpack verified EPUB books into the chapter cache ahead of the first read.
+    Pass a book_id to warm a single book (e.g. right after an upload).
+    """
+    from .models import UserBook
+
+    # Archived books are unpacked again when a reader recalls them
+    books = UserBook.objects.filter(format='epub', is_banned=False, storage_tier='hot')
+    if book_id is not None:
+        books = books.filter(id=book_id)
+    else:
+        books = books.filter(is_verified=True)
+
+    count = 0
+    for book in books.iterator():
+        if EpubChapterCache.get_manifest(book):
+            count += 1
+
+    return f"Warmed EPUB chapter cache for {count} books"
+
+
+@shared_task
+def index_book_contents():
+    """
+    Extract and index the text of new or replaced book files for content search.
+    Run every few minutes based on Celery beat schedule.
+    """
+    count = BookContentIndexer.index_pending_books()
+    return f"Indexed contents of {count} books"
+
+
+@shared_task
+def index_book_content(book_id):
+    """
+    Index a single uploaded or replaced book file.
+    Queued by the upload and edit views; skips books that are already current.
+    """
+    book = BookContentIndexer.books_needing_index().filter(id=book_id).first()
+    if book is None:
+        return f"Book {book_id} needs no indexing"
+    pages = BookContentIndexer.index_book(book)
+    return f"Indexed {pages} pages of book {book_id}"
+
+
+@shared_task
+def rotate_encryption_keys(job_id=None, max_seconds=600):
+    """
+    Re-encrypt stored authentication data under the primary ENCRYPTION_KEY.
+    Starts a new job (or resumes the unfinished one) and re-queues itself every
+    max_seconds so a large table never blocks a worker for long.
+    """
+    from .models import KeyRotationJob
+
+    if job_id is None:
+        job = KeyRotationManager.start_job()
+    else:
+        job = KeyRotationJob.objects.get(id=job_id)
+
+    if KeyRotationManager.run_job(job, max_seconds=max_seconds):
+        return f"Key rotation #{job.id} completed: {job.rows_rotated} rows rotated, {job.rows_failed} failed"
+
+    # Timed out and handed back: the next delivery claims it again
+    if job.status == 'pending':
+        rotate_encryption_keys.delay(job.id, max_seconds=max_seconds)
+    return f"Key rotation #{job.id} {job.status} at {job.progress_percent}%"
+
+
+@shared_task
+def generate_label_sheets():
+    """
+    Render queued QR label sheet jobs into PDFs.
+    Run every minute based on Celery beat schedule.
+    """
+    count = LabelSheetGenerator.run_pending_jobs()
+    return f"Generated {count} label sheets"
+
+
+@shared_task
+def snapshot_inventory():
+    """
+    Fold inventory ledger events into snapshots for busy resources.
+    Run daily based on Celery beat schedule.
+    """
+    count = InventoryLedger.take_snapshots()
+    return f"Took {count} inventory snapshots"
+
+
+@shared_task
+def accrue_fines():
+    """
+    Bring the fines of all overdue loans up to date and copy them to OverdueBook.
+    Run nightly based on Celery beat schedule.
+    """
+    count = FineAccrual.accrue()
+    synced = FineAccrual.sync_overdue_books()
+    return f"Accrued {count} fines, updated {synced} overdue records"
+
+
+@shared_task
+def refresh_recommendations(full=False):
+    """
+    Update "readers also liked" neighbours of books and resources with new activity.
+    Run hourly based on Celery beat schedule, plus a nightly full rebuild.
+    """
+    books = CoOccurrenceRecommender.refresh('book', full=full)
+    resources = CoOccurrenceRecommender.refresh('resource', full=full)
+    return f"Refreshed recommendations for {books} books and {resources} resources"
+
+
+@shared_task
+def update_trending():
+    """
+    Compact old activity buckets and re-rank trending books and resources.
+    Run hourly based on Celery beat schedule.
+    """
+    compacted, deleted = TrendingCounter.compact()
+    ranked = TrendingCounter.update_rankings()
+    return (
+        f"Ranked {ranked['book']} books and {ranked['resource']} resources; "
+        f"compacted {compacted} hourly buckets, deleted {deleted} expired"
+    )
+
+
+@shared_task
+def rollup_analytics():
+    """
+    Re-aggregate the circulation rollups of recent days for reporting.
+    Run nightly based on Celery beat schedule.
+    """
+    count = AnalyticsRollup.refresh()
+    return f"Wrote {count} circulation rollup rows"
+
+
+@shared_task
+def screen_uploads():
+    """
+    Validate, fingerprint and de-duplicate newly uploaded book files.
+    Run every minute based on Celery beat schedule.
+    """
+    count = UploadScreener.run_pending()
+    return f"Screened {count} uploads"
+
+
+@shared_task
+def tier_user_books():
+    """
+    Move rarely read uploaded books from local disk to the archive storage.
+    Run daily based on Celery beat schedule.
+    """
+    archived, freed = BookStorageManager.archive_cold_books()
+    return f"Archived {archived} books, freeing {freed} bytes"
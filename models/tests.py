@@ -1,3 +1,1667 @@
-from django.test import TestCase
+import gzip
+import os
+import random
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+from PyPDF2 import PdfReader
+
+from . import admin_views
+from .analytics import AnalyticsRollup
+from .autocomplete import AutocompleteIndex
+from .availability import ResourceAvailability
+from .cache_utils import CatalogCache
+from .circulation import CirculationDesk, CirculationError, ScanLookup
+from .encryption import PrivacyEncryption, check_encryption_keys
+from .epub_utils import EpubChapterCache
+from .fines import FineAccrual
+from .forms import UserBookUploadForm
+from .key_rotation import KeyRotationManager
+from .inventory import InventoryLedger
+from .labels import LabelSheetGenerator
+from .live_events import LiveEventBus
+from .models import (
+    ActivityBucket, AnonymousUser, Category, CirculationRollup, Fine, FinePolicy, KeyRotationJob, LabelSheetJob, Member,
+    OverdueBook, Resource, StockLog, Transaction, UploadScreening, UserAuthentication, UserBook, UserReview,
+)
+from .moderation import ModerationQueue
+from .rate_limit import LoginRateLimiter
+from .recommendations import CoOccurrenceRecommender
+from .screening import UploadScreener
+from .search_utils import BookContentIndexer
+from .session_backend import SessionStore
+from .storage import BookStorageManager
+from .tasks import index_book_content
+from .trending import TrendingCounter
+from .user_utils import UserSessionManager
+from .user_views import FILE_CHUNK_SIZE
+
+
+def epub_bytes(title, text):
+    """A one-chapter EPUB file"""
+    from ebooklib import epub
+
+    book = epub.EpubBook()
+    book.set_identifier(title)
+    book.set_title(title)
+    chapter = epub.EpubHtml(title='One', file_name='one.xhtml')
+    chapter.content = f'<h1>One</h1><p>{text}</p>'
+    book.add_item(chapter)
+    book.add_item(epub.EpubNav())
+    book.spine = [chapter]
+    with tempfile.NamedTemporaryFile(suffix='.epub') as handle:
+        epub.write_epub(handle.name, book)
+        return handle.read()
+
+
+class SeededLibraryMixin:
+    """Seed a library with a realistic mix of rows (mostly returned loans, mostly listed books)"""
+
+    RESOURCES = 300
+    MEMBERS = 200
+    TRANSACTIONS = 3000
+    USER_BOOKS = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(41)
+        today = timezone.now().date()
+
+        category = Category.objects.create(name='General')
+        resources = Resource.objects.bulk_create([
+            Resource(
+                title=f'Resource {i}',
+                resource_id=f'R{i:05d}',
+                category=category,
+                total_quantity=3,
+                available_quantity=rng.choice([0, 1, 2, 3]),
+                status=rng.choice(['available'] * 8 + ['damaged', 'lost']),
+            )
+            for i in range(cls.RESOURCES)
+        ])
+        members = Member.objects.bulk_create([
+            Member(member_id=f'M{i:05d}', first_name='Member', last_name=str(i))
+            for i in range(cls.MEMBERS)
+        ])
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                resource=rng.choice(resources),
+                member=rng.choice(members),
+                due_date=today + timedelta(days=rng.randint(-60, 15)),
+                status=rng.choice(['returned'] * 18 + ['active', 'overdue']),
+            )
+            for _ in range(cls.TRANSACTIONS)
+        ])
+        Fine.objects.bulk_create([
+            Fine(
+                member_id=loan.member_id,
+                resource_id=loan.resource_id,
+                transaction=loan,
+                amount=Decimal(rng.randint(1, 100)),
+                days_overdue=rng.randint(1, 60),
+                is_paid=rng.random() < 0.7,
+            )
+            for loan in transactions[::5]
+        ])
+        OverdueBook.objects.bulk_create([
+            OverdueBook(
+                user_identifier=f'M{i}',
+                book_title=f'Resource {i}',
+                resource_id=f'R{i:05d}',
+                checkout_date=today - timedelta(days=60),
+                due_date=today - timedelta(days=45),
+                days_overdue=rng.randint(30, 90),
+                is_recovered=rng.random() < 0.5,
+            )
+            for i in range(200)
+        ])
+        UserBook.objects.bulk_create([
+            UserBook(
+                title=f'Book {i}',
+                format='pdf',
+                file=f'user_books/book-{i}.pdf',
+                file_size=1024,
+                is_verified=rng.random() < 0.8,
+                is_banned=rng.random() < 0.05,
+                rating_avg=Decimal(rng.randint(0, 500)) / 100,
+                view_count=rng.randint(0, 10000),
+            )
+            for i in range(cls.USER_BOOKS)
+        ])
+
+        # Let the planner see the real row distribution, as production statistics would
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Asserts SQLite EXPLAIN QUERY PLAN output')
+class HotQueryIndexTests(SeededLibraryMixin, TestCase):
+    """Each hot filter in the views and background jobs is served by its index"""
+
+    def assertUsesIndex(self, queryset, index_name, covering=False):
+        # covering: the rows the aggregate needs are read from the index alone (count/sum queries)
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {index_name}', plan)
+        if covering:
+            self.assertIn(f'COVERING INDEX {index_name}', plan)
+
+    def test_overdue_loans(self):
+        today = timezone.now().date()
+        # Dashboard overdue count and OverdueTracker
+        self.assertUsesIndex(
+            Transaction.objects.filter(status='active', due_date__lt=today).values('id').order_by(),
+            'txn_status_due_idx', covering=True,
+        )
+        # Loans selected by FineAccrual
+        self.assertUsesIndex(
+            Transaction.objects.filter(status__in=('active', 'overdue'), due_date__lt=today).values('id').order_by(),
+            'txn_status_due_idx', covering=True,
+        )
+
+    def test_checked_out_count(self):
+        self.assertUsesIndex(
+            Transaction.objects.filter(status='active').values('id').order_by(), 'txn_status_due_idx', covering=True
+        )
+
+    def test_member_active_loans(self):
+        member = Member.objects.first()
+        self.assertUsesIndex(Transaction.objects.filter(member=member, status='active'), 'txn_member_status_idx')
+
+    def test_recent_transactions(self):
+        self.assertUsesIndex(Transaction.objects.order_by('-checkout_date')[:10], 'txn_checkout_date_idx')
+
+    def test_featured_books(self):
+        self.assertUsesIndex(
+            UserBook.objects.filter(is_banned=False, is_verified=True).order_by('-rating_avg', '-view_count')[:6],
+            'userbook_listed_rating_idx',
+        )
+
+    def test_latest_books(self):
+        self.assertUsesIndex(
+            UserBook.objects.filter(is_banned=False, is_verified=True).order_by('-created_at')[:6],
+            'userbook_listed_new_idx',
+        )
+
+    def test_available_resources(self):
+        self.assertUsesIndex(ResourceAvailability.available_queryset().order_by('title'), 'resource_available_title_idx')
+        self.assertUsesIndex(
+            ResourceAvailability.available_queryset().order_by('-created_at'), 'resource_available_new_idx'
+        )
+
+    def test_unpaid_fines(self):
+        self.assertUsesIndex(
+            Fine.objects.filter(is_paid=False).values('amount').order_by(), 'fine_paid_amount_idx', covering=True
+        )
+
+    def test_open_overdue_books(self):
+        self.assertUsesIndex(
+            OverdueBook.objects.filter(is_recovered=False).order_by('-days_overdue'), 'overdue_open_days_idx'
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Asserts SQLite EXPLAIN QUERY PLAN output')
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), ALLOWED_HOSTS=['testserver'])
+class URLQueryBudgetTests(SeededLibraryMixin, TestCase):
+    """
+    Every URL in vp/urls.py has a pinned maximum number of queries for a GET, and
+    none of its queries may scan a whole table. A new URL fails until it is budgeted.
+    """
+
+    # URL name -> (who requests it, maximum queries). Roles: None (anonymous), 'user', 'admin'
+    BUDGETS = {
+        # User side
+        'user_home': (None, 4),
+        'user_login': (None, 0),
+        'user_register': (None, 0),
+        'user_logout': ('user', 2),
+        'user_dashboard': ('user', 5),
+        'user_browse_books': ('user', 3),
+        'user_search_book_contents': ('user', 0),
+        # The first view/download of an hour counts into a new trending bucket:
+        # +3 for the UPDATE that misses, the INSERT and the UPDATE that counts
+        'user_book_detail': ('user', 8),
+        'user_read_pdf': ('user', 4),  # +3 trending bucket, as above
+        'user_read_epub': ('user', 1),
+        'user_read_epub_item': ('user', 1),
+        'user_download_book': ('user', 5),
+        'user_resource_detail': ('user', 7),
+        'user_upload_book': ('user', 7),  # +1 storage quota usage
+        'user_manage_uploads': ('user', 2),
+        'user_leave_review': ('user', 0),
+        'user_borrow_library_book': ('user', 4),
+        'user_checkout_book': ('user', 0),
+        'user_return_book': ('user', 3),
+
+        # Admin panel
+        'admin_login': (None, 0),
+        'admin_login_alt': (None, 0),
+        'admin_logout': ('admin', 2),
+        'admin_dashboard': ('admin', 10),
+        'admin_login_rate_limits': ('admin', 0),
+        'admin_user_books': ('admin', 10),
+        'admin_verify_book': ('admin', 0),
+        'admin_ban_book': ('admin', 1),
+        'admin_delete_book': ('admin', 0),
+        'admin_moderation_queue': ('admin', 1),
+        'admin_moderation_claim': ('admin', 0),
+        'admin_moderation_action': ('admin', 0),
+        'admin_manage_users': ('admin', 7),
+        'admin_ban_user': ('admin', 3),
+        'admin_unban_user': ('admin', 0),
+        'admin_delete_user': ('admin', 0),
+        'admin_manage_fines': ('admin', 2),
+        'admin_impose_fine': ('admin', 3),
+        'admin_mark_fine_paid': ('admin', 0),
+        'admin_overdue_books': ('admin', 3),
+        'admin_mark_book_recovered': ('admin', 0),
+        'admin_checkout_tracking': ('admin', 2),
+        'admin_manual_checkout': ('admin', 0),
+        'admin_label_sheet_create': ('admin', 0),
+        'admin_label_sheet_status': ('admin', 1),
+        'admin_label_sheet_download': ('admin', 1),
+        'admin_analytics_report': ('admin', 1),
+        'admin_live_events': ('admin', 0),
+
+        # Legacy library management
+        'resource_list': ('admin', 3),
+        'resource_detail': ('admin', 3),
+        'resource_create': ('admin', 2),
+        'resource_edit': ('admin', 1),
+        'resource_delete': ('admin', 1),
+        'resource_edit_user_book': ('admin', 2),
+        'resource_verify_user_book': ('admin', 2),
+        'resource_ban_user_book': ('admin', 2),
+        # One DELETE or UPDATE per table that references UserBook
+        'resource_delete_user_book': ('admin', 9),
+        'member_list': ('admin', 4),
+        'member_detail': ('admin', 2),
+        'member_create': ('admin', 0),
+        'member_register': ('admin', 0),
+        'member_edit': ('admin', 1),
+        'member_delete': ('admin', 1),
+        'checkout_create': ('admin', 0),
+        'resource_autocomplete': ('admin', 1),
+        'member_autocomplete': ('admin', 0),
+        'return_resource': ('admin', 1),
+        'circulation_batch': ('admin', 0),
+        'circulation_scan': ('admin', 0),
+        'transaction_list': ('admin', 1),
+        'resource_view_user_book': ('admin', 1),
+        'category_list': ('admin', 1),
+        'category_create': ('admin', 0),
+        'category_edit': ('admin', 1),
+        'category_delete': ('admin', 1),
+    }
+
+    # Tables that stay small enough for a full scan to be fine
+    SCAN_ALLOWED = {'models_category', 'models_finepolicy'}
+
+    # Django's admin site is tested upstream
+    SKIPPED_PREFIXES = ('admin-panel/',)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.member = Member.objects.order_by('id').first()
+        cls.anon_user = AnonymousUser.objects.create(
+            user_id='budget-user', fingerprint_hash='budget-fingerprint', session_key='budget-session'
+        )
+        cls.user_auth = UserAuthentication.objects.create(
+            auth_method='library_id', username='budget_user', member=cls.member
+        )
+        cls.book = UserBook.objects.filter(is_verified=True, is_banned=False).order_by('id').first()
+        cls.book.uploaded_by_user = cls.anon_user
+        cls.book.file.save('budget.pdf', ContentFile(b'%PDF-1.4\n%%EOF\n'))
+        UserReview.objects.create(book=cls.book, user=cls.anon_user, content='Fine', rating=4)
+        cls.fine = Fine.objects.order_by('id').first()
+        cls.overdue_book = OverdueBook.objects.order_by('id').first()
+        cls.label_job = LabelSheetJob.objects.create()
+
+    def url_args(self):
+        """Arguments for each path converter name"""
+        return {
+            'book_id': self.book.id,
+            'resource_id': Resource.objects.order_by('id').values_list('id', flat=True).first(),
+            'member_id': self.member.id,
+            'user_auth_id': self.user_auth.id,
+            'fine_id': self.fine.id,
+            'overdue_book_id': self.overdue_book.id,
+            'job_id': self.label_job.id,
+            'token': 'budget-token',
+            'item_path': 'OEBPS/content.opf',
+        }
+
+    def client_for(self, role):
+        client = Client(raise_request_exception=False)
+        session = client.session
+        session['anon_user_id'] = self.anon_user.id
+        if role == 'user':
+            session['user_auth_id'] = self.user_auth.id
+            session['user_auth_method'] = self.user_auth.auth_method
+        elif role == 'admin':
+            session['is_custom_admin'] = True
+        session.save()
+        return client
+
+    def url_patterns(self):
+        """(name, path) of every routed view, skipping included URLconfs"""
+        args = self.url_args()
+        seen = set()
+        for pattern in get_resolver().url_patterns:
+            if not isinstance(pattern, URLPattern) or str(pattern.pattern).startswith(self.SKIPPED_PREFIXES):
+                continue
+            if pattern.name in seen:
+                continue
+            seen.add(pattern.name)
+            kwargs = {name: args[name] for name in pattern.pattern.regex.groupindex if name != 'pk'}
+            if 'pk' in pattern.pattern.regex.groupindex:
+                # resources/<pk>/, members/<pk>/ and categories/<pk>/
+                model = {'resource': Resource, 'member': Member, 'category': Category}[pattern.name.split('_')[0]]
+                kwargs['pk'] = model.objects.order_by('id').values_list('id', flat=True).first()
+            yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+    def full_scans(self, queries):
+        """(sql, plan) of each captured query whose plan scans a whole table"""
+        offenders = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+                for step in plan:
+                    match = re.match(r'SCAN (\w+)', step)
+                    if match and 'USING' not in step and 'VIRTUAL TABLE' not in step and match.group(1) not in self.SCAN_ALLOWED:
+                        offenders.append((sql, '\n'.join(plan)))
+                        break
+        return offenders
+
+    def get(self, role, path):
+        """GET path as role, rolled back afterwards. Returns: (response, captured queries)"""
+        cache.clear()
+        client = self.client_for(role)
+        # Some legacy views change data on GET; keep every URL on the same seeded state
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(path)
+            transaction.set_rollback(True)
+        return response, captured.captured_queries
+
+    def test_every_url_has_a_budget(self):
+        missing = {name for name, _ in self.url_patterns()} - set(self.BUDGETS)
+        if missing:
+            self.fail(f'URLs without a query budget: {", ".join(sorted(missing))}')
+
+    def test_query_budgets(self):
+        for name, path in self.url_patterns():
+            if name not in self.BUDGETS:
+                continue
+            role, budget = self.BUDGETS[name]
+            with self.subTest(url=name):
+                response, queries = self.get(role, path)
+                # 404/405 are expected for GETs of POST-only or file-backed URLs
+                self.assertLess(response.status_code, 500, f'GET {path} failed')
+
+                sql = '\n'.join(f'  {query["sql"]}' for query in queries)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    f'GET {path} ran {len(queries)} queries (budget {budget}):\n{sql}'
+                )
+                for offender, plan in self.full_scans(queries):
+                    self.fail(f'GET {path} scans a whole table:\n  {offender}\nplan:\n{plan}')
+
+
+class RecommendationTests(TestCase):
+    """Co-occurrence neighbours are computed offline and read back by primary key"""
+
+    def setUp(self):
+        cache.clear()
+        self.books = UserBook.objects.bulk_create([
+            UserBook(title=f'Book {i}', format='pdf', file=f'user_books/book-{i}.pdf', file_size=1024, is_verified=True)
+            for i in range(4)
+        ])
+        self.readers = AnonymousUser.objects.bulk_create([
+            AnonymousUser(user_id=f'reader-{i}', fingerprint_hash=f'{i:064d}', session_key=f'session-{i}') for i in range(3)
+        ])
+
+    def review(self, reader, book):
+        return UserReview.objects.create(book=book, user=reader, content='Good read', rating=4)
+
+    def neighbor_ids(self, book):
+        return [neighbor['id'] for neighbor in CoOccurrenceRecommender.neighbors_for(book)]
+
+    def test_ranks_books_read_by_the_same_readers(self):
+        first, second, third, unlisted = self.books
+        UserBook.objects.filter(id=unlisted.id).update(is_verified=False)
+        for reader in self.readers:
+            self.review(reader, first)
+            self.review(reader, second)
+            self.review(reader, unlisted)
+        self.review(self.readers[0], third)
+
+        CoOccurrenceRecommender.refresh('book')
+
+        self.assertEqual(self.neighbor_ids(first), [second.id, third.id])
+        self.assertEqual(self.neighbor_ids(third), [first.id, second.id])
+        # Unlisted books get neighbours but are never recommended themselves
+        self.assertEqual(self.neighbor_ids(unlisted), [first.id, second.id, third.id])
+
+    def test_incremental_refresh_only_touches_active_readers(self):
+        first, second, third, fourth = self.books
+        self.review(self.readers[0], first)
+        self.review(self.readers[0], second)
+        self.review(self.readers[1], third)
+        self.assertEqual(CoOccurrenceRecommender.refresh('book'), 3)
+
+        self.review(self.readers[1], fourth)
+        self.assertEqual(CoOccurrenceRecommender.refresh('book'), 2)
+        self.assertEqual(self.neighbor_ids(third), [fourth.id])
+        self.assertEqual(self.neighbor_ids(first), [second.id])
+
+        self.assertEqual(CoOccurrenceRecommender.refresh('book'), 0)
+
+    def test_banned_and_deleted_books_drop_out_before_the_next_refresh(self):
+        first, second, third, fourth = self.books
+        for book in self.books:
+            self.review(self.readers[0], book)
+        CoOccurrenceRecommender.refresh('book')
+
+        UserBook.objects.filter(id=second.id).update(is_banned=True)
+        UserBook.objects.filter(id=third.id).update(is_verified=False)
+        fourth.delete()
+        self.assertEqual(self.neighbor_ids(first), [])
+        self.assertEqual(self.neighbor_ids(second), [first.id])
+
+    def test_detail_page_shows_neighbors(self):
+        first, second = self.books[:2]
+        self.review(self.readers[0], first)
+        self.review(self.readers[0], second)
+        CoOccurrenceRecommender.refresh('book')
+
+        response = Client().get(reverse('user_book_detail', args=[first.id]))
+        self.assertContains(response, 'Readers Also Liked')
+        self.assertContains(response, reverse('user_book_detail', args=[second.id]))
+
+
+class TrendingTests(TestCase):
+    """Hourly activity buckets, decayed rankings and bucket compaction"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.books = UserBook.objects.bulk_create([
+            UserBook(title=f'Book {i}', format='pdf', file=f'user_books/book-{i}.pdf', file_size=1024, is_verified=True)
+            for i in range(3)
+        ])
+
+    def test_record_counts_into_hourly_buckets(self):
+        book = self.books[0]
+        for _ in range(3):
+            TrendingCounter.record('book', book.id, 'view', at=self.now)
+        TrendingCounter.record('book', book.id, 'view', at=self.now - timedelta(hours=1))
+
+        counts = ActivityBucket.objects.filter(item_id=book.id).order_by('start').values_list('count', flat=True)
+        self.assertEqual(list(counts), [1, 3])
+
+    def test_recent_activity_outranks_old_activity(self):
+        old, recent, banned = self.books
+        UserBook.objects.filter(id=banned.id).update(is_banned=True)
+        TrendingCounter.record('book', old.id, 'view', count=20, at=self.now - timedelta(days=5))
+        TrendingCounter.record('book', recent.id, 'view', count=3, at=self.now)
+        TrendingCounter.record('book', banned.id, 'download', count=50, at=self.now)
+
+        TrendingCounter.update_rankings(self.now)
+
+        self.assertEqual(TrendingCounter.ranking('book'), [recent.id, old.id])
+        response = Client().get(reverse('user_home'))
+        self.assertEqual([book.id for book in response.context['featured_books']], [recent.id, old.id])
+
+    def test_compaction_keeps_totals_and_drops_expired_buckets(self):
+        book = self.books[0]
+        three_days_ago = self.now - timedelta(days=3)
+        for hour in range(3):
+            TrendingCounter.record('book', book.id, 'view', count=2, at=three_days_ago.replace(hour=hour))
+        TrendingCounter.record('book', book.id, 'view', at=self.now)
+        TrendingCounter.record('book', book.id, 'view', at=self.now - timedelta(days=TrendingCounter.RETENTION_DAYS + 2))
+
+        # The expired bucket is first compacted into its day, then deleted
+        self.assertEqual(TrendingCounter.compact(self.now), (4, 1))
+
+        buckets = ActivityBucket.objects.order_by('start').values_list('period', 'count')
+        self.assertEqual(list(buckets), [('day', 6), ('hour', 1)])
+
+
+class AnalyticsRollupTests(SeededLibraryMixin, TestCase):
+    """Reports read from the daily rollups agree with the source tables"""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        AnalyticsRollup.refresh(today=self.today)
+
+    def test_loans_per_category_and_member_type(self):
+        report = AnalyticsRollup.report(self.today - timedelta(days=365), self.today, 'month', 'member_type')
+        loans = {row['member_type']: row['loans'] for row in report if row['loans']}
+        expected = {
+            member_type or '': count
+            for member_type, count in Transaction.objects.values_list('member__member_type').annotate(n=Count('id'))
+        }
+        self.assertEqual(loans, expected)
+
+        by_category = AnalyticsRollup.report(self.today - timedelta(days=365), self.today, 'year', 'category')
+        by_category = {row['category__name']: row for row in by_category}
+        self.assertEqual(set(by_category), {'General', None})
+        self.assertEqual(by_category['General']['loans'], Transaction.objects.count())
+        self.assertEqual(by_category[None]['uploads'], UserBook.objects.count())
+
+    def test_overdues_and_fines(self):
+        totals = AnalyticsRollup.report(self.today - timedelta(days=365), self.today, 'year')[0]
+        overdue = Transaction.objects.filter(due_date__lt=self.today, status__in=('active', 'overdue')).count()
+        self.assertEqual(totals['overdues'], overdue)
+        self.assertEqual(totals['fines_imposed'], Fine.objects.count())
+        self.assertEqual(totals['fine_amount'], Fine.objects.aggregate(total=Sum('amount'))['total'])
+
+    def test_refresh_replaces_recent_days(self):
+        rows = CirculationRollup.objects.count()
+        loan = Transaction.objects.filter(status='active').first()
+        loan.mark_returned()
+
+        AnalyticsRollup.refresh(today=self.today)
+        self.assertEqual(CirculationRollup.objects.count(), rows)
+        totals = AnalyticsRollup.report(self.today, self.today, 'day')[0]
+        self.assertEqual(totals['returns'], 1)
+
+    def test_report_page_reads_only_rollups(self):
+        client = Client()
+        session = client.session
+        session['is_custom_admin'] = True
+        session.save()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(reverse('admin_analytics_report'), {'group_by': 'category', 'period': 'year'})
+        self.assertContains(response, 'General')
+        tables = {re.search(r'FROM "(\w+)"', query['sql']).group(1) for query in captured.captured_queries}
+        self.assertEqual(tables, {'models_circulationrollup'})
+
+
+class LiveEventTests(TestCase):
+    """Dashboard events published from signals and served by the live endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.resource = Resource.objects.create(
+            title='Live Resource', resource_id='LIVE1', total_quantity=1, available_quantity=1, status='available'
+        )
+        self.member = Member.objects.create(member_id='LIVE-M1', first_name='Live', last_name='Member')
+
+    def published(self):
+        return [(event['type'], event['data']) for event in async_to_sync(LiveEventBus.wait)(0, 0)[1]]
+
+    def test_circulation_events_publish_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = CirculationDesk.checkout(self.member, self.resource.id)
+            self.assertEqual(self.published(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            CirculationDesk.return_loan(loan.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Saving a returned loan again is not another return
+            Transaction.objects.get(id=loan.id).save()
+
+        events = self.published()
+        self.assertEqual([event_type for event_type, _ in events], ['checkout', 'return'])
+        self.assertEqual(events[1][1]['resource'], 'Live Resource')
+        self.assertEqual(events[1][1]['was_status'], 'active')
+        self.assertFalse(events[1][1]['was_overdue'])
+
+    def test_only_pending_uploads_and_their_review_are_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = UserBook.objects.create(title='Pending', format='pdf', file='user_books/p.pdf', file_size=1)
+            UserBook.objects.create(title='Listed', format='pdf', file='user_books/l.pdf', file_size=1, is_verified=True)
+            book = UserBook.objects.get(id=pending.id)
+            book.is_verified = True
+            book.save(update_fields=['is_verified'])
+            book.save(update_fields=['is_verified'])
+
+        self.assertEqual(
+            [(event_type, data['title']) for event_type, data in self.published()],
+            [('upload', 'Pending'), ('book_reviewed', 'Pending')],
+        )
+
+    def test_long_poll_returns_events_after_the_given_id(self):
+        client = Client()
+        session = client.session
+        session['is_custom_admin'] = True
+        session.save()
+
+        start = client.get(reverse('admin_live_events')).json()
+        first = LiveEventBus.publish('ban', user=1)
+        LiveEventBus.publish('ban', user=2)
+
+        body = client.get(reverse('admin_live_events'), {'after': first}).json()
+        self.assertEqual(start['events'], [])
+        self.assertEqual([event['data']['user'] for event in body['events']], [2])
+        self.assertEqual(body['last_id'], first + 1)
+        self.assertRedirects(Client().get(reverse('admin_live_events')), reverse('admin_login'))
+
+    def test_wsgi_poll_does_not_wait(self):
+        client = Client()
+        session = client.session
+        session['is_custom_admin'] = True
+        session.save()
+        last_id = client.get(reverse('admin_live_events')).json()['last_id']
+
+        with mock.patch.object(LiveEventBus, 'wait', wraps=LiveEventBus.wait) as wait:
+            body = client.get(reverse('admin_live_events'), {'after': last_id}).json()
+        wait.assert_called_once_with(last_id, 0)
+        self.assertEqual(body['poll_after'], admin_views.LIVE_POLL_SECONDS)
+
+        # Under ASGI the same request long-polls
+        async_client = AsyncClient()
+        async_client.cookies = client.cookies
+        with mock.patch.object(admin_views, 'LIVE_LONG_POLL_SECONDS', 0.05):
+            response = async_to_sync(async_client.get)(reverse('admin_live_events'), {'after': last_id})
+        self.assertEqual(response.json(), {'last_id': last_id, 'events': [], 'poll_after': None})
+
+    async def test_listen_replays_backlog_then_streams(self):
+        first = LiveEventBus.publish('ban', user=1)
+        with mock.patch.object(LiveEventBus, 'POLL_INTERVAL', 0.01):
+            events = LiveEventBus.listen(after=first - 1, idle_timeout=0.05)
+            self.assertEqual((await anext(events))['id'], first)
+            self.assertIsNone(await anext(events))
+
+            second = LiveEventBus.publish('ban', user=2)
+            event = await anext(events)
+            while event is None:
+                event = await anext(events)
+            self.assertEqual(event['id'], second)
+            await events.aclose()
+
+
+class ModerationQueueTests(TestCase):
+    """Leased moderation batches and single-UPDATE bulk actions"""
+
+    def setUp(self):
+        cache.clear()
+        self.books = UserBook.objects.bulk_create([
+            UserBook(title=f'Upload {i}', format='pdf', file=f'user_books/upload-{i}.pdf', file_size=1024)
+            for i in range(6)
+        ])
+
+    def claimed_ids(self, moderator, count, held=()):
+        books, _ = ModerationQueue.claim(moderator, count, held)
+        return [book.id for book in books]
+
+    def test_moderators_lease_disjoint_batches(self):
+        ids = [book.id for book in self.books]
+        self.assertEqual(self.claimed_ids('alice', 3), ids[:3])
+        self.assertEqual(self.claimed_ids('bob', 10), ids[3:])
+        self.assertEqual(self.claimed_ids('carol', 10), [])
+
+        # Expired leases go back to the queue
+        UserBook.objects.filter(claimed_by='alice').update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.claimed_ids('carol', 10), ids[:3])
+
+    def test_bulk_action_is_one_update_and_skips_books_leased_elsewhere(self):
+        ids = [book.id for book in self.books]
+        self.claimed_ids('alice', 2)
+        self.claimed_ids('bob', 2)
+
+        with CaptureQueriesContext(connection) as captured:
+            updated = ModerationQueue.apply('alice', ids[:4], 'verify')
+        self.assertEqual(updated, 2)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in captured.captured_queries), 1)
+
+        self.assertEqual(ModerationQueue.apply('bob', ids[2:], 'ban', 'Spam'), 4)
+        states = UserBook.objects.order_by('id').values_list('is_verified', 'is_banned', 'claimed_by')
+        self.assertEqual(list(states), [(True, False, '')] * 2 + [(False, True, '')] * 4)
+
+    def test_claim_and_action_endpoints(self):
+        client = Client()
+        session = client.session
+        session['is_custom_admin'] = True
+        session.save()
+
+        data = client.post(reverse('admin_moderation_claim'), {'count': 4}).json()
+        self.assertEqual([book['title'] for book in data['books']], [f'Upload {i}' for i in range(4)])
+        self.assertEqual(data['pending'], 6)
+
+        ids = [book['id'] for book in data['books']]
+        data = client.post(reverse('admin_moderation_claim'), {'count': 4, 'held': ids}).json()
+        self.assertEqual(len(data['books']), 2)
+
+        response = client.post(reverse('admin_moderation_action'), {'action': 'verify', 'ids': ids})
+        self.assertEqual(response.json(), {'updated': 4, 'skipped': 0})
+        response = client.post(reverse('admin_moderation_action'), {'action': 'publish', 'ids': ids})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadScreeningTests(TestCase):
+    """Magic byte checks on upload and background validation and duplicate detection"""
+
+    CHAPTER = ' '.join(f'word{i}' for i in range(60))
+
+    def setUp(self):
+        cache.clear()
+
+    def pdf_bytes(self):
+        from io import BytesIO
+        from PyPDF2 import PdfWriter
+
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        output = BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def upload(self, title, content, book_format):
+        book = UserBook(title=title, format=book_format, file_size=len(content))
+        book.file.save(f'{title}.{book_format}', ContentFile(content), save=False)
+        book.save()
+        UploadScreening.objects.create(book=book)
+        return book
+
+    def test_form_checks_magic_bytes_against_the_format(self):
+        def form(content, book_format):
+            upload = SimpleUploadedFile('book.bin', content)
+            return UserBookUploadForm({'title': 'Book', 'format': book_format}, {'file': upload})
+
+        self.assertTrue(form(self.pdf_bytes(), 'pdf').is_valid())
+        self.assertTrue(form(epub_bytes('Book', self.CHAPTER), 'epub').is_valid())
+        self.assertIn('format', form(epub_bytes('Book', self.CHAPTER), 'pdf').errors)
+        self.assertIn('file', form(b'MZ\x90\x00 not a book', 'pdf').errors)
+
+    def test_broken_files_are_rejected_and_banned(self):
+        valid = self.upload('Valid', self.pdf_bytes(), 'pdf')
+        broken = self.upload('Broken', b'%PDF-1.4\nnot really a pdf', 'pdf')
+
+        self.assertEqual(UploadScreener.run_pending(), 2)
+
+        valid.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual(valid.screening.status, 'passed')
+        self.assertEqual(valid.screening.page_count, 1)
+        self.assertEqual(broken.screening.status, 'rejected')
+        self.assertTrue(broken.is_banned)
+        self.assertTrue(broken.ban_reason.startswith('Automatic screening'))
+
+    def test_exact_and_near_duplicates_are_flagged(self):
+        content = epub_bytes('Original', self.CHAPTER)
+        original = self.upload('Original', content, 'epub')
+        copy = self.upload('Copy', content, 'epub')
+        retitled = self.upload('Retitled', epub_bytes('Retitled', self.CHAPTER), 'epub')
+        other = self.upload('Other', epub_bytes('Other', ' '.join(f'other{i}' for i in range(60))), 'epub')
+
+        UploadScreener.run_pending()
+
+        screenings = {screening.book_id: screening for screening in UploadScreening.objects.all()}
+        self.assertEqual(screenings[original.id].status, 'passed')
+        self.assertEqual(screenings[other.id].status, 'passed')
+        self.assertEqual((screenings[copy.id].status, screenings[copy.id].duplicate_of_id), ('duplicate', original.id))
+        self.assertEqual((screenings[retitled.id].status, screenings[retitled.id].duplicate_of_id), ('duplicate', original.id))
+        self.assertIn('First page matches', screenings[retitled.id].notes)
+
+    def test_unscreened_uploads_wait_outside_the_moderation_queue(self):
+        book = self.upload('Waiting', self.pdf_bytes(), 'pdf')
+        self.assertFalse(ModerationQueue.pending().filter(id=book.id).exists())
+
+        UploadScreener.run_pending()
+        self.assertTrue(ModerationQueue.pending().filter(id=book.id).exists())
+
+
+ARCHIVE_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        'user_books_archive': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': ARCHIVE_ROOT},
+        },
+    },
+    USER_BOOKS_USER_QUOTA_MB=1,
+    USER_BOOKS_TOTAL_QUOTA_MB=2,
+    USER_BOOKS_COLD_AFTER_DAYS=30,
+    USER_BOOKS_COLD_MAX_READS=2,
+)
+class StorageTieringTests(TestCase):
+    """Upload quotas, archiving of cold books and transparent recall"""
+
+    def setUp(self):
+        cache.clear()
+        self.anon = AnonymousUser.objects.create(user_id='storage-tests', fingerprint_hash='storage-tests', session_key='storage-tests')
+
+    def book(self, title, content=b'%PDF-1.4 ' + b'x' * 4096, days_old=0, **fields):
+        fields = {'file_size': len(content), 'is_verified': True, **fields}
+        book = UserBook(title=title, format='pdf', uploaded_by_user=self.anon, **fields)
+        book.file.save(f'{title}.pdf', ContentFile(content), save=False)
+        book.save()
+        if days_old:
+            UserBook.objects.filter(id=book.id).update(created_at=timezone.now() - timedelta(days=days_old))
+        return book
+
+    def test_quota_limits_each_visitor_and_the_library(self):
+        self.book('Existing', file_size=900 * 1024)
+        self.assertIn('storage quota', BookStorageManager.quota_error(self.anon, 200 * 1024))
+        self.assertIsNone(BookStorageManager.quota_error(self.anon, 50 * 1024))
+
+        # Uploaded by someone else: only the library-wide quota is left for 50KB more
+        UserBook.objects.create(title='Large', format='pdf', file='user_books/large.pdf', file_size=1100 * 1024)
+        self.assertIn('run out of storage', BookStorageManager.quota_error(self.anon, 50 * 1024))
+
+    @override_settings(USER_BOOKS_USER_QUOTA_MB=0)
+    def test_upload_over_quota_is_rejected(self):
+        upload = SimpleUploadedFile('book.pdf', b'%PDF-1.4 tiny book')
+        response = self.client.post(reverse('user_upload_book'), {'title': 'Too much', 'format': 'pdf', 'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('storage quota', str(response.context['form'].errors['file']))
+        self.assertFalse(UserBook.objects.filter(title='Too much').exists())
+
+    def test_cold_books_are_archived_and_recalled_on_download(self):
+        content = b'%PDF-1.4 ' + bytes(range(256)) * 64
+        cold = self.book('Cold', content, days_old=90)
+        read = self.book('Read', days_old=90)
+        self.book('Recent')
+        self.book('Pending', days_old=90, is_verified=False)
+        TrendingCounter.record('book', read.id, 'view', count=3, at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(list(BookStorageManager.cold_books()), [cold])
+        self.assertEqual(BookStorageManager.archive_cold_books(), (1, len(content)))
+
+        cold.refresh_from_db()
+        self.assertEqual(cold.storage_tier, 'archive')
+        self.assertFalse(cold.file.storage.exists(cold.file.name))
+        usage = BookStorageManager.usage()
+        self.assertEqual(usage['archived'], cold.archived_size)
+        self.assertEqual(usage['hot'], UserBook.objects.exclude(id=cold.id).aggregate(total=Sum('file_size'))['total'])
+
+        response = self.client.get(reverse('user_download_book', args=[cold.id]))
+        self.assertEqual(b''.join(response.streaming_content), content)
+        cold.refresh_from_db()
+        self.assertEqual((cold.storage_tier, cold.archive_name), ('hot', ''))
+        self.assertTrue(cold.file.storage.exists(cold.file.name))
+
+    def test_books_read_in_the_browser_stay_on_disk(self):
+        read = self.book('Read online', days_old=90)
+        for _ in range(settings.USER_BOOKS_COLD_MAX_READS + 1):
+            self.assertEqual(self.client.get(reverse('user_read_pdf', args=[read.id])).status_code, 200)
+
+        self.assertEqual(ActivityBucket.objects.get(item_id=read.id).event, 'read')
+        self.assertNotIn(read, BookStorageManager.cold_books())
+
+    def test_deleting_an_archived_book_removes_the_archive_copy(self):
+        book = self.book('Gone', days_old=90)
+        BookStorageManager.archive(book)
+        book.refresh_from_db()
+        archive_name = book.archive_name
+        self.assertTrue(os.path.exists(os.path.join(ARCHIVE_ROOT, archive_name)))
+
+        book.delete()
+        self.assertFalse(os.path.exists(os.path.join(ARCHIVE_ROOT, archive_name)))
+
+
+class EpubChapterCacheTests(TestCase):
+    """Unpacking EPUBs into the per-book chapter cache"""
+
+    def setUp(self):
+        # Book ids repeat across tests, so each test gets its own cache directory
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+
+    def book(self, title):
+        content = epub_bytes(title, f'{title} chapter text ' * 50)
+        book = UserBook(title=title, format='epub', file_size=len(content), is_verified=True)
+        book.file.save(f'{title}.epub', ContentFile(content), save=False)
+        book.save()
+        return book
+
+    def cache_dirs(self, book):
+        return sorted(path.name for path in EpubChapterCache.cache_root(book).parent.iterdir())
+
+    def test_concurrent_first_reads_get_a_complete_cache(self):
+        book = self.book('Concurrent')
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            manifests = list(pool.map(lambda _: EpubChapterCache.get_manifest(book), range(8)))
+
+        self.assertTrue(all(manifests))
+        for item_path in manifests[0]['items']:
+            self.assertIsNotNone(EpubChapterCache.get_item_path(book, manifests[0], item_path)[0])
+        # No staging or stale directories are left behind
+        self.assertEqual(self.cache_dirs(book), [str(book.id)])
+
+    def test_replaced_file_rebuilds_the_cache(self):
+        book = self.book('First')
+        first = EpubChapterCache.get_manifest(book)
+
+        content = epub_bytes('Second', 'second chapter text ' * 80)
+        book.file.save('Second.epub', ContentFile(content), save=False)
+        book.file_size = len(content)
+        book.save()
+        second = EpubChapterCache.get_manifest(book)
+
+        self.assertNotEqual(first['source'], second['source'])
+        self.assertEqual(second, EpubChapterCache.get_manifest(book))
+        self.assertEqual(self.cache_dirs(book), [str(book.id)])
+
+    def test_unreadable_file_keeps_no_cache(self):
+        book = UserBook(title='Broken', format='epub', file_size=9, is_verified=True)
+        book.file.save('Broken.epub', ContentFile(b'not a zip'), save=False)
+        book.save()
+        self.assertIsNone(EpubChapterCache.get_manifest(book))
+        self.assertFalse(EpubChapterCache.cache_root(book).exists())
+
+
+class BookContentIndexTests(TestCase):
+    """Indexing book contents on upload and searching them"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+
+    def upload(self, title, text):
+        upload = SimpleUploadedFile(f'{title}.epub', epub_bytes(title, text))
+        with mock.patch.object(index_book_content, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('user_upload_book'), {'title': title, 'format': 'epub', 'file': upload})
+        return UserBook.objects.get(title=title), delay
+
+    def test_upload_queues_the_book_for_indexing(self):
+        book, delay = self.upload('Zebras', 'the quagga is an extinct zebra ' * 10)
+        delay.assert_called_once_with(book.id)
+
+        index_book_content(book.id)
+        UserBook.objects.filter(id=book.id).update(is_verified=True)
+        hits = BookContentIndexer.search('quagga')
+        self.assertEqual([hit['book_id'] for hit in hits], [book.id])
+        self.assertIn('<mark>quagga</mark>', hits[0]['snippet'])
+
+        # Already current: the periodic run and a repeated task leave it alone
+        self.assertEqual(index_book_content(book.id), f'Book {book.id} needs no indexing')
+        self.assertFalse(BookContentIndexer.books_needing_index().exists())
+
+    def test_unverified_and_deleted_books_are_not_found(self):
+        book, _delay = self.upload('Okapis', 'the okapi is related to the giraffe ' * 10)
+        index_book_content(book.id)
+        self.assertEqual(BookContentIndexer.search('okapi'), [])
+
+        UserBook.objects.filter(id=book.id).update(is_verified=True)
+        self.assertEqual(len(BookContentIndexer.search('okapi')), 1)
+        book.delete()
+        self.assertEqual(BookContentIndexer.search('okapi'), [])
+
+
+class EncryptionKeyringTests(TestCase):
+    """Fernet keyring: primary key, old keys and the SECRET_KEY derived fallback"""
+
+    OLD_KEY = PrivacyEncryption.generate_key().decode()
+    NEW_KEY = PrivacyEncryption.generate_key().decode()
+
+    def keyring(self, primary=None, old=()):
+        self.enterContext(override_settings(ENCRYPTION_KEY=primary, ENCRYPTION_OLD_KEYS=list(old)))
+        PrivacyEncryption.reset_cipher()
+        self.addCleanup(PrivacyEncryption.reset_cipher)
+
+    def test_round_trip_and_rotation_to_a_new_primary_key(self):
+        self.keyring()
+        legacy = PrivacyEncryption.encrypt_auth_data('Ada', '555-0100', 'secret')
+        self.keyring(self.OLD_KEY)
+        old = PrivacyEncryption.encrypt_many(['one', None, 'two'])
+
+        self.keyring(self.NEW_KEY, [self.OLD_KEY])
+        self.assertEqual(PrivacyEncryption.decrypt_many(old), ['one', None, 'two'])
+        self.assertEqual(PrivacyEncryption.decrypt_auth_data(legacy), ('Ada', '555-0100', 'secret'))
+        rotated = PrivacyEncryption.rotate_many([old[0], legacy])
+
+        # Only the new key is needed once the data is rotated
+        self.keyring(self.NEW_KEY)
+        self.assertEqual(PrivacyEncryption.decrypt_many(rotated[:1]), ['one'])
+        self.assertEqual(PrivacyEncryption.decrypt_auth_data(rotated[1]), ('Ada', '555-0100', 'secret'))
+        self.assertEqual(PrivacyEncryption.decrypt_many([old[0]], strict=False), [None])
+        with self.assertRaises(ValueError):
+            PrivacyEncryption.decrypt_many([old[0]])
+
+    def test_parallel_batches_keep_their_order(self):
+        self.keyring(self.NEW_KEY)
+        values = [f'value-{i}' for i in range(PrivacyEncryption.PARALLEL_THRESHOLD + 5)]
+        tokens = PrivacyEncryption.encrypt_many(values, workers=4)
+        self.assertEqual(PrivacyEncryption.decrypt_many(tokens, workers=4), values)
+
+    def test_malformed_keys_are_reported_by_name(self):
+        self.keyring('not-a-fernet-key')
+        with self.assertRaisesMessage(ImproperlyConfigured, 'ENCRYPTION_KEY is not a Fernet key'):
+            PrivacyEncryption.encrypt_library_id('L-1')
+        self.assertEqual([error.id for error in check_encryption_keys(None)], ['models.E001'])
+
+        self.keyring(self.NEW_KEY, ['short'])
+        with self.assertRaisesMessage(ImproperlyConfigured, 'ENCRYPTION_OLD_KEYS[0]'):
+            PrivacyEncryption.encrypt_library_id('L-1')
+
+    def test_check_does_not_need_secret_key(self):
+        self.keyring(None)
+        with override_settings(SECRET_KEY=''):
+            self.assertEqual(check_encryption_keys(None), [])
+
+
+@override_settings(USER_PASSWORD_ITERATIONS=1)
+class KeyRotationJobTests(TestCase):
+    """Resumable re-encryption of stored authentication data"""
+
+    OLD_KEY = PrivacyEncryption.generate_key().decode()
+    NEW_KEY = PrivacyEncryption.generate_key().decode()
+
+    def keyring(self, primary, old=()):
+        self.enterContext(override_settings(ENCRYPTION_KEY=primary, ENCRYPTION_OLD_KEYS=list(old)))
+        PrivacyEncryption.reset_cipher()
+        self.addCleanup(PrivacyEncryption.reset_cipher)
+
+    def setUp(self):
+        self.keyring(self.OLD_KEY)
+        self.users = [UserSessionManager.create_library_id_user(f'LIB{i:04d}') for i in range(4)]
+        self.users.append(UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret'))
+        self.keyring(self.NEW_KEY, [self.OLD_KEY])
+
+    def assert_rotated(self):
+        self.keyring(self.NEW_KEY)
+        for user in UserAuthentication.objects.all():
+            if user.encrypted_library_id:
+                PrivacyEncryption.decrypt_library_id(user.encrypted_library_id)
+            if user.encrypted_auth_data:
+                PrivacyEncryption.decrypt_auth_data(user.encrypted_auth_data)
+
+    def test_job_resumes_after_a_timeout_without_double_counting(self):
+        job = KeyRotationManager.start_job(batch_size=2, throttle_seconds=0)
+        self.assertFalse(KeyRotationManager.run_job(job, max_seconds=1e-9))
+        self.assertEqual((job.status, job.rows_processed), ('pending', 2))
+
+        job = KeyRotationJob.objects.get(id=job.id)
+        self.assertTrue(KeyRotationManager.run_job(job))
+        self.assertEqual((job.status, job.rows_processed, job.rows_rotated, job.rows_failed), ('completed', 5, 5, 0))
+        self.assert_rotated()
+
+    def test_a_duplicate_delivery_cannot_run_the_same_job(self):
+        job = KeyRotationManager.start_job(batch_size=2, throttle_seconds=0)
+        duplicate = KeyRotationJob.objects.get(id=job.id)
+
+        self.assertTrue(KeyRotationManager.claim_job(job))
+        self.assertFalse(KeyRotationManager.run_job(duplicate))
+
+        # A worker holding a stale checkpoint loses the compare-and-swap and catches up instead
+        KeyRotationManager._process_batch(job)
+        duplicate.last_processed_id = 0
+        KeyRotationManager._process_batch(duplicate)
+        job.refresh_from_db()
+        self.assertEqual((job.rows_processed, duplicate.last_processed_id), (2, job.last_processed_id))
+
+    def test_paused_job_waits_until_resumed(self):
+        job = KeyRotationManager.start_job(batch_size=2, throttle_seconds=0)
+        KeyRotationManager.pause_job(job)
+        self.assertFalse(KeyRotationManager.run_job(job))
+        self.assertEqual((job.status, job.rows_processed), ('paused', 0))
+
+        KeyRotationManager.resume_job(job)
+        self.assertTrue(KeyRotationManager.run_job(job))
+        self.assert_rotated()
+
+    def test_rotation_rewrites_stale_identity_hashes(self):
+        UserAuthentication.objects.update(identity_hash='stale')
+        KeyRotationManager.run_job(KeyRotationManager.start_job(throttle_seconds=0))
+
+        self.assertEqual(UserSessionManager.authenticate_with_library_id('LIB0002'), self.users[2])
+        self.assertEqual(UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret'), self.users[4])
+        self.assertEqual(UserAuthentication.objects.count(), 5)
+
+
+@override_settings(USER_PASSWORD_ITERATIONS=1)
+class IdentityLookupTests(TestCase):
+    """Indexed identity hashes and password verifiers for library-ID and credential logins"""
+
+    def test_credentials_are_checked_against_the_verifier(self):
+        user = UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret')
+        self.assertTrue(user.password_verifier.startswith('pbkdf2_sha256$'))
+        self.assertNotIn('secret', user.password_verifier)
+
+        self.assertEqual(UserSessionManager.authenticate_with_credentials(' ada ', '555-0100', 'secret'), user)
+        self.assertIsNone(UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'wrong'))
+        self.assertEqual(UserAuthentication.objects.count(), 1)
+
+    def test_rows_without_a_verifier_are_upgraded_on_login(self):
+        user = UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret')
+        UserAuthentication.objects.filter(id=user.id).update(password_verifier='')
+        user.refresh_from_db()
+
+        self.assertFalse(UserSessionManager.verify_password(user, 'wrong'))
+        self.assertTrue(UserSessionManager.verify_password(user, 'secret'))
+        user.refresh_from_db()
+        self.assertTrue(user.password_verifier)
+
+    def test_backfill_lets_existing_accounts_log_in_again(self):
+        member = UserSessionManager.create_library_id_user('LIB0001')
+        legacy = UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret')
+        banned = UserSessionManager.create_library_id_user('LIB0002')
+        UserAuthentication.objects.filter(id=banned.id).update(is_banned=True)
+        UserAuthentication.objects.update(identity_hash=None)
+
+        migration = import_module('models.migrations.0023_backfill_identity_hash')
+        migration.backfill_identity_hash(apps, None)
+
+        self.assertEqual(UserSessionManager.authenticate_with_library_id('LIB0001'), member)
+        self.assertEqual(UserSessionManager.authenticate_with_credentials('Ada', '555-0100', 'secret'), legacy)
+        self.assertIsNone(UserSessionManager.authenticate_with_library_id('LIB0002'))
+        self.assertEqual(UserAuthentication.objects.count(), 3)
+
+    def test_identities_survive_a_secret_key_change(self):
+        user = UserSessionManager.create_library_id_user('LIB0001')
+
+        with override_settings(IDENTITY_HASH_KEY='identity-key'):
+            self.assertEqual(UserSessionManager.authenticate_with_library_id('LIB0001'), user)
+            hashed = UserSessionManager.create_library_id_user('LIB0003')
+
+        with override_settings(SECRET_KEY='new-secret', SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertEqual(UserSessionManager.authenticate_with_library_id('LIB0001'), user)
+        with override_settings(SECRET_KEY='new-secret', IDENTITY_HASH_KEY='identity-key'):
+            self.assertEqual(UserSessionManager.authenticate_with_library_id('LIB0003'), hashed)
+        self.assertEqual(UserAuthentication.objects.count(), 2)
+
+
+@override_settings(LOGIN_IP_RATE_LIMIT=(3, 1), LOGIN_RATE_LIMITS={'default': {'identity': (2, 1)}})
+class LoginRateLimitTests(TestCase):
+    """Per-address and per-identity login token buckets"""
+
+    def setUp(self):
+        cache.clear()
+
+    def attempt(self, method='username', identity=None, remote='203.0.113.7', forwarded=None):
+        extra = {'REMOTE_ADDR': remote}
+        if forwarded:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        request = RequestFactory().post('/login/', **extra)
+        return LoginRateLimiter.check(request, method, identity)[0]
+
+    def test_one_address_bucket_covers_every_method_and_forged_headers(self):
+        attempts = [
+            self.attempt('username', forwarded='198.51.100.1'),
+            self.attempt('library_id', forwarded='198.51.100.2'),
+            self.attempt('admin', forwarded='198.51.100.3'),
+        ]
+        self.assertEqual(attempts, [True, True, True])
+        self.assertFalse(self.attempt('credentials', forwarded='198.51.100.4'))
+        self.assertTrue(self.attempt('credentials', remote='203.0.113.8'))
+        self.assertEqual(LoginRateLimiter.get_metrics(['credentials'])['credentials']['throttled_ip'], 1)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_trusted_proxy_supplies_the_client_address(self):
+        for _ in range(3):
+            self.assertTrue(self.attempt(remote='10.0.0.1', forwarded='spoofed, 198.51.100.1'))
+        self.assertFalse(self.attempt(remote='10.0.0.1', forwarded='other, 198.51.100.1'))
+        self.assertTrue(self.attempt(remote='10.0.0.1', forwarded='198.51.100.2'))
+        # A shorter header than the proxy chain is not trusted
+        self.assertTrue(self.attempt(remote='10.0.0.2'))
+
+    def test_identity_bucket_follows_the_identity_across_addresses(self):
+        self.assertTrue(self.attempt(identity='Reader', remote='203.0.113.1'))
+        self.assertTrue(self.attempt(identity=' reader ', remote='203.0.113.2'))
+        self.assertFalse(self.attempt(identity='READER', remote='203.0.113.3'))
+        self.assertTrue(self.attempt(identity='someone-else', remote='203.0.113.4'))
+        # Identity buckets are per login method
+        self.assertTrue(self.attempt('library_id', identity='reader', remote='203.0.113.5'))
+
+    def test_throttled_login_returns_429(self):
+        for _ in range(3):
+            self.client.post(reverse('admin_login'), {'username': 'nobody', 'password': 'wrong'}, REMOTE_ADDR='203.0.113.9')
+        response = self.client.post(reverse('admin_login'), {'username': 'nobody', 'password': 'wrong'}, REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+
+
+class SessionBackendTests(TestCase):
+    """Anonymous sessions stay in the cache; logged-in sessions are written through to the database"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_session_is_promoted_on_login(self):
+        session = SessionStore()
+        session['anon_user_id'] = 1
+        session.save()
+        self.assertFalse(Session.objects.filter(session_key=session.session_key).exists())
+
+        session['user_auth_id'] = 7
+        session.save()
+        self.assertTrue(Session.objects.filter(session_key=session.session_key).exists())
+
+        # Survives losing the cache copy
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key).load()['user_auth_id'], 7)
+
+    def test_logout_without_flush_drops_the_database_copy(self):
+        session = SessionStore()
+        session['user_auth_id'] = 7
+        session.save()
+
+        session = SessionStore(session.session_key)
+        session.load()
+        del session['user_auth_id']
+        session.save()
+        self.assertFalse(Session.objects.filter(session_key=session.session_key).exists())
+        self.assertNotIn('user_auth_id', SessionStore(session.session_key).load())
+
+    def test_staff_login_is_persisted(self):
+        staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        session_key = self.client.session.session_key
+        self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+
+        cache.clear()
+        self.assertEqual(SessionStore(session_key).load()['_auth_user_id'], str(staff.pk))
+
+    def test_anonymous_visits_write_no_session_rows(self):
+        self.client.get(reverse('user_upload_book'))
+        self.assertIn('anon_user_id', self.client.session)
+        self.assertFalse(Session.objects.exists())
+
+
+class ResourceAvailabilityTests(TestCase):
+    """The availability bitmap follows committed checkouts and returns"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='General')
+        self.first, self.second = Resource.objects.bulk_create([
+            Resource(title=f'Resource {i}', resource_id=f'R{i}', category=category, total_quantity=1, available_quantity=1)
+            for i in range(2)
+        ])
+        self.member = Member.objects.create(member_id='M1', first_name='Member', last_name='One')
+
+    def test_checkout_and_return(self):
+        self.assertTrue(ResourceAvailability.is_available(self.first.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = CirculationDesk.checkout(self.member, self.first.id)
+        self.assertFalse(ResourceAvailability.is_available(self.first.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CirculationDesk.return_loan(loan.id)
+        self.assertTrue(ResourceAvailability.is_available(self.first.id))
+
+    def test_checkout_and_return_keep_the_catalog_caches(self):
+        version = CatalogCache.get_version(CatalogCache.RESOURCES)
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = CirculationDesk.checkout(self.member, self.first.id)
+            loan.mark_returned()
+        self.assertEqual(CatalogCache.get_version(CatalogCache.RESOURCES), version)
+
+        # An edit still invalidates
+        self.first.refresh_from_db()
+        self.first.title = 'Renamed'
+        self.first.save()
+        self.assertNotEqual(CatalogCache.get_version(CatalogCache.RESOURCES), version)
+
+    def test_interleaved_changes_are_all_kept(self):
+        ResourceAvailability.get_bitmap()
+        with self.captureOnCommitCallbacks(execute=True):
+            CirculationDesk.checkout(self.member, self.first.id)
+            CirculationDesk.checkout(self.member, self.second.id)
+        self.assertEqual(ResourceAvailability.filter_available([self.first.id, self.second.id]), [])
+
+    def test_rebuild_racing_a_commit_is_not_served(self):
+        # A reader takes the token and reads the database before the checkout commits...
+        version = ResourceAvailability._version()
+        stale = ResourceAvailability.get_bitmap()
+        with self.captureOnCommitCallbacks(execute=True):
+            CirculationDesk.checkout(self.member, self.first.id)
+        # ...and stores its bitmap after the commit
+        cache.set(ResourceAvailability.CACHE_KEY, (version, stale))
+        self.assertFalse(ResourceAvailability.is_available(self.first.id))
+
+    def test_unchanged_availability_keeps_the_bitmap(self):
+        ResourceAvailability.get_bitmap()
+        version = cache.get(ResourceAvailability.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.title = 'Renamed'
+            self.first.save()
+        self.assertEqual(cache.get(ResourceAvailability.VERSION_KEY), version)
+
+
+class AutocompleteTests(TestCase):
+    """Picker lookups match word prefixes and return the same rows on every backend"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='General')
+        # Inserted in reverse so row order differs from member ID order
+        Member.objects.bulk_create([
+            Member(member_id=f'M{i:02d}', first_name='Ann', last_name=f'Lee{i}')
+            for i in reversed(range(AutocompleteIndex.LIMIT + 5))
+        ])
+        Resource.objects.bulk_create([
+            Resource(title='The Hobbit', resource_id='R01', category=category, total_quantity=1, available_quantity=1),
+            Resource(title='Hobbies at home', resource_id='R02', category=category, total_quantity=1, available_quantity=1),
+            Resource(title='Snobbish', resource_id='R03', category=category, total_quantity=1, available_quantity=1),
+        ])
+
+    def fetch(self, vendor):
+        with mock.patch.object(connection, 'vendor', vendor):
+            return (
+                AutocompleteIndex._fetch_members(['ann']),
+                AutocompleteIndex._fetch_resources(['hobb']),
+            )
+
+    @skipUnless(connection.vendor == 'sqlite', 'Compares the FTS5 lookup with the fallback')
+    def test_fallback_matches_fts(self):
+        self.assertEqual(self.fetch('sqlite'), self.fetch('other'))
+
+    def test_limit_keeps_the_lowest_member_ids(self):
+        members, resources = self.fetch(connection.vendor)
+        expected = Member.objects.order_by('member_id')[:AutocompleteIndex.LIMIT]
+        self.assertEqual(sorted(item['id'] for item in members), sorted(member.id for member in expected))
+        # Word prefixes only: "Snobbish" contains "hobb" but no word starts with it
+        self.assertEqual([item['label'] for item in resources], ['Hobbies at home (R02)', 'The Hobbit (R01)'])
+
+    def test_later_words_of_member_names_match(self):
+        member = Member.objects.create(member_id='V1', first_name='Rose', last_name='Van Quillen')
+        for vendor in ('sqlite', 'other'):
+            with self.subTest(vendor=vendor), mock.patch.object(connection, 'vendor', vendor):
+                self.assertEqual([item['id'] for item in AutocompleteIndex._fetch_members(['quil'])], [member.id])
+
+    def test_available_resources_behind_the_cached_candidates_are_found(self):
+        category = Category.objects.get()
+        # The top candidates by resource ID are all on loan
+        Resource.objects.bulk_create([
+            Resource(
+                title=f'Common {i}', resource_id=f'C{i:03d}', category=category, total_quantity=1,
+                available_quantity=int(i >= AutocompleteIndex.RESOURCE_CANDIDATES),
+            )
+            for i in range(AutocompleteIndex.RESOURCE_CANDIDATES + 3)
+        ])
+        labels = [item['label'] for item in AutocompleteIndex.search_resources('common')]
+        candidates = AutocompleteIndex.RESOURCE_CANDIDATES
+        self.assertEqual(labels, [f'Common {i} (C{i:03d})' for i in range(candidates, candidates + 3)])
+
+
+class CirculationBatchTests(TestCase):
+    """Desk batches report failed items without undoing the rest"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='General')
+        self.first, self.second, self.gone = Resource.objects.bulk_create([
+            Resource(title='First', resource_id='R1', category=category, total_quantity=2, available_quantity=2),
+            Resource(title='Second', resource_id='R2', category=category, total_quantity=1, available_quantity=1),
+            Resource(title='Gone', resource_id='R3', category=category, total_quantity=1, available_quantity=0),
+        ])
+        self.member = Member.objects.create(member_id='M1', first_name='Member', last_name='One')
+
+    def post(self, checkout=(), returns=()):
+        return self.client.post(
+            reverse('circulation_batch'),
+            {'member': self.member.id, 'checkout': list(checkout), 'return': list(returns)},
+            content_type='application/json',
+        )
+
+    def test_partial_failure(self):
+        loan = CirculationDesk.checkout(self.member, self.second.id)
+        response = self.post(checkout=[self.first.id, self.gone.id], returns=[loan.id, 999999])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+
+        self.assertEqual([item['ok'] for item in results['returns']], [True, False])
+        self.assertEqual([item['ok'] for item in results['checkouts']], [True, False])
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.available_quantity, 1)
+        self.assertEqual(self.second.available_quantity, 1)
+        self.assertEqual(Transaction.objects.filter(resource=self.gone).count(), 0)
+
+    def test_failed_item_is_rolled_back(self):
+        # The second checkout fails after its decrement and loan row were written
+        with mock.patch(
+            'models.circulation.TrendingCounter.record', side_effect=[None, CirculationError('Counter down.')]
+        ):
+            results = self.post(checkout=[self.first.id, self.second.id]).json()
+
+        self.assertEqual([item['ok'] for item in results['checkouts']], [True, False])
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.available_quantity, self.second.status), (1, 'available'))
+        self.assertFalse(Transaction.objects.filter(resource=self.second).exists())
+        self.assertTrue(Transaction.objects.filter(resource=self.first).exists())
+
+    def test_unexpected_error_rolls_back_the_batch(self):
+        with mock.patch('models.circulation.TrendingCounter.record', side_effect=[None, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                CirculationDesk.process_batch(self.member, [self.first.id, self.second.id], [])
+
+        self.assertFalse(Transaction.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.available_quantity, 2)
+
+    def test_return_increments_in_the_database(self):
+        loan = CirculationDesk.checkout(self.member, self.first.id)
+        # Another desk lends the other copy while this loan's resource is held in memory
+        loan = Transaction.objects.select_related('resource').get(id=loan.id)
+        CirculationDesk.checkout(self.member, self.first.id)
+        loan.mark_returned()
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.available_quantity, 1)
+
+
+class ScanAndLabelTests(TestCase):
+    """Scanned codes follow edits; label sheets render page by page"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+        category = Category.objects.create(name='General')
+        Resource.objects.bulk_create([
+            Resource(title=f'Resource {i}', resource_id=f'R{i:03d}', category=category, shelf_location='A1')
+            for i in range(LabelSheetGenerator.COLUMNS * LabelSheetGenerator.ROWS + 1)
+        ])
+        self.member = Member.objects.create(member_id='M1', first_name='Member', last_name='One')
+
+    def test_edited_resource_code_is_forgotten(self):
+        resource = Resource.objects.get(resource_id='R000')
+        self.assertEqual(ScanLookup.resolve('R000'), ('resource', resource.id))
+
+        resource = Resource.objects.get(id=resource.id)
+        resource.resource_id = 'R999'
+        resource.save()
+        self.assertEqual(ScanLookup.resolve('R000'), (None, None))
+        self.assertEqual(ScanLookup.resolve('R999'), ('resource', resource.id))
+
+    def test_edited_member_code_is_forgotten(self):
+        self.assertEqual(ScanLookup.resolve('M1'), ('member', self.member.id))
+
+        member = Member.objects.get(id=self.member.id)
+        member.member_id = 'M2'
+        member.save()
+        self.assertEqual(ScanLookup.resolve('M1'), (None, None))
+
+    def test_label_sheet_pages(self):
+        job = LabelSheetGenerator.create_job()
+        self.assertTrue(LabelSheetGenerator.run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.labels_done), ('completed', job.labels_total))
+        with job.file.open('rb') as handle:
+            self.assertEqual(len(PdfReader(handle).pages), 2)
+
+
+class InventoryLedgerTests(TestCase):
+    """Snapshots plus events rebuild the quantities held in the Resource table"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='General')
+        self.member = Member.objects.create(member_id='M1', first_name='Member', last_name='One')
+
+    def assertLedgerMatches(self, resource):
+        resource.refresh_from_db()
+        self.assertEqual(
+            InventoryLedger.balance(resource), (resource.total_quantity, resource.available_quantity)
+        )
+        self.assertEqual(list(InventoryLedger.verify()), [])
+
+    def test_rebuild_matches_resource(self):
+        response = self.client.post(reverse('resource_create'), {
+            'upload_mode': 'offline', 'title': 'Ledger', 'resource_id': 'L1', 'category': self.category.id,
+            'total_quantity': 3, 'available_quantity': 2, 'status': 'available',
+        })
+        self.assertEqual(response.status_code, 302)
+        resource = Resource.objects.get(resource_id='L1')
+        self.assertLedgerMatches(resource)
+
+        first = CirculationDesk.checkout(self.member, resource.id)
+        CirculationDesk.checkout(self.member, resource.id)
+        self.assertEqual(InventoryLedger.take_snapshots(min_events=1), 1)
+        first.mark_returned()
+        self.assertLedgerMatches(resource)
+
+    def test_stock_log_alone_moves_no_stock(self):
+        resource = Resource.objects.create(title='Ledger', resource_id='L1', category=self.category)
+        InventoryLedger.record_adjustment(resource, 0, 0, note='created')
+        # As added through StockLogAdmin: history only, the quantities stay as they are
+        StockLog.objects.create(resource=resource, action='repair', quantity=1)
+        StockLog.objects.create(resource=resource, action='lost', quantity=1)
+        self.assertLedgerMatches(resource)
+
+
+class FineAccrualTests(TestCase):
+    """Fines follow the member type's policy, its grace period and cap, and never touch paid fines"""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        category = Category.objects.create(name='General')
+        self.resource = Resource.objects.create(
+            title='Late', resource_id='R1', category=category, total_quantity=10, available_quantity=5
+        )
+        FinePolicy.objects.create(member_type='', daily_rate=Decimal('2.00'), grace_days=3)
+        FinePolicy.objects.create(member_type='faculty', daily_rate=Decimal('1.50'), max_amount=Decimal('10.00'))
+        FinePolicy.objects.create(member_type='staff', daily_rate=Decimal('9.00'), is_active=False)
+        self.members = {
+            member_type: Member.objects.create(member_id=f'M-{member_type}', first_name='Member', last_name='X', member_type=member_type)
+            for member_type in ('student', 'faculty', 'staff')
+        }
+
+    def loan(self, member_type, days_late):
+        return Transaction.objects.create(
+            resource=self.resource, member=self.members[member_type], status='active',
+            due_date=self.today - timedelta(days=days_late),
+        )
+
+    def amounts(self):
+        return dict(Fine.objects.values_list('transaction_id', 'amount'))
+
+    def test_policies(self):
+        in_grace = self.loan('student', 3)
+        student = self.loan('student', 5)
+        capped = self.loan('faculty', 30)
+        faculty = self.loan('faculty', 4)
+        # An inactive policy falls back to the default one
+        staff = self.loan('staff', 4)
+
+        self.assertEqual(FineAccrual.accrue(today=self.today), 4)
+        self.assertEqual(self.amounts(), {
+            student.id: Decimal('4.00'),
+            capped.id: Decimal('10.00'),
+            faculty.id: Decimal('6.00'),
+            staff.id: Decimal('2.00'),
+        })
+        self.assertNotIn(in_grace.id, self.amounts())
+        self.assertEqual(Fine.objects.get(transaction=student).reason, f'Overdue 5 days (accrued {self.today})')
+
+    def test_reaccrual_leaves_paid_fines_alone(self):
+        paid = self.loan('student', 10)
+        open_loan = self.loan('student', 10)
+        FineAccrual.accrue(today=self.today)
+        Fine.objects.filter(transaction=paid).update(is_paid=True)
+
+        later = self.today + timedelta(days=2)
+        self.assertEqual(FineAccrual.accrue(today=later), 1)
+        self.assertEqual(self.amounts(), {paid.id: Decimal('14.00'), open_loan.id: Decimal('18.00')})
+
+    def test_accrual_on_return(self):
+        loan = self.loan('student', 6)
+        loan.mark_returned()
+        self.assertEqual(self.amounts(), {loan.id: Decimal('6.00')})
+        # Returned loans stop accruing
+        FineAccrual.accrue(today=self.today + timedelta(days=5))
+        self.assertEqual(self.amounts(), {loan.id: Decimal('6.00')})
+
+    def test_batches_match_single_statement(self):
+        for member_type in self.members:
+            for days in (1, 4, 9, 40):
+                self.loan(member_type, days)
+        FineAccrual.accrue(today=self.today)
+        expected = set(Fine.objects.values_list('transaction_id', 'amount', 'days_overdue', 'reason'))
+        Fine.objects.all().delete()
+
+        with mock.patch.object(connection, 'vendor', 'other'):
+            FineAccrual.accrue(today=self.today, batch_size=3)
+        self.assertEqual(set(Fine.objects.values_list('transaction_id', 'amount', 'days_overdue', 'reason')), expected)
+        self.assertEqual(len(expected), 10)
+
+
+class FileStreamingTests(TestCase):
+    """Book files are streamed in chunks under ASGI"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+
+    def book(self, title, file_format, content):
+        book = UserBook(title=title, format=file_format, file_size=len(content), is_verified=True)
+        book.file.save(f'{title}.{file_format}', ContentFile(content), save=False)
+        book.save()
+        return book
+
+    async def body(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_download(self):
+        # Several chunks, the last one partial
+        content = b'%PDF-1.4\n' + os.urandom(3 * FILE_CHUNK_SIZE + 123)
+        book = await sync_to_async(self.book)('Streamed', 'pdf', content)
+
+        response = await AsyncClient().get(reverse('user_download_book', args=[book.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.body(response), content)
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Streamed.pdf"')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    async def test_gzip_epub_item(self):
+        book = await sync_to_async(self.book)('Gzipped', 'epub', epub_bytes('Gzipped', 'streamed chapter'))
+        manifest = await sync_to_async(EpubChapterCache.get_manifest)(book)
+        item_path = next(path for path in manifest['items'] if path.endswith('one.xhtml'))
+        self.assertTrue(manifest['items'][item_path]['compressed'])
+
+        response = await AsyncClient().get(
+            reverse('user_read_epub_item', args=[book.id, item_path]), headers={'accept-encoding': 'gzip'}
+        )
+        self.assertEqual(response.status_code, 200)
+        body = await self.body(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        self.assertIn(b'streamed chapter', gzip.decompress(body))
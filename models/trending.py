@@ -0,0 +1,168 @@
+"""
+Trending books and resources.
+Views, reads, downloads, reviews and borrows are counted in hourly ActivityBuckets.
+A periodic task folds recent buckets into exponentially decayed scores and
+caches the ranked ids, so the home page reads the ranking with one cache get.
+Old hourly buckets are compacted into daily ones and dropped after the retention period.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .cache_utils import CatalogCache
+from .models import ActivityBucket, Resource, UserBook
+
+
+class TrendingCounter:
+    """Record activity and rank items by time-decayed popularity"""
+
+    # Relative weight of each event in the trending score
+    EVENT_WEIGHTS = {
+        'view': 1,
+        'read': 2,  # opened in the reader
+        'download': 3,
+        'review': 5,
+        'borrow': 3,
+    }
+
+    HALF_LIFE_HOURS = 24
+    WINDOW_DAYS = 14        # older activity has decayed below 1/1000 of its weight
+    COMPACT_AFTER_DAYS = 2  # hourly buckets older than this become daily buckets
+    RETENTION_DAYS = 90
+    TOP_N = 24
+
+    RANKING_KEY = 'trending:{}'
+
+    @staticmethod
+    def record(item_type, item_id, event, count=1, at=None):
+        """
+        Add count events to the item's current hourly bucket.
+        One UPDATE when the bucket exists; the first event of an hour takes three
+        queries (the UPDATE that misses, the INSERT and a second UPDATE).
+        """
+        start = (at or timezone.now()).replace(minute=0, second=0, microsecond=0)
+        bucket = ActivityBucket.objects.filter(
+            item_type=item_type, item_id=item_id, event=event, period='hour', start=start
+        )
+        if bucket.update(count=F('count') + count):
+            return
+        # Insert an empty bucket (a concurrent request may have won the race) and count into it
+        ActivityBucket.objects.bulk_create(
+            [ActivityBucket(item_type=item_type, item_id=item_id, event=event, period='hour', start=start)],
+            ignore_conflicts=True,
+        )
+        bucket.update(count=F('count') + count)
+
+    @staticmethod
+    def scores(item_type, now=None):
+        """
+        Decayed score of every item with activity in the scoring window.
+        Each bucket counts at its midpoint, halving every HALF_LIFE_HOURS.
+        Returns: dict of item id -> score
+        """
+        now = now or timezone.now()
+        decay = math.log(2) / TrendingCounter.HALF_LIFE_HOURS
+        midpoints = {'hour': timedelta(minutes=30), 'day': timedelta(hours=12)}
+
+        scores = defaultdict(float)
+        buckets = ActivityBucket.objects.filter(
+            item_type=item_type, start__gte=now - timedelta(days=TrendingCounter.WINDOW_DAYS)
+        ).values_list('item_id', 'event', 'period', 'start', 'count')
+        for item_id, event, period, start, count in buckets.iterator(chunk_size=2000):
+            age_hours = max((now - start - midpoints[period]).total_seconds() / 3600, 0)
+            scores[item_id] += TrendingCounter.EVENT_WEIGHTS.get(event, 0) * count * math.exp(-decay * age_hours)
+        return scores
+
+    @staticmethod
+    def update_rankings(now=None):
+        """
+        Recompute and cache the ranked ids of trending books and resources.
+        Returns: dict of item type -> number of ranked items
+        """
+        candidates = {
+            'book': UserBook.objects.filter(is_banned=False, is_verified=True),
+            'resource': Resource.objects.all(),
+        }
+        ranked = {}
+        for item_type, items in candidates.items():
+            scores = TrendingCounter.scores(item_type, now)
+            listed = set(items.filter(id__in=list(scores)).values_list('id', flat=True)) if scores else set()
+            ranking = sorted(listed, key=lambda item_id: (-scores[item_id], item_id))[:TrendingCounter.TOP_N]
+            cache.set(TrendingCounter.RANKING_KEY.format(item_type), ranking, None)
+            ranked[item_type] = len(ranking)
+
+        # The home page fragment embeds the ranking
+        CatalogCache.invalidate(CatalogCache.BOOKS)
+        return ranked
+
+    @staticmethod
+    def ranking(item_type):
+        """
+        Cached trending ids, best first; None until update_rankings has run.
+        Returns: list of ids or None
+        """
+        return cache.get(TrendingCounter.RANKING_KEY.format(item_type))
+
+    @staticmethod
+    def ranked(queryset, item_type, limit):
+        """
+        The top trending rows of queryset in ranking order (lazy).
+        Returns: QuerySet, or None when no ranking is cached
+        """
+        ids = TrendingCounter.ranking(item_type)
+        if ids is None:
+            return None
+        ids = ids[:limit]
+        position = Case(*[When(id=item_id, then=rank) for rank, item_id in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(id__in=ids).order_by(position) if ids else queryset.none()
+
+    @staticmethod
+    def compact(now=None):
+        """
+        Merge hourly buckets of days older than COMPACT_AFTER_DAYS into daily
+        buckets and delete buckets past RETENTION_DAYS.
+        Returns: (hourly buckets compacted, buckets deleted)
+        """
+        now = timezone.localtime(now or timezone.now())
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff = midnight - timedelta(days=TrendingCounter.COMPACT_AFTER_DAYS)
+        expired = midnight - timedelta(days=TrendingCounter.RETENTION_DAYS)
+
+        with transaction.atomic():
+            hourly = ActivityBucket.objects.filter(period='hour', start__lt=cutoff)
+            totals = {
+                (row['item_type'], row['item_id'], row['event'], row['day']): row['total']
+                for row in hourly.annotate(day=TruncDay('start')).values(
+                    'item_type', 'item_id', 'event', 'day'
+                ).annotate(total=Sum('count')).order_by()
+            }
+            if totals:
+                # Add to daily buckets already written for those days (late or backfilled events)
+                existing = ActivityBucket.objects.filter(
+                    period='day', start__gte=min(key[3] for key in totals), start__lt=cutoff
+                ).values_list('item_type', 'item_id', 'event', 'start', 'count')
+                for item_type, item_id, event, start, count in existing:
+                    key = (item_type, item_id, event, start)
+                    if key in totals:
+                        totals[key] += count
+
+                ActivityBucket.objects.bulk_create(
+                    [
+                        ActivityBucket(item_type=item_type, item_id=item_id, event=event, period='day', start=day, count=total)
+                        for (item_type, item_id, event, day), total in totals.items()
+                    ],
+                    batch_size=1000,
+                    update_conflicts=True,
+                    unique_fields=['item_type', 'item_id', 'event', 'period', 'start'],
+                    update_fields=['count'],
+                )
+            compacted = hourly.delete()[0]
+
+        deleted = ActivityBucket.objects.filter(start__lt=expired).delete()[0]
+        return compacted, deleted
@@ -2,8 +2,16 @@
 User authentication and session management utilities for the user-side application.
 """
 import json
+import random
+import string
+import uuid
+import time
 from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.http import HttpRequest
 from .models import AnonymousUser, UserAuthentication, Member
 from .encryption import PrivacyEncryption
@@ -28,6 +36,9 @@ class UserSessionManager:
             user.last_activity = timezone.now()
             user.save(update_fields=['last_activity'])
         except AnonymousUser.DoesNotExist:
+            # session_key is unique, so make sure this visitor has one
+            if not request.session.session_key:
+                request.session.save()
             # Create new anonymous user
             user_id = PrivacyEncryption.generate_anonymous_user_id()
             user = AnonymousUser.objects.create(
@@ -41,6 +52,25 @@ class UserSessionManager:
         
         return user
     
+    @staticmethod
+    def touch_anonymous_user(request):
+        """
+        Record activity of the current anonymous visitor.
+        The database is only hit once per ANONYMOUS_ACTIVITY_INTERVAL per session;
+        in between, the id remembered in the session is reused.
+        Returns: AnonymousUser id
+        """
+        now = time.time()
+        anon_user_id = request.session.get('anon_user_id')
+        last_seen = request.session.get('anon_last_seen', 0)
+        if anon_user_id and now - last_seen < settings.ANONYMOUS_ACTIVITY_INTERVAL:
+            return anon_user_id
+
+        anon_user = UserSessionManager.get_or_create_anonymous_user(request)
+        request.session['anon_user_id'] = anon_user.id
+        request.session['anon_last_seen'] = now
+        return anon_user.id
+
     @staticmethod
     def _extract_fingerprint(request):
         """
@@ -56,30 +86,102 @@ class UserSessionManager:
     
     @staticmethod
     def _get_client_ip(request):
-        """Get client IP address from request"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        """
+        Get client IP address from request.
+        X-Forwarded-For is client controlled; only the entry appended by the
+        outermost of the TRUSTED_PROXY_COUNT proxies in front of the app is used.
+        """
+        proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if proxies and len(forwarded) >= proxies:
+            return forwarded[-proxies]
+        return request.META.get('REMOTE_ADDR')
     
+    # Random candidates checked per query; longer suffixes are tried if a round is exhausted
+    USERNAME_CANDIDATES = 32
+    USERNAME_SUFFIX_LENGTHS = (4, 6, 8)
+    USERNAME_CREATE_ATTEMPTS = 3
+
     @staticmethod
     def generate_unique_username(base='user'):
-        """Create a unique username by adding a random suffix if needed."""
-        import random, string
-        username = base
-        if not UserAuthentication.objects.filter(username=username).exists():
-            return username
+        """
+        Create a unique username by adding a random suffix if needed.
+        A batch of candidates is checked with a single username__in query.
+        """
+        max_length = UserAuthentication._meta.get_field('username').max_length
+        base = base[:max_length - 1 - max(UserSessionManager.USERNAME_SUFFIX_LENGTHS)]
+        alphabet = string.ascii_lowercase + string.digits
 
-        for _ in range(20):
-            suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
-            candidate = f"{base}_{suffix}"
-            if not UserAuthentication.objects.filter(username=candidate).exists():
-                return candidate
+        for round_number, suffix_length in enumerate(UserSessionManager.USERNAME_SUFFIX_LENGTHS):
+            candidates = [base] if round_number == 0 else []
+            candidates += [
+                f"{base}_{''.join(random.choices(alphabet, k=suffix_length))}"
+                for _ in range(UserSessionManager.USERNAME_CANDIDATES)
+            ]
+            taken = set(
+                UserAuthentication.objects.filter(username__in=candidates)
+                .values_list('username', flat=True)
+            )
+            for candidate in candidates:
+                if candidate not in taken:
+                    return candidate
 
         # Fallback unique variant
-        return f"{base}_{timezone.now().strftime('%f')}"
+        return f"{base}_{uuid.uuid4().hex[:max(UserSessionManager.USERNAME_SUFFIX_LENGTHS)]}"
+
+    @staticmethod
+    def _create_user_auth(username_base, **fields):
+        """
+        Create a UserAuthentication with a free username derived from username_base.
+        Retries when a concurrent registration takes the same username first.
+        """
+        for attempt in range(UserSessionManager.USERNAME_CREATE_ATTEMPTS):
+            username = UserSessionManager.generate_unique_username(base=username_base)
+            try:
+                with transaction.atomic():
+                    return UserAuthentication.objects.create(username=username, **fields)
+            except IntegrityError:
+                if attempt == UserSessionManager.USERNAME_CREATE_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def _is_banned(user_auth):
+        """Check the banned flag and any active UserBan record"""
+        if user_auth.is_banned:
+            return True
+        ban = getattr(user_auth, 'ban', None)
+        return bool(ban and ban.is_active)
+
+    @staticmethod
+    def verify_password(user_auth, password):
+        """
+        Check a password against the stored KDF verifier.
+        Rows created before verifiers existed are checked against the encrypted
+        credentials once and then upgraded, so later logins skip decryption.
+        Returns: True if the password matches
+        """
+        if user_auth.password_verifier:
+            def upgrade(raw_password):
+                # Work factor changed since the verifier was stored
+                user_auth.password_verifier = PrivacyEncryption.make_password_verifier(raw_password)
+                user_auth.save(update_fields=['password_verifier'])
+
+            return PrivacyEncryption.check_password_verifier(password, user_auth.password_verifier, upgrade)
+
+        if not user_auth.encrypted_auth_data:
+            return False
+
+        try:
+            _, _, stored_cred = PrivacyEncryption.decrypt_auth_data(user_auth.encrypted_auth_data)
+        except ValueError:
+            return False
+
+        if not constant_time_compare(stored_cred, password):
+            return False
+
+        user_auth.password_verifier = PrivacyEncryption.make_password_verifier(password)
+        user_auth.save(update_fields=['password_verifier'])
+        return True
 
     @staticmethod
     def authenticate_with_library_id(library_id, username=None):
@@ -87,37 +189,24 @@ class UserSessionManager:
         Authenticate user with library/student ID and optional username.
         Returns: UserAuthentication instance or None
         """
-        encrypted_id = PrivacyEncryption.encrypt_library_id(library_id)
-
+        users = UserAuthentication.objects.filter(
+            identity_hash__in=PrivacyEncryption.identity_hashes('library_id', library_id)
+        ).order_by('id')
         if username:
-            try:
-                user_auth = UserAuthentication.objects.get(
-                    encrypted_library_id=encrypted_id,
-                    username=username,
-                    is_active=True,
-                    is_banned=False
-                )
+            users = users.filter(username=username)
 
-                if user_auth.ban and user_auth.ban.is_active:
-                    return None
-                return user_auth
-            except UserAuthentication.DoesNotExist:
+        user_auth = users.first()
+        if user_auth:
+            if not user_auth.is_active or UserSessionManager._is_banned(user_auth):
                 return None
+            return user_auth
 
-        try:
-            user_auth = UserAuthentication.objects.get(
-                encrypted_library_id=encrypted_id,
-                is_active=True,
-                is_banned=False
-            )
+        if username:
+            return None
 
-            if user_auth.ban and user_auth.ban.is_active:
-                return None
-            return user_auth
-        except UserAuthentication.DoesNotExist:
-            # Auto-create account for first-time user
-            generated = UserSessionManager.generate_unique_username(base=f"user{library_id[:3]}")
-            return UserSessionManager.create_library_id_user(library_id, username=generated)
+        # Auto-create account for first-time user
+        generated = UserSessionManager.generate_unique_username(base=f"user{library_id[:3]}")
+        return UserSessionManager.create_library_id_user(library_id, username=generated)
 
     
     @staticmethod
@@ -125,35 +214,34 @@ class UserSessionManager:
         """
         Authenticate user with name, phone, and credentials.
         If user doesn't exist, create new UserAuthentication.
-        Returns: UserAuthentication instance
+        Returns: UserAuthentication instance or None (wrong credentials / banned)
         """
-        encrypted_auth = PrivacyEncryption.encrypt_auth_data(name, phone, credentials)
+        user_auth = UserAuthentication.objects.filter(
+            identity_hash__in=PrivacyEncryption.identity_hashes('credentials', name, phone),
+            auth_method='credentials'
+        ).order_by('id').first()
         
-        try:
-            user_auth = UserAuthentication.objects.get(
-                encrypted_auth_data=encrypted_auth,
-                is_active=True
-            )
-            
-            # Check if user is banned
-            if user_auth.ban and user_auth.ban.is_active:
+        if user_auth:
+            if not user_auth.is_active or UserSessionManager._is_banned(user_auth):
+                return None
+            if not UserSessionManager.verify_password(user_auth, credentials):
                 return None
-            
-            return user_auth
-        except UserAuthentication.DoesNotExist:
-            # Create new user with credentials
-            generated = UserSessionManager.generate_unique_username(base=f"user{phone[-3:] if phone else 'x'}")
-            user_auth = UserAuthentication.objects.create(
-                encrypted_auth_data=encrypted_auth,
-                auth_method='credentials',
-                username=generated,
-                is_active=True
-            )
             return user_auth
+        
+        # Create new user with credentials
+        user_auth = UserSessionManager._create_user_auth(
+            f"user{phone[-3:] if phone else 'x'}",
+            encrypted_auth_data=PrivacyEncryption.encrypt_auth_data(name, phone, credentials),
+            identity_hash=PrivacyEncryption.identity_hash('credentials', name, phone),
+            password_verifier=PrivacyEncryption.make_password_verifier(credentials),
+            auth_method='credentials',
+            is_active=True
+        )
+        return user_auth
     
     @staticmethod
     def authenticate_with_username(username, password):
-        """Authenticate user using username & password from encrypted credentials."""
+        """Authenticate user using username & password: indexed lookup plus one verifier check."""
         if username == 'admin' and password == '12345':
             # handled as custom admin in view layer
             return None
@@ -164,22 +252,18 @@ class UserSessionManager:
                 is_active=True,
                 is_banned=False
             )
-
-            if user_auth.ban and user_auth.ban.is_active:
-                return None
-
-            if user_auth.encrypted_auth_data:
-                try:
-                    _, _, stored_cred = PrivacyEncryption.decrypt_auth_data(user_auth.encrypted_auth_data)
-                    if stored_cred == password:
-                        return user_auth
-                except Exception:
-                    return None
-
-            return None
         except UserAuthentication.DoesNotExist:
+            # Run the KDF anyway so response time does not reveal unknown usernames
+            PrivacyEncryption.make_password_verifier(password)
+            return None
+
+        if UserSessionManager._is_banned(user_auth):
             return None
 
+        if UserSessionManager.verify_password(user_auth, password):
+            return user_auth
+        return None
+
     @staticmethod
     def create_library_id_user(library_id, username=None, password=None, member=None):
         """
@@ -187,27 +271,25 @@ class UserSessionManager:
         """
         encrypted_id = PrivacyEncryption.encrypt_library_id(library_id)
 
-        if not username:
-            username = UserSessionManager.generate_unique_username(base=f"user{library_id[:3]}")
-        else:
-            if UserAuthentication.objects.filter(username=username).exists():
-                username = UserSessionManager.generate_unique_username(base=username)
-
         encrypted_auth = None
+        password_verifier = ''
         if password:
             # store password encrypted in the same field as raw credentials path
             encrypted_auth = PrivacyEncryption.encrypt_auth_data('', '', password)
+            password_verifier = PrivacyEncryption.make_password_verifier(password)
 
-        user_auth = UserAuthentication.objects.create(
+        # The requested username is kept when free, otherwise a suffix is added
+        user_auth = UserSessionManager._create_user_auth(
+            username or f"user{library_id[:3]}",
             encrypted_library_id=encrypted_id,
+            identity_hash=PrivacyEncryption.identity_hash('library_id', library_id),
             auth_method='library_id' if 'student' not in library_id.lower() else 'student_id',
-            username=username,
             encrypted_auth_data=encrypted_auth,
+            password_verifier=password_verifier,
             member=member,
             is_active=True
         )
         return user_auth
-        return user_auth
 
 
 class OverdueTracker:
@@ -255,6 +337,23 @@ class OverdueTracker:
             transaction.status = 'overdue'
             transaction.save(update_fields=['status'])
     
+    @staticmethod
+    def overdue_members():
+        """
+        Members with loans flagged overdue, counted in one grouped query.
+        Returns: list of {'member': Member, 'overdue_count': int}
+        """
+        from .models import Transaction
+
+        counts = dict(
+            Transaction.objects.filter(status='overdue').order_by()
+            .values_list('member_id').annotate(overdue_count=Count('id'))
+        )
+        return [
+            {'member': member, 'overdue_count': counts[member.id]}
+            for member in Member.objects.filter(id__in=counts)
+        ]
+    
     @staticmethod
     def cleanup_expired_sessions():
         """
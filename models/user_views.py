@@ -2,26 +2,46 @@
 User-facing views for the library system.
 Includes authentication, book browsing, uploads, reading, and reviews.
 """
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
-from django.http import JsonResponse, FileResponse, HttpResponse
-from django.db.models import Q, Count, Avg
+from django.http import JsonResponse, FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.db.models import Q, Count, Avg, F
 from django.utils import timezone
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from datetime import timedelta
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import content_disposition_header
+from django.db import transaction as db_transaction
+from asgiref.sync import sync_to_async
+import gzip
 import json
+import mimetypes
+import os
 
 from .models import (
     UserBook, UserReview, AnonymousUser, UserAuthentication, 
-    Resource, Transaction, Member, UserBan, Fine
+    Resource, Transaction, Member, UserBan, Fine, UploadScreening
 )
 from .forms import (
     UserLoginForm, UserBookUploadForm, UserReviewForm
 )
 from .user_utils import UserSessionManager
+from .circulation import CirculationDesk, CirculationError
 from .encryption import PrivacyEncryption
+from .epub_utils import EpubChapterCache
+from .search_utils import BookContentIndexer
+from .cache_utils import CatalogCache
+from .rate_limit import LoginRateLimiter
+from .availability import ResourceAvailability
+from .recommendations import CoOccurrenceRecommender
+from .trending import TrendingCounter
+from .storage import BookStorageManager
 
 
 # ========== AUTHENTICATION VIEWS ==========
@@ -35,6 +55,20 @@ def user_login(request):
         if form.is_valid():
             login_method = form.cleaned_data.get('login_method')
             
+            # Throttle before any encryption or database work
+            identity = {
+                'library_id': form.cleaned_data.get('library_id'),
+                'student_id': form.cleaned_data.get('library_id'),
+                'username': form.cleaned_data.get('username'),
+                'credentials': form.cleaned_data.get('user_phone'),
+            }.get(login_method)
+            allowed, retry_after = LoginRateLimiter.check(request, login_method, identity)
+            if not allowed:
+                messages.error(request, f'Too many login attempts. Please try again in {retry_after} seconds.')
+                response = render(request, 'user/login.html', {'form': form}, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+            
             # Authentication methods
             if login_method in ['library_id', 'student_id']:
                 user_id = form.cleaned_data.get('library_id')
@@ -128,15 +162,15 @@ def user_logout(request):
 
 def user_home(request):
     """Public home page for user side"""
-    # Get or create anonymous user
-    anon_user = UserSessionManager.get_or_create_anonymous_user(request)
-    request.session['anon_user_id'] = anon_user.id
+    # Get or create anonymous user (throttled, so most views write nothing)
+    UserSessionManager.touch_anonymous_user(request)
     
-    # Get featured books
-    featured_books = UserBook.objects.filter(
-        is_banned=False,
-        is_verified=True
-    ).order_by('-rating_avg', '-view_count')[:6]
+    # Get featured books: trending by recent activity, all-time ratings until a ranking exists
+    listed_books = UserBook.objects.filter(is_banned=False, is_verified=True)
+    featured_books = TrendingCounter.ranked(listed_books, 'book', 6)
+    if featured_books is None:
+        featured_books = listed_books.order_by('-rating_avg', '-view_count')[:6]
+    trending_resources = TrendingCounter.ranked(Resource.objects.all(), 'resource', 6)
     
     # Get latest books
     latest_books = UserBook.objects.filter(
@@ -144,10 +178,14 @@ def user_home(request):
         is_verified=True
     ).order_by('-created_at')[:6]
     
+    # Querysets stay lazy; they only run when the cached fragments have expired
     context = {
         'featured_books': featured_books,
         'latest_books': latest_books,
+        'trending_resources': trending_resources,
         'is_authenticated': 'user_auth_id' in request.session,
+        'cache_timeout': CatalogCache.timeout(),
+        'catalog_version': CatalogCache.get_version(CatalogCache.BOOKS),
     }
     return render(request, 'user/home.html', context)
 
@@ -192,16 +230,14 @@ def user_dashboard(request):
 
 # ========== BOOK BROWSING & READING ==========
 
-def user_browse_books(request):
+async def user_browse_books(request):
     """Browse digital books with search and filter"""
     books = UserBook.objects.filter(
         is_banned=False,
         is_verified=True
     ).order_by('-created_at')
     
-    resources = Resource.objects.filter(
-        status='available'
-    ).order_by('-created_at')
+    resources = ResourceAvailability.available_queryset().order_by('-created_at')
 
     # Search
     search_query = request.GET.get('search', '')
@@ -231,17 +267,56 @@ def user_browse_books(request):
     # Pagination
     paginator = Paginator(books, 12)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    
+    catalog_version = await sync_to_async(CatalogCache.get_version)(CatalogCache.BOOKS, CatalogCache.RESOURCES)
+    cache_query = CatalogCache.querystring_key(request.GET)
+    
+    fragment_key = make_template_fragment_key('browse_results', [catalog_version, cache_query])
+    if await cache.ahas_key(fragment_key):
+        # Evaluated lazily so a cached results fragment never touches the database
+        page_obj = SimpleLazyObject(lambda: paginator.get_page(page_number))
+        content_hits = SimpleLazyObject(
+            lambda: BookContentIndexer.search(search_query, limit=10) if search_query else []
+        )
+    else:
+        # The fragment will be rendered: run its queries with the async ORM first
+        paginator.count = await books.acount()
+        page_obj = paginator.get_page(page_number)
+        page_obj.object_list = [book async for book in page_obj.object_list]
+        resources = [resource async for resource in resources]
+        content_hits = await sync_to_async(BookContentIndexer.search)(search_query, limit=10) if search_query else []
     
     context = {
         'page_obj': page_obj,
         'resources': resources,
+        'content_hits': content_hits,
         'search_query': search_query,
         'book_format': book_format,
         'sort_by': sort_by,
-        'is_authenticated': 'user_auth_id' in request.session,
+        'is_authenticated': await sync_to_async(lambda: 'user_auth_id' in request.session)(),
+        'cache_timeout': CatalogCache.timeout(),
+        'catalog_version': catalog_version,
+        'cache_query': cache_query,
     }
-    return render(request, 'user/browse_books.html', context)
+    return await _arender(request, 'user/browse_books.html', context)
+
+
+def user_search_book_contents(request):
+    """Search inside book contents - returns passages with page numbers as JSON"""
+    query = request.GET.get('q', '').strip()
+    book_id = request.GET.get('book')
+
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        book_id = int(book_id) if book_id else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+
+    hits = BookContentIndexer.search(query, limit=limit, book_id=book_id) if query else []
+    for hit in hits:
+        hit['url'] = reverse('user_book_detail', kwargs={'book_id': hit['book_id']})
+
+    return JsonResponse({'query': query, 'results': hits})
 
 
 def user_book_detail(request, book_id):
@@ -250,6 +325,7 @@ def user_book_detail(request, book_id):
     
     # Increment view count
     book.increment_view_count()
+    TrendingCounter.record('book', book.id, 'view')
     
     # Get reviews
     reviews = book.reviews.filter(is_flagged=False).order_by('-created_at')
@@ -266,6 +342,7 @@ def user_book_detail(request, book_id):
         'book': book,
         'reviews': reviews,
         'anon_user': anon_user,
+        'recommendations': CoOccurrenceRecommender.neighbors_for(book, 'book'),
     }
     return render(request, 'user/book_detail.html', context)
 
@@ -285,13 +362,17 @@ def user_resource_detail(request, resource_id):
     context = {
         'resource': resource,
         'stats': stats,
+        'recommendations': CoOccurrenceRecommender.neighbors_for(resource, 'resource'),
     }
     return render(request, 'user/resource_detail.html', context)
 
 
-def user_read_book_pdf(request, book_id):
+async def user_read_book_pdf(request, book_id):
     """Read PDF in browser"""
-    book = get_object_or_404(UserBook, id=book_id, format='pdf', is_banned=False)
+    book = await aget_object_or_404(UserBook, id=book_id, format='pdf', is_banned=False)
+    await _aensure_hot(book)
+    # Keeps books that are only ever read in the browser out of the archive
+    await sync_to_async(TrendingCounter.record)('book', book.id, 'read')
     
     # Generate absolute URL to avoid browser path issues
     book_url = request.build_absolute_uri(book.file.url)
@@ -300,37 +381,128 @@ def user_read_book_pdf(request, book_id):
         'book': book,
         'book_url': book_url,
     }
-    return render(request, 'user/read_pdf.html', context)
+    return await _arender(request, 'user/read_pdf.html', context)
 
 
-def user_read_book_epub(request, book_id):
+async def user_read_book_epub(request, book_id):
     """Read EPUB in browser"""
-    book = get_object_or_404(UserBook, id=book_id, format='epub', is_banned=False)
-    
-    book_url = request.build_absolute_uri(book.file.url)
+    book = await aget_object_or_404(UserBook, id=book_id, format='epub', is_banned=False)
+    await _aensure_hot(book)
+    # Counted once per opening; the item requests that follow are not
+    await sync_to_async(TrendingCounter.record)('book', book.id, 'read')
+    
+    # Point the reader at the unpacked package document so it only fetches the
+    # spine items it renders; fall back to the whole archive if unpacking failed
+    manifest = await sync_to_async(EpubChapterCache.get_manifest, thread_sensitive=False)(book)
+    if manifest:
+        book_url = request.build_absolute_uri(
+            reverse('user_read_epub_item', kwargs={'book_id': book.id, 'item_path': manifest['opf_path']})
+        )
+    else:
+        book_url = request.build_absolute_uri(book.file.url)
 
     context = {
         'book': book,
         'book_url': book_url,
     }
-    return render(request, 'user/read_epub.html', context)
+    return await _arender(request, 'user/read_epub.html', context)
+
+
+async def user_read_epub_item(request, book_id, item_path):
+    """Serve a single unpacked EPUB item (chapter, stylesheet, image)"""
+    book = await aget_object_or_404(UserBook, id=book_id, format='epub', is_banned=False)
+    await _aensure_hot(book)
+
+    manifest = await sync_to_async(EpubChapterCache.get_manifest, thread_sensitive=False)(book)
+    if not manifest:
+        raise Http404('EPUB could not be unpacked')
 
+    path, item = await sync_to_async(EpubChapterCache.get_item_path, thread_sensitive=False)(book, manifest, item_path)
+    if path is None:
+        raise Http404('EPUB item not found')
 
-def user_download_book(request, book_id):
+    if item['compressed'] and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = await _afile_response(request, await _aopen(path), item['media_type'])
+        response['Content-Encoding'] = 'gzip'
+    elif item['compressed']:
+        content = await sync_to_async(path.read_bytes, thread_sensitive=False)()
+        response = HttpResponse(gzip.decompress(content), content_type=item['media_type'])
+    else:
+        response = await _afile_response(request, await _aopen(path), item['media_type'])
+
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, private=True, max_age=86400)
+    return response
+
+
+async def user_download_book(request, book_id):
     """Download book file"""
-    book = get_object_or_404(UserBook, id=book_id, is_banned=False)
+    book = await aget_object_or_404(UserBook, id=book_id, is_banned=False)
     
     # Increment download count
-    book.increment_download_count()
+    await UserBook.objects.filter(id=book.id).aupdate(download_count=F('download_count') + 1)
+    await sync_to_async(TrendingCounter.record)('book', book.id, 'download')
     
     if book.file:
-        response = FileResponse(book.file.open('rb'))
-        response['Content-Disposition'] = f'attachment; filename="{book.title}.{book.format}"'
-        return response
+        await _aensure_hot(book)
+        book_file = await sync_to_async(book.file.open, thread_sensitive=False)('rb')
+        return await _afile_response(request, book_file, filename=f"{book.title}.{book.format}")
     
     return HttpResponse('File not found', status=404)
 
 
+# ========== ASYNC HELPERS ==========
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+async def _arender(request, template_name, context):
+    """render() in a worker thread: templates read the session and context processors may query"""
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def _aensure_hot(book):
+    """Recall an archived book file to local disk before it is served"""
+    if book.storage_tier == 'archive':
+        await sync_to_async(BookStorageManager.recall)(book)
+
+
+async def _aopen(path):
+    """Open a local file for reading without blocking the event loop"""
+    return await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+
+
+async def _aiter_file(open_file, chunk_size=FILE_CHUNK_SIZE):
+    """Read an open file chunk by chunk in worker threads"""
+    read = sync_to_async(open_file.read, thread_sensitive=False)
+    try:
+        while chunk := await read(chunk_size):
+            yield chunk
+    finally:
+        await sync_to_async(open_file.close, thread_sensitive=False)()
+
+
+async def _afile_response(request, open_file, content_type=None, filename=None):
+    """
+    Stream an open file. Under ASGI it is read in chunks off the event loop; under
+    WSGI FileResponse lets the server send it (wsgi.file_wrapper).
+    """
+    if not isinstance(request, ASGIRequest):
+        return FileResponse(open_file, as_attachment=bool(filename), filename=filename or '', content_type=content_type)
+
+    if content_type is None:
+        content_type = mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+    response = StreamingHttpResponse(_aiter_file(open_file), content_type=content_type)
+    size = await sync_to_async(lambda: getattr(open_file, 'size', None), thread_sensitive=False)()
+    if size is None and hasattr(open_file, 'fileno'):
+        size = os.fstat(open_file.fileno()).st_size
+    if size is not None:
+        response['Content-Length'] = str(size)
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
 # ========== BOOK UPLOAD & MANAGEMENT ==========
 
 @require_http_methods(["GET", "POST"])
@@ -341,19 +513,27 @@ def user_upload_book(request):
 
     if request.method == 'POST':
         form = UserBookUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            quota_error = BookStorageManager.quota_error(anon_user, request.FILES['file'].size)
+            if quota_error:
+                form.add_error('file', quota_error)
         if form.is_valid():
             book = form.save(commit=False)
             book.uploaded_by_user = anon_user
             book.file_size = request.FILES['file'].size
             book.is_verified = False  # Admin must verify
             book.save()
+            # Checked by the screen_uploads task before it reaches the moderation queue
+            UploadScreening.objects.create(book=book)
+            BookContentIndexer.enqueue(book)
 
             messages.success(request, 'Book uploaded successfully! Awaiting admin verification.')
             return redirect('user_dashboard')
     else:
         form = UserBookUploadForm()
 
-    context = {'form': form}
+    used, quota = BookStorageManager.user_usage(anon_user)
+    context = {'form': form, 'storage_used': used, 'storage_quota': quota}
     return render(request, 'user/upload_book.html', context)
 
 
@@ -404,6 +584,7 @@ def user_leave_review(request, book_id):
         review.book = book
         review.user = anon_user
         review.save()
+        TrendingCounter.record('book', book.id, 'review')
         
         # Update book's average rating
         avg_rating = book.reviews.aggregate(Avg('rating'))['rating__avg']
@@ -445,10 +626,7 @@ def user_borrow_library_book(request):
         return redirect('user_dashboard')
     
     # Get available books
-    books = Resource.objects.filter(
-        available_quantity__gt=0,
-        status='available'
-    ).order_by('title')
+    books = ResourceAvailability.available_queryset().order_by('title')
     
     # Search
     search_query = request.GET.get('search', '')
@@ -480,25 +658,18 @@ def user_checkout_book(request, resource_id):
     user_auth_id = request.session.get('user_auth_id')
     try:
         user_auth = UserAuthentication.objects.get(id=user_auth_id)
-        resource = Resource.objects.get(id=resource_id, available_quantity__gt=0)
-    except (UserAuthentication.DoesNotExist, Resource.DoesNotExist):
+    except UserAuthentication.DoesNotExist:
         return JsonResponse({'error': 'Invalid request'}, status=400)
     
     if not user_auth.member:
         return JsonResponse({'error': 'Member record not found'}, status=400)
     
-    # Create transaction
-    due_date = timezone.now().date() + timedelta(days=15)
-    transaction = Transaction.objects.create(
-        resource=resource,
-        member=user_auth.member,
-        due_date=due_date,
-        status='active'
-    )
-    
-    # Update resource availability
-    resource.available_quantity -= 1
-    resource.save(update_fields=['available_quantity'])
+    try:
+        with db_transaction.atomic():
+            loan = CirculationDesk.checkout(user_auth.member, resource_id)
+    except CirculationError:
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    due_date = loan.due_date
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
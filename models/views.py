@@ -1,11 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
+from django.http import JsonResponse
 from django.db.models import Q, Count, Sum
+from django.db import transaction as db_transaction
 from django.utils import timezone
-from datetime import timedelta
+import json
 from .models import Resource, Category, Member, Transaction, StockLog, UserBook, AnonymousUser
 from .forms import ResourceForm, CategoryForm, MemberForm, CheckoutForm, StockLogForm, SearchForm, UserBookUploadForm
+from .epub_utils import EpubChapterCache
+from .search_utils import BookContentIndexer
+from .storage import BookStorageManager
+from .autocomplete import AutocompleteIndex
+from .circulation import CirculationDesk, CirculationError, ScanLookup
+from .inventory import InventoryLedger
+from .user_utils import OverdueTracker
 
 
 # ============= DASHBOARD =============
@@ -126,6 +135,7 @@ def resource_delete_user_book(request, book_id):
         book.file.delete(save=False)
     if book.cover_image:
         book.cover_image.delete(save=False)
+    EpubChapterCache.invalidate(book)
     book.delete()
     messages.success(request, f'Online book "{title}" deleted successfully.')
     return redirect('resource_list')
@@ -139,6 +149,9 @@ def resource_edit_user_book(request, book_id):
         form = UserBookUploadForm(request.POST, request.FILES, instance=book)
         if form.is_valid():
             form.save()
+            if 'file' in form.changed_data:
+                BookStorageManager.file_replaced(book)
+                BookContentIndexer.enqueue(book)
             messages.success(request, f'Online book "{book.title}" updated successfully.')
             return redirect('resource_list')
     else:
@@ -160,6 +173,7 @@ def resource_view_user_book(request, book_id):
         messages.error(request, 'This book has been banned and cannot be viewed.')
         return redirect('resource_list')
 
+    BookStorageManager.ensure_hot(book)
     if book.format == 'pdf':
         book_url = request.build_absolute_uri(book.file.url)
         context = {
@@ -207,6 +221,7 @@ def resource_create(request):
             book.is_banned = False
             book.file_size = book.file.size if book.file else 0
             book.save()
+            BookContentIndexer.enqueue(book)
             messages.success(request, f'Online book "{book.title}" created and verified successfully!')
             return redirect('resource_list')
         resource_form = ResourceForm()
@@ -215,13 +230,19 @@ def resource_create(request):
         resource_form = ResourceForm(request.POST, request.FILES)
         user_book_form = UserBookUploadForm()
         if resource_form.is_valid():
-            resource = resource_form.save()
-            StockLog.objects.create(
-                resource=resource,
-                action='add',
-                quantity=resource.total_quantity,
-                reason='Initial stock entry'
-            )
+            with db_transaction.atomic():
+                resource = resource_form.save()
+                stock_log = StockLog.objects.create(
+                    resource=resource,
+                    action='add',
+                    quantity=resource.total_quantity,
+                    reason='Initial stock entry'
+                )
+                InventoryLedger.record_stock_log(stock_log)
+                # The stock entry counts every copy as available; record any that are not
+                InventoryLedger.record_adjustment(
+                    resource, resource.total_quantity, resource.total_quantity, note='initial availability'
+                )
             messages.success(request, f'Resource "{resource.title}" created successfully!')
             return redirect('resource_detail', pk=resource.pk)
 
@@ -242,9 +263,13 @@ def resource_edit(request, pk):
     resource = get_object_or_404(Resource, pk=pk)
     
     if request.method == 'POST':
+        # The form writes into the instance while validating; keep the quantities for the ledger
+        old_total, old_available = resource.total_quantity, resource.available_quantity
         form = ResourceForm(request.POST, request.FILES, instance=resource)
         if form.is_valid():
-            form.save()
+            with db_transaction.atomic():
+                form.save()
+                InventoryLedger.record_adjustment(resource, old_total, old_available, note='edited')
             messages.success(request, f'Resource "{resource.title}" updated successfully!')
             return redirect('resource_detail', pk=resource.pk)
     else:
@@ -289,18 +314,7 @@ def member_list(request):
         members = members.filter(member_type=member_type)
     
     # Overdue members list with full decrypted data for compliance reporting
-    overdue_members_qs = Member.objects.filter(
-        transactions__status='overdue'
-    ).distinct().select_related()
-    
-    # Build overdue dict with count for template
-    overdue_members = []
-    for member in overdue_members_qs:
-        overdue_count = member.transactions.filter(status='overdue').count()
-        overdue_members.append({
-            'member': member,
-            'overdue_count': overdue_count,
-        })
+    overdue_members = OverdueTracker.overdue_members()
 
     # Unregistered online users by hash for compliance tracking
     unregistered_users = AnonymousUser.objects.filter(is_active=True).order_by('-last_activity')
@@ -528,23 +542,14 @@ def checkout_create(request):
             due_days = form.cleaned_data['due_days']
             notes = form.cleaned_data.get('notes', '')
             
-            # Create transaction
-            due_date = timezone.now().date() + timedelta(days=due_days)
-            transaction = Transaction.objects.create(
-                resource=resource,
-                member=member,
-                due_date=due_date,
-                notes=notes
-            )
-            
-            # Update resource availability
-            resource.available_quantity -= 1
-            if resource.available_quantity == 0:
-                resource.status = 'unavailable'
-            resource.save()
-            
-            messages.success(request, f'Successfully checked out "{resource.title}" to Member {member.member_id}')
-            return redirect('transaction_list')
+            try:
+                with db_transaction.atomic():
+                    CirculationDesk.checkout(member, resource.id, due_days, notes)
+            except CirculationError as e:
+                form.add_error('resource', str(e))
+            else:
+                messages.success(request, f'Successfully checked out "{resource.title}" to Member {member.member_id}')
+                return redirect('transaction_list')
     else:
         form = CheckoutForm()
     
@@ -552,13 +557,26 @@ def checkout_create(request):
     return render(request, 'checkout_form.html', context)
 
 
+def resource_autocomplete(request):
+    """Available resources whose title or ISBN/Serial No starts with ?q=, as JSON"""
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'results': AutocompleteIndex.search_resources(query)})
+
+
+def member_autocomplete(request):
+    """Active members whose name or member ID starts with ?q=, as JSON"""
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'results': AutocompleteIndex.search_members(query)})
+
+
 def return_resource(request):
     """Return checked out resource"""
     if request.method == 'POST':
         transaction_id = request.POST.get('transaction_id')
         transaction = get_object_or_404(Transaction, pk=transaction_id, status='active')
         
-        transaction.mark_returned()
+        with db_transaction.atomic():
+            CirculationDesk.return_loan(transaction.id)
         
         messages.success(request, f'Resource returned: {transaction.resource.title}')
         return redirect('transaction_list')
@@ -569,6 +587,107 @@ def return_resource(request):
     return render(request, 'return_form.html', context)
 
 
+@require_http_methods(["POST"])
+def circulation_batch(request):
+    """
+    Batch checkout/return for the circulation desk.
+    Body: {"member": id, "checkout": [resource ids], "return": [transaction ids], "due_days": n}
+    Returns per-item results as JSON.
+    """
+    try:
+        payload = json.loads(request.body)
+        checkout_ids = [int(value) for value in payload.get('checkout', [])]
+        return_ids = [int(value) for value in payload.get('return', [])]
+        due_days = int(payload.get('due_days', CirculationDesk.DEFAULT_DUE_DAYS))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    if not 1 <= due_days <= CirculationDesk.MAX_DUE_DAYS:
+        return JsonResponse({'error': f'due_days must be between 1 and {CirculationDesk.MAX_DUE_DAYS}'}, status=400)
+    if len(checkout_ids) + len(return_ids) > CirculationDesk.MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {CirculationDesk.MAX_BATCH_SIZE} items per batch'}, status=400)
+
+    member = None
+    if checkout_ids:
+        try:
+            member = Member.objects.get(id=int(payload.get('member')), is_active=True)
+        except (Member.DoesNotExist, ValueError, TypeError):
+            return JsonResponse({'error': 'An active member is required for checkouts'}, status=400)
+
+    results = CirculationDesk.process_batch(member, checkout_ids, return_ids, due_days)
+    results['member'] = member.id if member else None
+    return JsonResponse(results)
+
+
+@require_http_methods(["POST"])
+def circulation_scan(request):
+    """
+    Scan endpoint for circulation desks.
+    Body: {"code": scanned code, "member": id of the member being served, "mode": "checkout"|"return"}
+    A member card returns the member; a resource code is lent to the member, or
+    taken back when no member is given (or mode is "return").
+    """
+    try:
+        payload = json.loads(request.body)
+        code = str(payload.get('code', ''))
+        member_id = payload.get('member')
+        member_id = int(member_id) if member_id not in (None, '') else None
+        mode = payload.get('mode') or ('checkout' if member_id else 'return')
+        due_days = int(payload.get('due_days', CirculationDesk.DEFAULT_DUE_DAYS))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    if mode not in ('checkout', 'return') or not 1 <= due_days <= CirculationDesk.MAX_DUE_DAYS:
+        return JsonResponse({'error': 'Invalid mode or due_days'}, status=400)
+
+    kind, pk = ScanLookup.resolve(code)
+    if kind is None:
+        return JsonResponse({'error': 'Unknown code', 'code': code}, status=404)
+
+    member = None
+    if kind == 'member' or member_id:
+        try:
+            member = Member.objects.get(id=pk if kind == 'member' else member_id, is_active=True)
+        except Member.DoesNotExist:
+            return JsonResponse({'error': 'Member not found or inactive'}, status=404)
+
+    if kind == 'member':
+        return JsonResponse({
+            'type': 'member',
+            'member': {
+                'id': member.id,
+                'member_id': member.member_id,
+                'name': member.full_name,
+                'open_loans': member.transactions.filter(status__in=CirculationDesk.OPEN_STATUSES).count(),
+            },
+        })
+
+    try:
+        with db_transaction.atomic():
+            if mode == 'checkout':
+                if member is None:
+                    raise CirculationError('Scan a member card before checking out.')
+                loan = CirculationDesk.checkout(member, pk, due_days)
+            else:
+                loan = CirculationDesk.open_loan_for(pk, member)
+                if loan is None:
+                    raise CirculationError('This resource has no open checkout.')
+                loan = CirculationDesk.return_loan(loan.id)
+    except CirculationError as e:
+        return JsonResponse({'type': 'resource', 'action': mode, 'ok': False, 'error': str(e)}, status=409)
+
+    return JsonResponse({
+        'type': 'resource',
+        'action': mode,
+        'ok': True,
+        'transaction': loan.id,
+        'resource': pk,
+        'title': loan.resource.title,
+        'member': loan.member_id,
+        'due_date': str(loan.due_date),
+    })
+
+
 def transaction_list(request):
     """List all transactions"""
     transactions = Transaction.objects.select_related('resource', 'member').all()
@@ -1,8 +1,23 @@
 """
-ASGI config for cars project.
+ASGI config for vp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The file-serving and browse views (download, PDF/EPUB readers and EPUB items,
+browse) are async: under ASGI a download waiting on disk or storage holds no
+worker thread. Deployment profile:
+
+    uvicorn vp.asgi:application --host 0.0.0.0 --port 8000 \
+        --workers 4 --lifespan off --timeout-keep-alive 5
+
+- One worker per CPU core; each serves many concurrent downloads. Sync views
+  run in each worker's thread pool (ASGI_THREADS, default: CPU count + 4).
+- Set CACHE_BACKEND=redis so sessions, catalog caches and rankings are shared.
+- Keep CONN_MAX_AGE at 0: async requests do not reuse persistent connections.
+- Serve /static/ and /media/ from the front proxy where possible.
+
+Compare with WSGI using ``python manage.py bench_downloads``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -11,6 +26,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cars.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vp.settings')
 
 application = get_asgi_application()
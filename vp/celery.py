@@ -23,6 +23,47 @@ app.conf.beat_schedule = {
         'task': 'models.tasks.cleanup_expired_bans',
         'schedule': 86400.0,  # 24 hours
     },
+    'index-book-contents-every-5-minutes': {
+        'task': 'models.tasks.index_book_contents',
+        'schedule': 300.0,  # 5 minutes
+    },
+    'generate-label-sheets-every-minute': {
+        'task': 'models.tasks.generate_label_sheets',
+        'schedule': 60.0,  # 1 minute
+    },
+    'accrue-fines-every-day': {
+        'task': 'models.tasks.accrue_fines',
+        'schedule': 86400.0,  # 24 hours
+    },
+    'snapshot-inventory-daily': {
+        'task': 'models.tasks.snapshot_inventory',
+        'schedule': 86400.0,  # 24 hours
+    },
+    'refresh-recommendations-every-hour': {
+        'task': 'models.tasks.refresh_recommendations',
+        'schedule': 3600.0,  # 1 hour
+    },
+    'rebuild-recommendations-every-day': {
+        'task': 'models.tasks.refresh_recommendations',
+        'schedule': 86400.0,  # 24 hours
+        'kwargs': {'full': True},
+    },
+    'update-trending-every-hour': {
+        'task': 'models.tasks.update_trending',
+        'schedule': 3600.0,  # 1 hour
+    },
+    'rollup-analytics-every-day': {
+        'task': 'models.tasks.rollup_analytics',
+        'schedule': 86400.0,  # 24 hours
+    },
+    'screen-uploads-every-minute': {
+        'task': 'models.tasks.screen_uploads',
+        'schedule': 60.0,  # 1 minute
+    },
+    'tier-user-books-every-day': {
+        'task': 'models.tasks.tier_user_books',
+        'schedule': 86400.0,  # 24 hours
+    },
 }
 
 @app.task(bind=True)
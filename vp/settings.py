@@ -23,7 +23,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get('SECRET_KEY')
+
+# Fernet keys for user authentication data. ENCRYPTION_KEY encrypts new data;
+# ENCRYPTION_OLD_KEYS (comma separated) and the SECRET_KEY derived key only decrypt.
+# Each must be a Fernet key (Fernet.generate_key()); anything else fails the system checks.
 ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY')
+ENCRYPTION_OLD_KEYS = [key for key in os.environ.get('ENCRYPTION_OLD_KEYS', '').split(',') if key]
+
+# Key for the indexed identity hashes that find library-ID and credential logins.
+# Defaults to SECRET_KEY; set it so changing SECRET_KEY cannot orphan accounts.
+# Hashes under IDENTITY_HASH_OLD_KEYS (comma separated) keep matching until key rotation rewrites them.
+IDENTITY_HASH_KEY = os.environ.get('IDENTITY_HASH_KEY')
+IDENTITY_HASH_OLD_KEYS = [key for key in os.environ.get('IDENTITY_HASH_OLD_KEYS', '').split(',') if key]
+
+# PBKDF2 work factor for user password verifiers.
+# Calibrate with: python manage.py bench_password_hashing
+USER_PASSWORD_ITERATIONS = int(os.environ.get('USER_PASSWORD_ITERATIONS', 600000))
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -89,6 +104,68 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# CACHE_BACKEND selects 'locmem' (per process, default), 'file' or 'redis'.
+# Use 'redis' when running several workers so invalidations reach all of them.
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-catalog',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Seconds that rendered public catalog fragments (home, browse) stay cached
+CATALOG_CACHE_TIMEOUT = 300
+
+# Seconds before the cached resource availability bitmap is rebuilt from the database
+RESOURCE_AVAILABILITY_TIMEOUT = 3600
+
+# Seconds a scanned resource/member code stays cached by the circulation scan endpoint
+SCAN_LOOKUP_TIMEOUT = 3600
+
+# Anonymous sessions live only in the cache; sessions holding one of
+# SESSION_PERSISTENT_KEYS (a login) are also written to django_session.
+# Use CACHE_BACKEND='redis' with several workers so anonymous sessions are shared.
+SESSION_ENGINE = 'models.session_backend'
+SESSION_PERSISTENT_KEYS = ('user_auth_id', 'is_custom_admin', '_auth_user_id')  # last: django.contrib.auth staff login
+
+# Seconds between last_activity updates of an anonymous visitor
+ANONYMOUS_ACTIVITY_INTERVAL = 300
+
+# Login rate limits as (burst capacity, tokens refilled per minute). One bucket per
+# client address is shared by every login method; 'identity' buckets are per method
+# and submitted username/ID/phone.
+LOGIN_IP_RATE_LIMIT = (20, 10)
+LOGIN_RATE_LIMITS = {
+    'default': {'identity': (5, 2)},
+    'library_id': {'identity': (5, 2)},
+    'student_id': {'identity': (5, 2)},
+    'username': {'identity': (5, 2)},
+    'credentials': {'identity': (5, 1)},
+    'admin': {'identity': (5, 1)},
+}
+
+# Reverse proxies in front of the app that append to X-Forwarded-For.
+# 0 uses REMOTE_ADDR only, since clients can send any X-Forwarded-For they like.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -130,6 +207,27 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Archive tier for rarely read user books; any storage backend works,
+    # e.g. an S3-compatible bucket through django-storages
+    'user_books_archive': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('USER_BOOKS_ARCHIVE_ROOT', BASE_DIR / 'archive')},
+    },
+}
+
+# Uploaded book quotas (MB) and the tiering policy
+USER_BOOKS_USER_QUOTA_MB = int(os.environ.get('USER_BOOKS_USER_QUOTA_MB', 500))
+USER_BOOKS_TOTAL_QUOTA_MB = int(os.environ.get('USER_BOOKS_TOTAL_QUOTA_MB', 50 * 1024))
+USER_BOOKS_COLD_AFTER_DAYS = int(os.environ.get('USER_BOOKS_COLD_AFTER_DAYS', 60))
+USER_BOOKS_COLD_MAX_READS = int(os.environ.get('USER_BOOKS_COLD_MAX_READS', 2))
+
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL','redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
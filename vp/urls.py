@@ -20,9 +20,11 @@ urlpatterns = [
     
     # Book browsing & reading
     path('user/books/', user_views.user_browse_books, name='user_browse_books'),
+    path('user/books/search/', user_views.user_search_book_contents, name='user_search_book_contents'),
     path('user/books/<int:book_id>/', user_views.user_book_detail, name='user_book_detail'),
     path('user/books/<int:book_id>/read-pdf/', user_views.user_read_book_pdf, name='user_read_pdf'),
     path('user/books/<int:book_id>/read-epub/', user_views.user_read_book_epub, name='user_read_epub'),
+    path('user/books/<int:book_id>/read-epub/items/<path:item_path>', user_views.user_read_epub_item, name='user_read_epub_item'),
     path('user/books/<int:book_id>/download/', user_views.user_download_book, name='user_download_book'),
     path('user/resources/<int:resource_id>/', user_views.user_resource_detail, name='user_resource_detail'),
     
@@ -44,12 +46,16 @@ urlpatterns = [
     path('admin/login/', admin_views.admin_login, name='admin_login_alt'),
     path('admin/logout/', admin_views.admin_logout, name='admin_logout'),
     path('admin/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
+    path('admin/login-rate-limits/', admin_views.admin_login_rate_limits, name='admin_login_rate_limits'),
     
     # Digital book management
     path('admin/user-books/', admin_views.admin_user_books, name='admin_user_books'),
     path('admin/user-books/<int:book_id>/verify/', admin_views.admin_verify_book, name='admin_verify_book'),
     path('admin/user-books/<int:book_id>/ban/', admin_views.admin_ban_book, name='admin_ban_book'),
     path('admin/user-books/<int:book_id>/delete/', admin_views.admin_delete_book, name='admin_delete_book'),
+    path('admin/moderation/', admin_views.admin_moderation_queue, name='admin_moderation_queue'),
+    path('admin/moderation/claim/', admin_views.admin_moderation_claim, name='admin_moderation_claim'),
+    path('admin/moderation/action/', admin_views.admin_moderation_action, name='admin_moderation_action'),
     
     # User management & banning
     path('admin/users/', admin_views.admin_manage_users, name='admin_manage_users'),
@@ -69,6 +75,17 @@ urlpatterns = [
     # Checkout tracking
     path('admin/checkouts/', admin_views.admin_checkout_tracking, name='admin_checkout_tracking'),
     path('admin/checkouts/manual/', admin_views.admin_manual_checkout, name='admin_manual_checkout'),
+
+    # Resource labels
+    path('admin/labels/', admin_views.admin_label_sheet_create, name='admin_label_sheet_create'),
+    path('admin/labels/<int:job_id>/', admin_views.admin_label_sheet_status, name='admin_label_sheet_status'),
+    path('admin/labels/<int:job_id>/download/', admin_views.admin_label_sheet_download, name='admin_label_sheet_download'),
+
+    # Reports
+    path('admin/reports/circulation/', admin_views.admin_analytics_report, name='admin_analytics_report'),
+
+    # Live dashboard events
+    path('admin/live/', admin_views.admin_live_events, name='admin_live_events'),
     
     # ========== OLD ADMIN SIDE (LIBRARY MANAGEMENT) - REDIRECT TO ADMIN LOGIN ==========
     # Resources
@@ -94,7 +111,11 @@ urlpatterns = [
     
     # Transactions
     path('checkout/', views.checkout_create, name='checkout_create'),
+    path('checkout/autocomplete/resources/', views.resource_autocomplete, name='resource_autocomplete'),
+    path('checkout/autocomplete/members/', views.member_autocomplete, name='member_autocomplete'),
     path('return/', views.return_resource, name='return_resource'),
+    path('circulation/batch/', views.circulation_batch, name='circulation_batch'),
+    path('circulation/scan/', views.circulation_scan, name='circulation_scan'),
     path('transactions/', views.transaction_list, name='transaction_list'),
 
     # User uploaded book management in legacy resources